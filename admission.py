@@ -0,0 +1,103 @@
+"""Memory-aware admission control for image processing.
+
+Uploads, reprocessing and any other renders reserve their estimated pixel
+memory against one process-wide budget before decoding. Jobs that do not fit
+wait in FIFO order; callers that cannot wait long (uploads) give up after a
+timeout so the request can be answered with 503 + Retry-After instead of the
+frame being OOM-killed.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+
+BUDGET_BYTES = int(os.environ.get('INKFRAME_PROCESSING_BUDGET_MB', 160)) * 1024 * 1024
+QUEUE_TIMEOUT = float(os.environ.get('INKFRAME_ADMISSION_TIMEOUT', 20))  # seconds an upload may wait
+RETRY_AFTER = 15  # seconds suggested to clients turned away
+
+_cond = threading.Condition()
+_reserved = 0         # bytes held by running jobs
+_active = 0           # running jobs
+_queue = deque()      # tickets of waiting jobs, admitted strictly in order
+_tickets = itertools.count()
+
+
+class Busy(Exception):
+    """Raised when a job could not be admitted within its timeout."""
+
+    def __init__(self, retry_after=RETRY_AFTER):
+        super().__init__(f"Image processing is busy, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _fits(cost):
+    # A job larger than the whole budget still runs, but only on its own
+    return _active == 0 or _reserved + cost <= BUDGET_BYTES
+
+
+def _publish():
+    metrics.set_gauge("inkframe_processing_reserved_bytes", _reserved)
+    metrics.set_gauge("inkframe_processing_queued", len(_queue))
+
+
+def acquire(cost, timeout=None):
+    """
+    Reserve `cost` bytes of the processing budget, waiting up to `timeout`
+    seconds (forever if None). Returns True once admitted, False on timeout.
+    """
+    global _reserved, _active
+    deadline = None if timeout is None else time.monotonic() + timeout
+    ticket = next(_tickets)
+    with _cond:
+        _queue.append(ticket)
+        _publish()
+        try:
+            while _queue[0] != ticket or not _fits(cost):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                _cond.wait(remaining)
+            _reserved += cost
+            _active += 1
+            return True
+        finally:
+            _queue.remove(ticket)
+            _publish()
+            _cond.notify_all()  # the next ticket may now be at the head
+
+
+def release(cost):
+    """Return a reservation made by acquire()."""
+    global _reserved, _active
+    with _cond:
+        _reserved -= cost
+        _active -= 1
+        _publish()
+        _cond.notify_all()
+
+
+@contextmanager
+def reserve(cost, timeout=None):
+    """Hold `cost` bytes for the enclosed block. Raises Busy on timeout."""
+    if not acquire(cost, timeout):
+        raise Busy()
+    try:
+        yield
+    finally:
+        release(cost)
+
+
+def get_status():
+    """Snapshot of the budget for /api/status."""
+    with _cond:
+        return {
+            'budget_bytes': BUDGET_BYTES,
+            'reserved_bytes': _reserved,
+            'active': _active,
+            'queued': len(_queue),
+        }
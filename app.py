@@ -6,25 +6,43 @@ Flask web app with drag-drop upload, gallery management, and e-ink display contr
 
 import os
 import sys
+import json
 import time
 import logging
 import threading
 import signal
+import socket
 import secrets
+import sqlite3
+import tempfile
 from pathlib import Path
 
 from flask import (
-    Flask, render_template, request, redirect, url_for,
-    jsonify, send_from_directory
+    Flask, Response, abort, g, render_template, request, redirect, url_for,
+    jsonify, send_from_directory, stream_with_context
 )
+from werkzeug.datastructures import FileStorage
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
 
 sys.path.insert(0, str(Path(__file__).parent))
 
+import admission
+import background
+import chunked_upload
 import models
 import display
+import display_cache
+import dither
 import image_processor
+import originals
+import renders
 import wifi_manager
 import scheduler
+import thumbnails
+import tonemap
+import metrics
+import phash
 
 try:
     import lgpio
@@ -35,12 +53,44 @@ except ImportError:
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY') or secrets.token_hex(32)
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 3600  # /static: revalidate hourly
+
+# Production server (waitress): a fixed worker pool instead of the dev
+# server's thread-per-connection. Connections beyond CONNECTION_LIMIT wait in
+# the listen backlog rather than spawning threads. Overridable from the unit.
+SERVER_PORT = int(os.environ.get('INKFRAME_PORT', 80))
+SERVER_THREADS = int(os.environ.get('INKFRAME_THREADS', 4))
+SERVER_CONNECTION_LIMIT = int(os.environ.get('INKFRAME_CONNECTION_LIMIT', 32))
+SERVER_BACKLOG = int(os.environ.get('INKFRAME_BACKLOG', 64))
+SERVER_CHANNEL_TIMEOUT = 60  # seconds an idle keep-alive connection is held
+THUMBNAIL_MAX_AGE = 7 * 24 * 3600  # thumbnails are named by upload, rarely change
+# Bounds for in-browser downscaling before upload; below the minimum smart
+# crop and vertical reprocessing would lose detail
+RESIZE_MIN_EDGE = 800
+RESIZE_MAX_EDGE = 8000
+SD_LISTEN_FDS_START = 3
+# Requests that don't pause background maintenance: progress polling and assets
+BACKGROUND_QUIET_ENDPOINTS = {'static', 'api_status', 'api_metrics', 'reprocess_status',
+                              'compaction_report'}
 
 
 @app.teardown_appcontext
 def teardown_db(exception):
     models.close_db()
 
+
+@app.before_request
+def pause_background_work():
+    if request.endpoint not in BACKGROUND_QUIET_ENDPOINTS:
+        g.foreground = True
+        background.begin()
+
+
+@app.teardown_request
+def resume_background_work(exception):
+    if g.pop('foreground', False):
+        background.end()
+
 # Button GPIO pins (active LOW with pull-up)
 BUTTON_A = 5   # Info screen
 BUTTON_B = 6   # Previous photo
@@ -244,6 +294,41 @@ def _after_wifi_connected():
 
 # --- Photo API ---
 
+def _upload_options(settings):
+    """process_upload keyword arguments from the current settings"""
+    display_settings = settings.get('display', {})
+    return {
+        'fit_mode': display_settings.get('fit_mode', 'contain'),
+        'crop_mode': display_settings.get('crop_mode', 'center'),
+        'orientation': display_settings.get('orientation', 'horizontal'),
+        'cache_format': display_settings.get('cache_format', display_cache.DEFAULT_FORMAT),
+        'find_duplicate': models.get_photo_id_by_hash,
+        'admission_timeout': admission.QUEUE_TIMEOUT,
+        'retention': settings.get('originals'),
+        'tone': tonemap.from_settings(display_settings),
+    }
+
+
+def _check_upload(file, max_size):
+    """Reject oversized or disallowed files. Returns (error, status) or None."""
+    file.seek(0, 2)
+    size = file.tell()
+    file.seek(0)
+    if size > max_size:
+        return 'File too large', 413
+    if not image_processor.is_allowed_file(file.filename):
+        return 'File type not allowed', 400
+    return None
+
+
+def _photo_summary(photo_id, result):
+    return {
+        'id': photo_id,
+        'filename': result['filename'],
+        'thumbnail_url': url_for('serve_thumbnail', filename=Path(result['thumbnail_path']).name)
+    }
+
+
 @app.route('/api/photos/upload', methods=['POST'])
 def upload_photo():
     """Upload a photo (multipart form data)"""
@@ -256,49 +341,307 @@ def upload_photo():
 
     settings = models.load_settings()
     max_size = settings.get('upload', {}).get('max_file_size_mb', 20) * 1024 * 1024
-    fit_mode = settings.get('display', {}).get('fit_mode', 'contain')
-    crop_mode = settings.get('display', {}).get('crop_mode', 'center')
-    orientation = settings.get('display', {}).get('orientation', 'horizontal')
 
-    # Check file size
-    file.seek(0, 2)
-    size = file.tell()
-    file.seek(0)
-    if size > max_size:
-        return jsonify({'success': False, 'error': 'File too large'}), 413
+    rejected = _check_upload(file, max_size)
+    if rejected:
+        error, status = rejected
+        return jsonify({'success': False, 'error': error}), status
+
+    return _store_upload(file, settings)
 
-    if not image_processor.is_allowed_file(file.filename):
-        return jsonify({'success': False, 'error': 'File type not allowed'}), 400
 
-    result = image_processor.process_upload(file, fit_mode, crop_mode=crop_mode,
-                                            orientation=orientation)
+def _store_upload(file, settings):
+    """Process a validated upload and add it to the library. Returns the JSON response."""
+    try:
+        result = image_processor.process_upload(file, **_upload_options(settings))
+    except admission.Busy as e:
+        resp = jsonify({'success': False, 'error': 'Frame is busy processing photos, try again shortly'})
+        resp.headers['Retry-After'] = str(e.retry_after)
+        return resp, 503
     if not result:
         return jsonify({'success': False, 'error': 'Failed to process image'}), 500
+    if 'duplicate_of' in result:
+        return _duplicate_response(result['duplicate_of'])
 
-    photo_id = models.add_photo(
-        filename=result['filename'],
-        original_path=result['original_path'],
-        display_path=result['display_path'],
-        thumbnail_path=result['thumbnail_path'],
-        width=result['width'],
-        height=result['height'],
-        file_size=result['file_size'],
-        mime_type=result['mime_type'],
-        date_taken=result['date_taken']
-    )
+    try:
+        photo_id = models.add_photo(
+            filename=result['filename'],
+            original_path=result['original_path'],
+            display_path=result['display_path'],
+            thumbnail_path=result['thumbnail_path'],
+            width=result['width'],
+            height=result['height'],
+            file_size=result['file_size'],
+            mime_type=result['mime_type'],
+            date_taken=result['date_taken'],
+            content_hash=result['content_hash'],
+            phash=result['phash']
+        )
+    except sqlite3.IntegrityError:
+        # Same photo uploaded concurrently; the other request won the insert
+        image_processor.delete_photo_files(result)
+        return _duplicate_response(models.get_photo_id_by_hash(result['content_hash']))
+    phash.index_photo(photo_id, result['display_path'], result['phash'])
 
     # Auto-start slideshow if first photo and auto_start enabled
     if models.get_photo_count() == 1:
         if settings.get('slideshow', {}).get('auto_start', True):
             scheduler.start_slideshow()
 
+    return jsonify({'success': True, 'photo': _photo_summary(photo_id, result)})
+
+
+def _duplicate_response(photo_id):
+    """Upload response pointing at the already-stored copy of a photo"""
+    photo = models.get_photo(photo_id)
+    if not photo:
+        return jsonify({'success': False, 'error': 'Failed to process image'}), 500
+    return jsonify({'success': True, 'duplicate': True,
+                    'photo': _photo_summary(photo['id'], photo)})
+
+
+@app.route('/api/uploads', methods=['POST'])
+def start_chunked_upload():
+    """Start a resumable upload: {"filename": ..., "size": bytes} -> session with upload_id"""
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename') or ''
+    try:
+        size = int(data.get('size', -1))
+    except (TypeError, ValueError):
+        size = -1
+    if not filename or size <= 0:
+        return jsonify({'success': False, 'error': 'filename and size are required'}), 400
+    if not image_processor.is_allowed_file(filename):
+        return jsonify({'success': False, 'error': 'File type not allowed'}), 400
+    max_size = models.load_settings().get('upload', {}).get('max_file_size_mb', 20) * 1024 * 1024
+    if size > max_size:
+        return jsonify({'success': False, 'error': 'File too large'}), 413
+
+    chunked_upload.collect_stale()
+    return jsonify({'success': True, **chunked_upload.start(filename, size)})
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """Bytes received so far; clients resume from 'offset' after a dropped connection"""
+    session = chunked_upload.get(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown upload'}), 404
+    return jsonify({'success': True, **session})
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_chunk(upload_id):
+    """Append the raw request body at ?offset=N"""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'error': 'offset is required'}), 400
+    try:
+        session = chunked_upload.append(upload_id, offset, request.stream)
+    except chunked_upload.OffsetMismatch as e:
+        return jsonify({'success': False, 'error': 'Offset mismatch', 'offset': e.offset}), 409
+    except ValueError as e:
+        chunked_upload.discard(upload_id)
+        return jsonify({'success': False, 'error': str(e)}), 413
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown upload'}), 404
+    return jsonify({'success': True, **session})
+
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """Process the assembled file exactly like a single-request upload"""
+    session = chunked_upload.get(upload_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown upload'}), 404
+    path = chunked_upload.completed_path(upload_id)
+    if path is None:
+        return jsonify({'success': False, 'error': 'Upload incomplete',
+                        'offset': session['offset']}), 409
+
+    with open(path, 'rb') as f:
+        resp = _store_upload(FileStorage(f, filename=session['filename']), models.load_settings())
+    status = resp[1] if isinstance(resp, tuple) else 200
+    if status != 503:  # keep the data so a busy frame can be asked again
+        chunked_upload.discard(upload_id)
+    return resp
+
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_chunked_upload(upload_id):
+    """Abandon a resumable upload"""
+    chunked_upload.discard(upload_id)
+    return jsonify({'success': True})
+
+
+@app.route('/api/photos/upload-batch', methods=['POST'])
+def upload_batch():
+    """
+    Upload many photos in one multipart request (repeated "files" field).
+
+    Responds with NDJSON: one line per file as soon as it is processed
+    (status processed / duplicate / busy / error), then a summary line once
+    every new photo is stored in a single transaction.
+    """
+    mimetype, options = parse_options_header(request.content_type or '')
+    if mimetype != 'multipart/form-data' or not options.get('boundary'):
+        return jsonify({'success': False, 'error': 'Expected multipart/form-data'}), 400
+    # Parse the body ourselves: each file is processed as soon as it has
+    # arrived, and only one is spooled at a time
+    files = _stream_uploaded_files(request.stream, options['boundary'], field='files')
+    return Response(stream_with_context(_batch_upload_lines(files, models.load_settings())),
+                    mimetype='application/x-ndjson')
+
+
+def _stream_uploaded_files(stream, boundary, field, chunk_size=64 * 1024):
+    """Yield FileStorage objects for `field` from a multipart body, one at a time"""
+    decoder = MultipartDecoder(boundary.encode())
+    current = None
+    while True:
+        event = decoder.next_event()
+        if isinstance(event, NeedData):
+            if decoder.complete:
+                break  # truncated body
+            decoder.receive_data(stream.read(chunk_size) or None)
+        elif isinstance(event, File) and event.name == field and event.filename:
+            current = FileStorage(tempfile.SpooledTemporaryFile(max_size=1024 * 1024),
+                                  filename=event.filename, name=field)
+        elif isinstance(event, Data) and current is not None:
+            current.stream.write(event.data)
+            if not event.more_data:
+                current.stream.seek(0)
+                try:
+                    yield current
+                finally:
+                    current.stream.close()
+                    current = None
+        elif isinstance(event, Epilogue):
+            break
+
+
+def _process_batch_file(file, max_size, options, batch_hashes):
+    """Process one file of a batch. Returns (status fields, result to store or None)."""
+    rejected = _check_upload(file, max_size)
+    if rejected:
+        return {'status': 'error', 'error': rejected[0]}, None
+    try:
+        result = image_processor.process_upload(file, **options)
+    except admission.Busy as e:
+        return {'status': 'busy', 'retry_after': e.retry_after}, None
+    if not result:
+        return {'status': 'error', 'error': 'Failed to process image'}, None
+    if 'duplicate_of' in result:
+        photo = models.get_photo(result['duplicate_of'])
+        if not photo:
+            # Deleted while this batch was uploading
+            return {'status': 'error', 'error': 'Failed to process image'}, None
+        return {'status': 'duplicate', 'photo': _photo_summary(photo['id'], photo)}, None
+    if result['content_hash'] in batch_hashes:
+        # Same photo twice in one batch; keep the first copy
+        image_processor.delete_photo_files(result)
+        return {'status': 'duplicate'}, None
+    batch_hashes.add(result['content_hash'])
+    return {'status': 'processed'}, result
+
+
+def _batch_upload_lines(files, settings):
+    max_size = settings.get('upload', {}).get('max_file_size_mb', 20) * 1024 * 1024
+    options = _upload_options(settings)
+    had_photos = models.get_photo_count() > 0
+    processed = []        # (index, result) waiting to be inserted
+    batch_hashes = set()  # catches the same photo selected twice
+    stored = []           # (index, photo_id, result)
+
+    try:
+        for index, file in enumerate(files):
+            fields, result = _process_batch_file(file, max_size, options, batch_hashes)
+            if result:
+                processed.append((index, result))
+            yield json.dumps(dict(fields, index=index, filename=file.filename)) + "\n"
+    finally:
+        # Store whatever was processed, even if the client went away mid-batch
+        if processed:
+            ids = models.add_photos([result for _, result in processed])
+            for (index, result), photo_id in zip(processed, ids):
+                if photo_id is None:
+                    # Uploaded concurrently by another request
+                    image_processor.delete_photo_files(result)
+                    continue
+                phash.index_photo(photo_id, result['display_path'], result['phash'])
+                stored.append((index, photo_id, result))
+
+            if not had_photos and stored and settings.get('slideshow', {}).get('auto_start', True):
+                scheduler.start_slideshow()
+
+    yield json.dumps({
+        'done': True,
+        'added': len(stored),
+        'photos': [dict(_photo_summary(photo_id, result), index=index)
+                   for index, photo_id, result in stored],
+    }) + "\n"
+
+
+@app.route('/api/photos/duplicates', methods=['GET'])
+def list_duplicates():
+    """Duplicates found by the startup content-hash backfill"""
+    report = image_processor.get_hash_backfill_report()
+    if report is None:
+        return jsonify({'complete': False, 'duplicates': []})
+    return jsonify({'complete': True, **report})
+
+
+@app.route('/api/originals/compact', methods=['POST'])
+def compact_originals():
+    """Apply the "master" retention policy to existing originals in the background"""
+    retention = models.load_settings().get('originals', {})
+    if not originals.wants_master(retention):
+        return jsonify({'success': False, 'error': 'Retention policy keeps full originals'}), 400
+    background.start(image_processor.compact_originals, retention)
+    return jsonify({'success': True}), 202
+
+
+@app.route('/api/originals/compact', methods=['GET'])
+def compaction_report():
+    """Result of the last originals compaction (space saved)"""
+    report = image_processor.get_compaction_report()
+    if report is None:
+        return jsonify({'complete': False})
+    return jsonify({'complete': True, **report})
+
+
+@app.route('/api/reprocess', methods=['GET'])
+def reprocess_status():
+    """Progress, throughput and ETA of the running (or last) display re-render"""
+    return jsonify(image_processor.get_reprocess_status())
+
+
+@app.route('/api/reprocess/cancel', methods=['POST'])
+def cancel_reprocess():
+    """Stop the running re-render after the current photo"""
+    if not image_processor.cancel_reprocess():
+        return jsonify({'success': False, 'error': 'No reprocess running'}), 409
+    return jsonify({'success': True})
+
+
+@app.route('/api/reprocess/prioritize/<int:photo_id>', methods=['POST'])
+def prioritize_reprocess(photo_id):
+    """Re-render a photo next if the running reprocess hasn't reached it yet"""
+    photo = models.get_photo(photo_id)
+    if not photo:
+        return jsonify({'success': False, 'error': 'Photo not found'}), 404
+    return jsonify({'success': True,
+                    'bumped': image_processor.prioritize_reprocess(photo['display_path'])})
+
+
+@app.route('/api/photos/near-duplicates', methods=['GET'])
+def list_near_duplicates():
+    """Clusters of visually near-identical photos (burst shots, resends)"""
+    distance = request.args.get('distance', phash.NEAR_DUPLICATE_DISTANCE, type=int)
+    distance = max(0, min(distance, 32))
+    clusters = phash.get_clusters(distance)
     return jsonify({
-        'success': True,
-        'photo': {
-            'id': photo_id,
-            'filename': result['filename'],
-            'thumbnail_url': url_for('serve_thumbnail', filename=Path(result['thumbnail_path']).name)
-        }
+        'distance': distance,
+        'clusters': [[p['id'] for p in cluster] for cluster in clusters],
     })
 
 
@@ -325,6 +668,7 @@ def delete_photo(photo_id):
         return jsonify({'success': False, 'error': 'Photo not found'}), 404
 
     image_processor.delete_photo_files(photo)
+    phash.invalidate()
     return jsonify({'success': True})
 
 
@@ -338,14 +682,26 @@ def delete_photos_bulk():
     photos = models.delete_photos_bulk(data['ids'])
     for photo in photos:
         image_processor.delete_photo_files(photo)
+    phash.invalidate()
 
     return jsonify({'success': True, 'deleted': len(photos)})
 
 
 @app.route('/thumbnails/<filename>')
 def serve_thumbnail(filename):
-    """Serve a thumbnail image"""
-    return send_from_directory(str(image_processor.THUMBNAILS_DIR), filename)
+    """Serve a thumbnail image, rendering it first if it isn't cached"""
+    try:
+        found = image_processor.get_thumbnail(filename)
+    except admission.Busy as e:
+        # Don't hold a server thread while a reprocess or upload has the memory
+        resp = app.response_class("Frame is busy processing photos", status=503,
+                                  mimetype='text/plain')
+        resp.headers['Retry-After'] = str(e.retry_after)
+        return resp
+    if found is None:
+        abort(404)
+    return send_from_directory(str(image_processor.THUMBNAILS_DIR), filename,
+                               max_age=THUMBNAIL_MAX_AGE)
 
 
 # --- Display API ---
@@ -419,7 +775,8 @@ def update_settings():
 
     if 'display' in data:
         updates['display'] = {}
-        for key in ['orientation', 'fit_mode', 'saturation', 'crop_mode']:
+        for key in ['orientation', 'fit_mode', 'saturation', 'crop_mode', 'cache_format', 'dither',
+                    *tonemap.PARAMS]:
             if key in data['display']:
                 val = data['display'][key]
                 if key == 'saturation':
@@ -430,25 +787,64 @@ def update_settings():
                 elif key == 'orientation':
                     if val not in ('horizontal', 'vertical'):
                         continue
+                elif key == 'cache_format':
+                    if val not in display_cache.FORMATS:
+                        continue
+                elif key == 'dither':
+                    if val not in dither.ALGORITHMS + ('driver',):
+                        continue
+                elif key in tonemap.PARAMS:
+                    val = tonemap.clamp(key, val)
                 updates['display'][key] = val
 
     if 'slideshow' in data:
         updates['slideshow'] = {}
-        for key in ['order', 'interval_minutes', 'enabled']:
+        for key in ['order', 'interval_minutes', 'enabled', 'one_per_cluster', 'align_to_clock']:
             if key in data['slideshow']:
                 val = data['slideshow'][key]
                 if key == 'interval_minutes':
                     val = int(val)
-                elif key == 'enabled':
+                elif key in ('enabled', 'one_per_cluster', 'align_to_clock'):
                     val = bool(val)
                 updates['slideshow'][key] = val
 
+    if 'originals' in data:
+        updates['originals'] = {}
+        for key in ['retention', 'max_edge', 'offload_dir']:
+            if key in data['originals']:
+                val = data['originals'][key]
+                if key == 'retention':
+                    if val not in originals.POLICIES:
+                        continue
+                elif key == 'max_edge':
+                    val = max(originals.MIN_MAX_EDGE, min(originals.MAX_MAX_EDGE, int(val)))
+                elif key == 'offload_dir':
+                    val = str(val).strip()
+                    if val and not os.path.isabs(val):
+                        return jsonify({'success': False,
+                                        'error': 'Offload directory must be an absolute path'}), 400
+                updates['originals'][key] = val
+
+    if 'upload' in data:
+        updates['upload'] = {}
+        for key in ['resize_in_browser', 'resize_max_edge']:
+            if key in data['upload']:
+                val = data['upload'][key]
+                if key == 'resize_in_browser':
+                    val = bool(val)
+                elif key == 'resize_max_edge':
+                    val = max(RESIZE_MIN_EDGE, min(RESIZE_MAX_EDGE, int(val)))
+                updates['upload'][key] = val
+
     if updates:
         old_display = models.load_settings().get('display', {})
         settings = models.update_settings(updates)
 
-        # Restart slideshow if interval changed while running
-        if 'slideshow' in updates and 'interval_minutes' in updates['slideshow']:
+        if 'dither' in updates.get('display', {}):
+            display.set_dither_algorithm(updates['display']['dither'])
+
+        # Restart slideshow if its timing changed while running
+        if 'slideshow' in updates and ({'interval_minutes', 'align_to_clock'} & set(updates['slideshow'])):
             if scheduler.is_slideshow_running():
                 scheduler.start_slideshow()
 
@@ -458,16 +854,15 @@ def update_settings():
             new_fit = display_settings.get('fit_mode', 'contain')
             new_crop = display_settings.get('crop_mode', 'center')
             new_orientation = display_settings.get('orientation', 'horizontal')
-            if image_processor.reprocess_needed(old_display, new_fit, new_crop, new_orientation):
-                threading.Thread(
-                    target=image_processor.reprocess_display_images,
-                    kwargs={
-                        'fit_mode': new_fit,
-                        'crop_mode': new_crop,
-                        'orientation': new_orientation,
-                    },
-                    daemon=True
-                ).start()
+            new_format = display_settings.get('cache_format', display_cache.DEFAULT_FORMAT)
+            new_tone = tonemap.from_settings(display_settings)
+            if image_processor.reprocess_needed(old_display, new_fit, new_crop, new_orientation,
+                                                new_tone) or \
+                    image_processor.migration_needed(old_display, new_format):
+                # Debounced: a burst of changes renders (or, for the storage
+                # format alone, converts) only the last one
+                image_processor.request_reprocess(new_fit, new_crop, new_orientation, new_format,
+                                                  tone=new_tone)
 
     return jsonify({'success': True, 'settings': models.load_settings()})
 
@@ -491,10 +886,24 @@ def api_status():
             'count': models.get_photo_count()
         },
         'display': settings.get('display', {}),
-        'display_busy': display.is_busy()
+        'display_busy': display.is_busy(),
+        'processing': admission.get_status(),
+        'thumbnails': thumbnails.get_status(),
+        'renders': renders.get_status(),
+        'reprocess': image_processor.get_reprocess_status(),
+        'background': background.get_status()
     })
 
 
+@app.route('/api/metrics')
+def api_metrics():
+    """Timing, counter and histogram metrics in Prometheus text format"""
+    metrics.set_gauge("inkframe_display_busy", 1 if display.is_busy() else 0)
+    metrics.set_gauge("inkframe_slideshow_running", 1 if scheduler.is_slideshow_running() else 0)
+    return Response(metrics.render_prometheus(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 # --- Captive Portal ---
 
 @app.route('/hotspot-detect')
@@ -531,16 +940,13 @@ def signal_handler(signum, frame):
     sys.exit(0)
 
 
-def main():
-    logging.basicConfig(level=logging.INFO, format='%(name)s: %(message)s')
-    models.init_db()
-    image_processor.ensure_dirs()
-    signal.signal(signal.SIGTERM, signal_handler)
-    signal.signal(signal.SIGINT, signal_handler)
-    setup_buttons()
-
+def _startup_sequence():
+    """Bring up buttons, WiFi and the slideshow. Runs in the background so the
+    web server is listening while the WiFi wait and panel probe are in progress."""
     global _in_setup_mode
 
+    setup_buttons()
+
     print("Checking WiFi connectivity...")
 
     if wifi_manager.ensure_wifi_connected():
@@ -550,6 +956,7 @@ def main():
 
         photo_count = models.get_photo_count()
         settings = models.load_settings()
+        rerendering = False
 
         # Reprocess display images if settings changed since last render
         if photo_count > 0:
@@ -557,19 +964,24 @@ def main():
             current_fit = display_settings.get('fit_mode', 'contain')
             current_crop = display_settings.get('crop_mode', 'center')
             current_orientation = display_settings.get('orientation', 'horizontal')
+            current_format = display_settings.get('cache_format', display_cache.DEFAULT_FORMAT)
+            current_tone = tonemap.from_settings(display_settings)
             last_state = image_processor.get_display_state()
-            if image_processor.reprocess_needed(last_state, current_fit,
-                                                current_crop, current_orientation):
+            rerendering = image_processor.reprocess_needed(last_state, current_fit, current_crop,
+                                                           current_orientation, current_tone)
+            converting = not rerendering and \
+                image_processor.migration_needed(last_state, current_format)
+            if rerendering:
                 print(f"Display images stale, reprocessing with fit_mode={current_fit}")
-                threading.Thread(
-                    target=image_processor.reprocess_display_images,
-                    kwargs={'fit_mode': current_fit, 'crop_mode': current_crop,
-                            'orientation': current_orientation},
-                    daemon=True
-                ).start()
+            elif converting:
+                print(f"Converting display images to {current_format}")
+            if rerendering or converting:
+                image_processor.request_reprocess(current_fit, current_crop, current_orientation,
+                                                  current_format, delay=0, tone=current_tone)
 
         if photo_count > 0 and settings.get("slideshow", {}).get("enabled", True):
-            scheduler.start_slideshow()
+            # Keep the photo still on the panel unless its render is about to change
+            scheduler.start_slideshow(resume=not rerendering)
         else:
             wifi_status = wifi_manager.get_wifi_status() or "Connected"
             display.show_info_screen(photo_count=photo_count, wifi_status=wifi_status)
@@ -580,8 +992,77 @@ def main():
         wifi_manager.start_ap_mode()
         display.show_info_screen(ap_mode=True)
 
+    models.close_db()
+
+
+def _systemd_socket():
+    """Return the listening socket handed over by systemd socket activation
+    (inkframe.socket), or None when started normally."""
+    if os.environ.get('LISTEN_PID') != str(os.getpid()):
+        return None
+    if int(os.environ.get('LISTEN_FDS', 0)) < 1:
+        return None
+    return socket.socket(fileno=SD_LISTEN_FDS_START)
+
+
+def serve():
+    """Run the production WSGI server, falling back to the Flask dev server
+    if waitress isn't installed. Single process, so the scheduler and button
+    threads started by main() exist exactly once."""
+    sock = _systemd_socket()
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        waitress_serve = None
+
+    if waitress_serve is None:
+        print("waitress not installed - using the Flask development server")
+        if sock is not None:
+            from werkzeug.serving import make_server
+            make_server('0.0.0.0', SERVER_PORT, app, threaded=True,
+                        fd=sock.fileno()).serve_forever()
+        else:
+            app.run(host='0.0.0.0', port=SERVER_PORT, threaded=True)
+        return
+
+    options = {
+        'threads': SERVER_THREADS,
+        'connection_limit': SERVER_CONNECTION_LIMIT,
+        'backlog': SERVER_BACKLOG,
+        'channel_timeout': SERVER_CHANNEL_TIMEOUT,
+        'ident': 'InkFrame',
+    }
+    if sock is not None:
+        print(f"Serving on systemd-activated socket ({SERVER_THREADS} threads)")
+        waitress_serve(app, sockets=[sock], **options)
+    else:
+        print(f"Serving on port {SERVER_PORT} ({SERVER_THREADS} threads)")
+        waitress_serve(app, host='0.0.0.0', port=SERVER_PORT, **options)
+
+
+def _backfill_hashes():
+    """Hash photos uploaded before content/perceptual hashing existed"""
+    image_processor.backfill_content_hashes()
+    image_processor.backfill_perceptual_hashes()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(name)s: %(message)s')
+    models.init_db()
+    image_processor.ensure_dirs()
+    chunked_upload.collect_stale()
+    display.set_dither_algorithm(models.load_settings()['display'].get('dither', dither.DEFAULT_ALGORITHM))
+    signal.signal(signal.SIGTERM, signal_handler)
+    signal.signal(signal.SIGINT, signal_handler)
+
+    # Probe the panel and run the boot sequence in the background; heavy
+    # modules (inky, qrcode, cv2, numpy) are imported on first use.
+    display.init_display_async()
+    threading.Thread(target=_startup_sequence, daemon=True).start()
+    background.start(_backfill_hashes)
+
     print("Starting InkFrame web server...")
-    app.run(host='0.0.0.0', port=80, threaded=True)
+    serve()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,118 @@
+"""Idle-aware scheduling of background maintenance.
+
+Reprocessing, display cache migration, originals compaction and hash
+backfills are heavy but never urgent, and they compete with uploads, the
+gallery and panel refreshes for the Pi's few cores. They run in their own
+threads at reduced priority (nice; Linux derives a thread's I/O priority
+from its nice level unless one is set explicitly) and call wait_idle()
+between items. While an HTTP request is in flight or the panel is
+refreshing they pause, and they resume once the frame has been idle for
+IDLE_GRACE seconds.
+
+Tasks only pause between items, so preemption loses no work in progress;
+tasks whose progress is not already saved per item pass an on_pause
+callback to checkpoint it in case the frame is switched off while paused.
+"""
+
+import os
+import threading
+import time
+
+import display
+import metrics
+
+NICE = int(os.environ.get('INKFRAME_BACKGROUND_NICE', 10))
+IDLE_GRACE = 2.0       # seconds without foreground activity before tasks resume
+POLL_INTERVAL = 0.25   # display.is_busy() has no notification, so waiting polls
+
+_cond = threading.Condition()
+_active = 0            # foreground activities (requests) in progress
+_last_active = 0.0     # monotonic time the last one ended
+_paused = {}           # task name -> number of its threads waiting in wait_idle
+
+
+def lower_priority():
+    """Lower the calling thread's CPU and I/O priority (Linux; a no-op elsewhere)"""
+    try:
+        tid = threading.get_native_id()
+        current = os.getpriority(os.PRIO_PROCESS, tid)
+        if current < NICE:
+            os.setpriority(os.PRIO_PROCESS, tid, NICE)
+    except (AttributeError, OSError):
+        pass
+
+
+def start(target, *args, **kwargs):
+    """Run a maintenance task in a daemon thread at reduced priority"""
+    def _run():
+        lower_priority()
+        target(*args, **kwargs)
+
+    thread = threading.Thread(target=_run, name=target.__name__, daemon=True)
+    thread.start()
+    return thread
+
+
+def begin():
+    """Foreground work (e.g. an HTTP request) started; background tasks pause"""
+    global _active
+    with _cond:
+        _active += 1
+
+
+def end():
+    """Foreground work started with begin() finished"""
+    global _active, _last_active
+    with _cond:
+        _active -= 1
+        _last_active = time.monotonic()
+        _cond.notify_all()
+
+
+def _idle():
+    """Caller holds _cond"""
+    return (_active == 0 and time.monotonic() - _last_active >= IDLE_GRACE
+            and not display.is_busy())
+
+
+def is_idle():
+    with _cond:
+        return _idle()
+
+
+def wait_idle(task, interrupt=None, on_pause=None):
+    """
+    Block a background task until the frame is idle.
+
+    Args:
+        task: task name, for status and metrics
+        interrupt: optional callable; waiting stops early once it returns True
+        on_pause: optional callable run once before the task is paused
+
+    Returns:
+        True once idle, False if interrupted
+    """
+    with _cond:
+        if _idle():
+            return True
+    if on_pause is not None:
+        on_pause()
+    metrics.inc("inkframe_background_pauses_total", task=task)
+    with _cond:
+        _paused[task] = _paused.get(task, 0) + 1
+        try:
+            while not _idle():
+                if interrupt is not None and interrupt():
+                    return False
+                _cond.wait(POLL_INTERVAL)
+            return True
+        finally:
+            _paused[task] -= 1
+            if not _paused[task]:
+                del _paused[task]
+
+
+def get_status():
+    """Foreground activity and paused tasks for /api/status"""
+    with _cond:
+        return {'idle': _idle(), 'active_requests': _active, 'paused': sorted(_paused)}
@@ -0,0 +1 @@
+"""Benchmarks for the InkFrame image pipeline (run with `python -m benchmarks.<name>`)"""
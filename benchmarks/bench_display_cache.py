@@ -0,0 +1,112 @@
+"""Benchmark display-image storage formats: encode time, decode time, disk usage.
+
+    python -m benchmarks.bench_display_cache --quick --out formats.json
+
+Each corpus image is first rendered to a display image (untimed), then:
+    encode/<format>/<img>   display_cache.save
+    decode/<format>/<img>   display_cache.load (what display.show_photo does)
+    decode/raw-read/<img>   raw file via read() + frombytes (no mmap)
+    map/raw/<img>           display_cache.load_array: zero-copy NumPy view
+
+"png6" is the original default (PNG at zlib level 6) for reference. Bytes on
+disk per format are printed at the end and stored in the result metadata.
+"""
+
+import argparse
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks import harness
+from benchmarks.corpus import build_corpus
+
+from PIL import Image
+
+import display_cache
+import image_processor
+
+DISPLAY_SIZE = (600, 448)
+
+
+def _save_png6(img, base_path):
+    path = Path(base_path).with_suffix(".png")
+    img.save(str(path), "PNG")
+    return path
+
+
+def _load_png6(path):
+    img = Image.open(path)
+    return img.convert('RGB') if img.mode != 'RGB' else img
+
+
+def _load_raw_read(path):
+    with open(path, "rb") as f:
+        _, _, width, height, _ = display_cache.RAW_HEADER.unpack(f.read(display_cache.RAW_HEADER.size))
+        return Image.frombytes('RGB', (width, height), f.read())
+
+
+def _touch_array(path):
+    arr = display_cache.load_array(path)
+    arr[-1, -1, 0]  # fault in the last page like a consumer would
+
+
+def _codecs():
+    for fmt in display_cache.FORMATS:
+        yield fmt, (lambda img, base, fmt=fmt: display_cache.save(img, base, fmt)), display_cache.load
+    yield "png6", _save_png6, _load_png6
+
+
+def _rendered(corpus):
+    for item in corpus:
+        img, _ = image_processor.open_rendition_source(io.BytesIO(item['data']))
+        yield item['name'], image_processor.resize_for_display(img, "cover")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    harness.add_common_args(parser)
+    args = parser.parse_args(argv)
+
+    image_processor.get_display_size = lambda: DISPLAY_SIZE
+    corpus = build_corpus(seed=args.seed, quick=args.quick)
+    print(f"Corpus: {len(corpus)} images (seed={args.seed}, quick={args.quick})")
+
+    results = []
+    disk = {}
+    with tempfile.TemporaryDirectory(prefix="inkframe-bench-") as scratch:
+        for name, img in _rendered(corpus):
+            for fmt, save, load in _codecs():
+                base = Path(scratch) / fmt / Path(name).stem
+                base.parent.mkdir(exist_ok=True)
+                path = save(img, base)
+                disk[fmt] = disk.get(fmt, 0) + path.stat().st_size
+
+                cases = [(f"encode/{fmt}/{name}", lambda s=save, b=base: s(img, b)),
+                         (f"decode/{fmt}/{name}", lambda l=load, p=path: l(p).load())]
+                if fmt == "raw":
+                    cases += [(f"decode/raw-read/{name}", lambda p=path: _load_raw_read(p)),
+                              (f"map/raw/{name}", lambda p=path: _touch_array(p))]
+                for case, fn in cases:
+                    if args.filter and args.filter not in case:
+                        continue
+                    results.append(harness.measure(case, fn, repeat=args.repeat))
+                    print(f"  {case}", file=sys.stderr)
+
+    print("Disk usage:")
+    for fmt, size in disk.items():
+        print(f"  {fmt:<8} {size / len(corpus) / 1024:>8.1f} KiB/image")
+
+    meta = {
+        'benchmark': 'display_cache',
+        'seed': args.seed,
+        'quick': args.quick,
+        'display_size': DISPLAY_SIZE,
+        'disk_bytes': disk,
+        'env': harness.environment(),
+    }
+    return harness.finish(args, results, meta)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Benchmark panel quantization: speed and colour error per dithering algorithm.
+
+    python -m benchmarks.bench_dither --quick --out dither.json
+
+Each corpus image is first rendered to a display image (untimed), then:
+    quantize/<algorithm>/<img>   dither.quantize_array at saturation 0.5
+    quantize/pil/<img>           PIL's Floyd-Steinberg against the same palette
+                                 (what the Inky driver does in set_image)
+
+Colour error is the RMS difference, in 0-255 RGB units, between the display
+image and the panel colours after both are blurred by BLUR_RADIUS pixels
+(roughly how dithering reads at viewing distance). It is printed per
+algorithm at the end and stored in the result metadata.
+"""
+
+import argparse
+import io
+import sys
+
+import numpy as np
+
+from benchmarks import harness
+from benchmarks.corpus import build_corpus
+
+from PIL import Image, ImageFilter
+
+import dither
+import image_processor
+
+DISPLAY_SIZE = (600, 448)
+SATURATION = 0.5
+BLUR_RADIUS = 2
+
+
+def _pil_quantize(rgb, saturation):
+    """Palette indices as the Inky driver computes them"""
+    palette_img = Image.new("P", (1, 1))
+    palette_img.putpalette(dither.palette(saturation).astype(int).ravel().tolist())
+    return np.asarray(Image.fromarray(rgb).quantize(palette=palette_img,
+                                                    dither=Image.Dither.FLOYDSTEINBERG))
+
+
+def _quantizers():
+    for algorithm in dither.ALGORITHMS:
+        yield algorithm, lambda rgb, s, a=algorithm: dither.quantize_array(rgb, s, a)
+    yield "pil", _pil_quantize
+
+
+def colour_error(rgb, indices, saturation=SATURATION):
+    """Blurred RMS error between an RGB array and its quantized panel colours"""
+    blur = ImageFilter.GaussianBlur(BLUR_RADIUS)
+    shown = Image.fromarray(dither.to_rgb(indices, saturation))
+    a = np.asarray(Image.fromarray(rgb).filter(blur), dtype=np.float32)
+    b = np.asarray(shown.filter(blur), dtype=np.float32)
+    return float(np.sqrt(((a - b) ** 2).mean()))
+
+
+def _rendered(corpus):
+    for item in corpus:
+        img, _ = image_processor.open_rendition_source(io.BytesIO(item['data']))
+        yield item['name'], np.asarray(image_processor.resize_for_display(img, "cover"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    harness.add_common_args(parser)
+    args = parser.parse_args(argv)
+
+    image_processor.get_display_size = lambda: DISPLAY_SIZE
+    corpus = build_corpus(seed=args.seed, quick=args.quick)
+    print(f"Corpus: {len(corpus)} images (seed={args.seed}, quick={args.quick})")
+
+    results = []
+    errors = {}
+    for name, rgb in _rendered(corpus):
+        for algorithm, quantize in _quantizers():
+            indices = quantize(rgb, SATURATION)  # also warms the palette/LUT caches
+            errors.setdefault(algorithm, []).append(colour_error(rgb, indices))
+            case = f"quantize/{algorithm}/{name}"
+            if args.filter and args.filter not in case:
+                continue
+            results.append(harness.measure(case, lambda q=quantize: q(rgb, SATURATION),
+                                           repeat=args.repeat))
+            print(f"  {case}", file=sys.stderr)
+
+    colour_rms = {algorithm: sum(e) / len(e) for algorithm, e in errors.items()}
+    print("Colour error (blurred RMS, lower is better):")
+    for algorithm, rms in colour_rms.items():
+        print(f"  {algorithm:<11} {rms:>6.2f}")
+
+    meta = {
+        'benchmark': 'dither',
+        'seed': args.seed,
+        'quick': args.quick,
+        'display_size': DISPLAY_SIZE,
+        'saturation': SATURATION,
+        'colour_rms': colour_rms,
+        'env': harness.environment(),
+    }
+    return harness.finish(args, results, meta)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
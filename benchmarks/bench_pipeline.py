@@ -0,0 +1,139 @@
+"""Benchmark the upload/render pipeline stage by stage.
+
+    python -m benchmarks.bench_pipeline --quick --out before.json
+    python -m benchmarks.bench_pipeline --quick --compare before.json
+
+Cases (per corpus image unless noted):
+    decode/<img>                      Image.open + load
+    transpose/<img>                   ImageOps.exif_transpose + RGB convert
+    detect/<img>                      find_crop_center (YuNet) on the full image
+    resize/<fit>/<crop>/<orient>/<img> resize_for_display
+    upload/<fit>/<crop>/<orient>/<img> process_upload end to end (writes to a temp dir)
+    reprocess/<fit>/<crop>/<orient>   reprocess_display_images over the whole corpus
+"""
+
+import argparse
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks import harness
+from benchmarks.corpus import build_corpus, write_corpus
+
+from PIL import Image, ImageOps
+from werkzeug.datastructures import FileStorage
+
+import image_processor
+
+DISPLAY_SIZE = (600, 448)
+
+RESIZE_MODES = [
+    ("contain", "center", "horizontal"),
+    ("contain", "center", "vertical"),
+    ("cover", "center", "horizontal"),
+    ("cover", "smart", "horizontal"),
+    ("cover", "smart", "vertical"),
+    ("stretch", "center", "horizontal"),
+]
+UPLOAD_MODES = [
+    ("contain", "center", "horizontal"),
+    ("cover", "smart", "vertical"),
+]
+
+
+def _use_temp_data_dir(root):
+    """Point image_processor at a scratch data directory."""
+    root = Path(root)
+    image_processor.DATA_DIR = root
+    image_processor.ORIGINALS_DIR = root / "originals"
+    image_processor.DISPLAY_DIR = root / "display"
+    image_processor.RENDERS_DIR = root / "renders"
+    image_processor.THUMBNAILS_DIR = root / "thumbnails"
+    image_processor.DISPLAY_STATE_FILE = root / ".display_state.json"
+    image_processor.ensure_dirs()
+
+
+def _decoded(data):
+    img = Image.open(io.BytesIO(data))
+    img = ImageOps.exif_transpose(img)
+    return img.convert('RGB') if img.mode != 'RGB' else img
+
+
+def _cases(corpus, scratch):
+    for item in corpus:
+        name, data = item['name'], item['data']
+
+        yield f"decode/{name}", (lambda d=data: Image.open(io.BytesIO(d)).load()), None
+
+        def transpose(img):
+            out = ImageOps.exif_transpose(img)
+            if out.mode != 'RGB':
+                out = out.convert('RGB')
+
+        def setup_decode(d=data):
+            img = Image.open(io.BytesIO(d))
+            img.load()
+            return img
+        yield f"transpose/{name}", transpose, setup_decode
+
+        def detect(img):
+            image_processor.find_crop_center(img, (img.width // 2, img.height))
+        yield f"detect/{name}", detect, (lambda d=data: _decoded(d))
+
+        for fit, crop, orient in RESIZE_MODES:
+            def resize(img, fit=fit, crop=crop, orient=orient):
+                image_processor.resize_for_display(img, fit, crop_mode=crop, orientation=orient)
+            yield f"resize/{fit}/{crop}/{orient}/{name}", resize, (lambda d=data: _decoded(d))
+
+        for fit, crop, orient in UPLOAD_MODES:
+            def upload(fit=fit, crop=crop, orient=orient, d=data, n=name):
+                result = image_processor.process_upload(FileStorage(io.BytesIO(d), filename=n),
+                                                        fit, crop_mode=crop, orientation=orient)
+                if result is None:
+                    raise RuntimeError("process_upload failed")
+            yield f"upload/{fit}/{crop}/{orient}/{name}", upload, None
+
+    originals = Path(scratch) / "originals"
+    for fit, crop, orient in UPLOAD_MODES:
+        def setup_reprocess():
+            for p in image_processor.ORIGINALS_DIR.iterdir():
+                p.unlink()
+            write_corpus(corpus, originals)
+
+        def reprocess(_state, fit=fit, crop=crop, orient=orient):
+            image_processor.reprocess_display_images(fit, crop_mode=crop, orientation=orient)
+        yield f"reprocess/{fit}/{crop}/{orient}", reprocess, setup_reprocess
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    harness.add_common_args(parser)
+    args = parser.parse_args(argv)
+
+    image_processor.get_display_size = lambda: DISPLAY_SIZE
+    corpus = build_corpus(seed=args.seed, quick=args.quick)
+    print(f"Corpus: {len(corpus)} images (seed={args.seed}, quick={args.quick})")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="inkframe-bench-") as scratch:
+        _use_temp_data_dir(scratch)
+        for name, fn, setup in _cases(corpus, scratch):
+            if args.filter and args.filter not in name:
+                continue
+            repeat = 1 if name.startswith("reprocess/") else args.repeat
+            results.append(harness.measure(name, fn, setup=setup, repeat=repeat))
+            print(f"  {name}", file=sys.stderr)
+
+    meta = {
+        'benchmark': 'pipeline',
+        'seed': args.seed,
+        'quick': args.quick,
+        'display_size': DISPLAY_SIZE,
+        'env': harness.environment(),
+    }
+    return harness.finish(args, results, meta)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
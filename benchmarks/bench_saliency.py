@@ -0,0 +1,141 @@
+"""Benchmark the smart-crop saliency fallback against the center crop.
+
+    python -m benchmarks.bench_saliency --quick --out saliency.json
+
+Scenes are textured backgrounds with one off-center subject (a blob with a
+"head", in a colour that stands out) and no face, at landscape and portrait
+aspect ratios. Each is cropped for the horizontal (600x448) and the
+vertical (448x600) canvas:
+    saliency/<orient>/<scene>   saliency.find_center on the detection-size image
+
+Crop quality is the share of the subject's width (or height, for portrait
+scenes) inside the crop window, for the center crop and for the saliency
+crop; "kept" counts scenes whose subject is entirely inside. Both are
+printed at the end and stored in the result metadata, along with the slowest
+median time against saliency.TIME_BUDGET.
+"""
+
+import argparse
+import random
+import sys
+
+from PIL import Image, ImageDraw
+
+from benchmarks import harness
+from benchmarks.corpus import _texture
+
+import image_processor
+import saliency
+
+CANVASES = {'horizontal': (600, 448), 'vertical': (448, 600)}
+SIZES = [(960, 640), (640, 960), (1200, 675)]
+SCENES_PER_SIZE = 12
+QUICK_SCENES_PER_SIZE = 4
+SUBJECT_COLOURS = [(200, 80, 40), (230, 200, 60), (60, 60, 200), (240, 240, 240), (30, 30, 30)]
+
+
+def _scene(w, h, rng):
+    """Muted texture with one subject; returns (img, subject box)"""
+    img = Image.blend(_texture(w, h, rng), Image.new('RGB', (w, h), (110, 130, 90)), 0.5)
+    draw = ImageDraw.Draw(img)
+    sw = int(min(w, h) * rng.uniform(0.12, 0.22))
+    sh = int(sw * rng.uniform(0.7, 1.3))
+    cx = int(w * rng.uniform(0.15, 0.85))
+    cy = int(h * rng.uniform(0.25, 0.75))
+    colour = rng.choice(SUBJECT_COLOURS)
+    draw.ellipse((cx - sw // 2, cy - sh // 2, cx + sw // 2, cy + sh // 2), fill=colour)
+    draw.ellipse((cx - sw // 6, cy - sh // 2 - sh // 4, cx + sw // 6, cy - sh // 2 + sh // 8),
+                 fill=colour)
+    return img, (cx - sw // 2, cy - sh // 2 - sh // 4, cx + sw // 2, cy + sh // 2)
+
+
+def build_scenes(seed=0, quick=False):
+    rng = random.Random(seed)
+    per_size = QUICK_SCENES_PER_SIZE if quick else SCENES_PER_SIZE
+    return [(f"{w}x{h}-{i}", *_scene(w, h, rng)) for w, h in SIZES for i in range(per_size)]
+
+
+def _crop_window(size, canvas):
+    """(crop size, centered left/top) as _compose_for_display computes them for cover"""
+    w, h = size
+    ratio = canvas[0] / canvas[1]
+    if w / h > ratio:
+        return (int(h * ratio), h), ((w - int(h * ratio)) // 2, 0)
+    return (w, int(w / ratio)), (0, (h - int(w / ratio)) // 2)
+
+
+def coverage(box, crop_size, origin):
+    """Share of the subject inside the crop along the axis the crop slides on"""
+    x0, y0, x1, y1 = box
+    left, top = origin
+    cw, ch = crop_size
+    inside_x = max(0, min(x1, left + cw) - max(x0, left)) / (x1 - x0)
+    inside_y = max(0, min(y1, top + ch) - max(y0, top)) / (y1 - y0)
+    return min(inside_x, inside_y)
+
+
+def _saliency_origin(img, crop_size, centered):
+    center = saliency.find_center(img, crop_size)
+    if center is None:
+        return centered
+    w, h = img.size
+    return (max(0, min(w - crop_size[0], center[0] - crop_size[0] // 2)),
+            max(0, min(h - crop_size[1], center[1] - crop_size[1] // 2)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    harness.add_common_args(parser)
+    args = parser.parse_args(argv)
+
+    scenes = build_scenes(seed=args.seed, quick=args.quick)
+    print(f"Scenes: {len(scenes)} (seed={args.seed}, quick={args.quick})")
+
+    results = []
+    quality = {}
+    worst = 0.0
+    for orient, canvas in CANVASES.items():
+        scores = quality.setdefault(orient, {'center': [], 'saliency': []})
+        for name, img, box in scenes:
+            # What find_crop_center hands to saliency: the detection-size image
+            scale = min(image_processor.DETECT_MAX_DIM / max(img.size), 1.0)
+            det = img.resize((int(img.width * scale), int(img.height * scale)), Image.BILINEAR)
+            det_box = tuple(v * scale for v in box)
+            crop_size, centered = _crop_window(det.size, canvas)
+            scores['center'].append(coverage(det_box, crop_size, centered))
+            scores['saliency'].append(coverage(det_box, crop_size,
+                                               _saliency_origin(det, crop_size, centered)))
+
+            case = f"saliency/{orient}/{name}"
+            if args.filter and args.filter not in case:
+                continue
+            result = harness.measure(case, lambda d=det, c=crop_size: saliency.find_center(d, c),
+                                     repeat=args.repeat)
+            worst = max(worst, result.get('median_s', 0))
+            results.append(result)
+            print(f"  {case}", file=sys.stderr)
+
+    summary = {}
+    print("Subject kept in the crop (mean share / fully inside):")
+    for orient, scores in quality.items():
+        for method, values in scores.items():
+            mean = sum(values) / len(values)
+            kept = sum(v >= 0.999 for v in values) / len(values)
+            summary[f"{orient}/{method}"] = {'mean_coverage': mean, 'fully_kept': kept}
+            print(f"  {orient:<10} {method:<8} {mean:6.1%} {kept:6.1%}")
+    print(f"Slowest saliency run: {worst * 1000:.1f} ms (budget {saliency.TIME_BUDGET * 1000:.0f} ms)")
+
+    meta = {
+        'benchmark': 'saliency',
+        'seed': args.seed,
+        'quick': args.quick,
+        'quality': summary,
+        'slowest_s': worst,
+        'time_budget_s': saliency.TIME_BUDGET,
+        'env': harness.environment(),
+    }
+    return harness.finish(args, results, meta)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
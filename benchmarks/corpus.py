@@ -0,0 +1,105 @@
+"""Deterministic synthetic photo corpus for benchmarks.
+
+Every image is generated from a seeded RNG, so two runs (or two machines)
+benchmark byte-identical inputs. The corpus covers the axes that change
+pipeline cost: pixel count, aspect ratio, container format, EXIF
+orientation (which forces a full-size transpose) and whether the frame
+contains a face-like subject for the smart-crop detector.
+"""
+
+import io
+import random
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+# (width, height) as stored on disk, before any EXIF rotation
+FULL_SIZES = [(640, 480), (1600, 1200), (4032, 3024), (3024, 4032), (8000, 6000)]
+QUICK_SIZES = [(640, 480), (1600, 1200), (3024, 4032)]
+
+
+def _texture(w, h, rng):
+    """Smooth gradient plus mid-frequency noise: compresses like a real photo,
+    unlike a flat fill (too small) or white noise (far too large)."""
+    nprng = np.random.default_rng(rng.randrange(2 ** 32))
+    small = nprng.integers(0, 256, size=(max(h // 32, 2), max(w // 32, 2), 3), dtype=np.uint8)
+    base = Image.fromarray(small, 'RGB').resize((w, h), Image.BICUBIC)
+    ramp = Image.linear_gradient('L').resize((w, h)).convert('RGB')
+    return Image.blend(base, ramp, 0.35)
+
+
+def _draw_face(img, rng):
+    """Paint a simple face-like subject (skin ellipse, eyes, mouth) off-center."""
+    w, h = img.size
+    draw = ImageDraw.Draw(img)
+    fw = max(w // 6, 24)
+    fh = int(fw * 1.3)
+    cx = int(w * rng.uniform(0.2, 0.8))
+    cy = int(h * rng.uniform(0.3, 0.7))
+    draw.ellipse((cx - fw // 2, cy - fh // 2, cx + fw // 2, cy + fh // 2), fill=(224, 172, 140))
+    eye = max(fw // 10, 2)
+    for ex in (cx - fw // 5, cx + fw // 5):
+        draw.ellipse((ex - eye, cy - fh // 6 - eye, ex + eye, cy - fh // 6 + eye), fill=(40, 30, 30))
+    draw.arc((cx - fw // 4, cy + fh // 12, cx + fw // 4, cy + fh // 4), 20, 160,
+             fill=(120, 40, 40), width=max(fw // 30, 1))
+
+
+def _encode(img, fmt, orientation):
+    buf = io.BytesIO()
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION_TAG] = orientation
+    exif[306] = "2024:06:01 12:00:00"  # DateTime, read by get_exif_date
+    if fmt == "JPEG":
+        img.save(buf, "JPEG", quality=90, exif=exif)
+    elif fmt == "WEBP":
+        img.save(buf, "WEBP", quality=85, exif=exif)
+    else:
+        img.save(buf, "PNG", exif=exif)
+    return buf.getvalue()
+
+
+def build_corpus(seed=0, quick=False):
+    """
+    Build the corpus in memory. Same seed and preset -> identical bytes.
+
+    Returns:
+        list of dicts with keys: name, size, format, orientation, face, data
+    """
+    rng = random.Random(seed)
+    sizes = QUICK_SIZES if quick else FULL_SIZES
+    corpus = []
+    for w, h in sizes:
+        variants = [("JPEG", 1, False), ("JPEG", 6, True)]
+        if w * h <= 5_000_000:
+            # Lossless and WebP originals are rarely huge; keep the corpus small
+            variants += [("PNG", 1, False), ("WEBP", 3, True), ("JPEG", 8, False)]
+        for fmt, orientation, face in variants:
+            img = _texture(w, h, rng)
+            if face:
+                _draw_face(img, rng)
+            ext = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}[fmt]
+            name = f"{w}x{h}-o{orientation}-{'face' if face else 'noface'}.{ext}"
+            corpus.append({
+                'name': name,
+                'size': (w, h),
+                'format': fmt,
+                'orientation': orientation,
+                'face': face,
+                'data': _encode(img, fmt, orientation),
+            })
+    return corpus
+
+
+def write_corpus(corpus, dest):
+    """Write corpus images to dest directory, returns list of paths."""
+    dest = Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for item in corpus:
+        path = dest / item['name']
+        path.write_bytes(item['data'])
+        paths.append(path)
+    return paths
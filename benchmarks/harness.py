@@ -0,0 +1,241 @@
+"""Timing, peak-RSS measurement and JSON result comparison for benchmarks.
+
+Each case runs in a forked child so its peak RSS is not polluted by earlier
+cases (ru_maxrss is a process-lifetime high-water mark). On Linux the child
+also resets its high-water mark via /proc/self/clear_refs, so the reported
+delta is what the case itself allocated on top of the parent's footprint.
+"""
+
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.insert(0, str(REPO_DIR))
+
+DEFAULT_THRESHOLD = 0.15  # 15% slower (or bigger) than baseline is a regression
+
+
+def _read_status_kb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Reset VmHWM to current RSS (Linux >= 4.0). Returns True on success."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_kb():
+    peak = _read_status_kb("VmHWM")
+    if peak is not None:
+        return peak
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss // 1024 if sys.platform == "darwin" else maxrss
+
+
+def _release_free_heap():
+    """Return freed heap pages to the OS (glibc), so memory the parent freed
+    earlier -- still resident in the forked child -- can't hide new allocations."""
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _run_case(fn, setup, repeat):
+    state = setup() if setup else None
+    gc.collect()
+    _release_free_heap()
+    baseline = _read_status_kb("VmRSS") if _reset_peak_rss() else None
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if setup:
+            fn(state)
+        else:
+            fn()
+        timings.append(time.perf_counter() - start)
+    peak = _peak_rss_kb()
+    return {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'repeat': repeat,
+        'peak_rss_kb': peak,
+        'rss_delta_kb': (peak - baseline) if baseline is not None else None,
+    }
+
+
+def measure(name, fn, setup=None, repeat=3, isolate=True):
+    """
+    Time fn over `repeat` runs and record peak RSS.
+
+    Args:
+        name: unique result key, e.g. "resize/cover/smart/horizontal/4032x3024.jpg"
+        fn: callable; receives setup()'s return value if setup is given
+        setup: optional untimed callable run once before timing
+        repeat: number of timed runs (median and min are reported)
+        isolate: run in a forked child for an independent peak-RSS reading
+
+    Returns:
+        result dict (also carries 'name' and, on failure, 'error')
+    """
+    if not isolate or not hasattr(os, "fork"):
+        result = _run_case(fn, setup, repeat)
+        result['name'] = name
+        return result
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            payload = _run_case(fn, setup, repeat)
+        except Exception as e:
+            payload = {'error': f"{type(e).__name__}: {e}"}
+        with os.fdopen(write_fd, "w") as w:
+            json.dump(payload, w)
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as r:
+        raw = r.read()
+    os.waitpid(pid, 0)
+    try:
+        result = json.loads(raw)
+    except ValueError:
+        result = {'error': "child produced no result (crashed or OOM-killed?)"}
+    result['name'] = name
+    return result
+
+
+def environment():
+    """Describe the machine and library versions, stored alongside results."""
+    import PIL
+    info = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'pillow': PIL.__version__,
+        'cpus': os.cpu_count(),
+    }
+    try:
+        import numpy
+        info['numpy'] = numpy.__version__
+    except ImportError:
+        pass
+    try:
+        import cv2
+        info['opencv'] = cv2.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def write_results(path, results, meta):
+    """Write {'meta': ..., 'results': [...]} JSON."""
+    with open(path, "w") as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two result documents case by case.
+
+    A case regresses when its median time or its RSS delta grows by more
+    than `threshold` (fraction) relative to baseline. Cases present in only
+    one document are ignored.
+
+    Returns:
+        list of dicts: name, metric, baseline, current, ratio, regression
+    """
+    base_by_name = {r['name']: r for r in baseline.get('results', [])}
+    rows = []
+    for cur in current.get('results', []):
+        base = base_by_name.get(cur['name'])
+        if base is None or 'error' in base or 'error' in cur:
+            continue
+        for metric in ('median_s', 'rss_delta_kb'):
+            old, new = base.get(metric), cur.get(metric)
+            if old is None or new is None:
+                continue
+            ratio = new / old if old else (1.0 if not new else float('inf'))
+            # Ignore tiny absolute changes (timer noise, page granularity)
+            floor = 0.002 if metric == 'median_s' else 1024
+            regression = ratio > 1 + threshold and new - old > floor
+            rows.append({'name': cur['name'], 'metric': metric, 'baseline': old,
+                         'current': new, 'ratio': ratio, 'regression': regression})
+    return rows
+
+
+def print_results(results):
+    width = max((len(r['name']) for r in results), default=10)
+    print(f"{'case':<{width}}  {'median':>9}  {'min':>9}  {'rss delta':>10}")
+    for r in results:
+        if 'error' in r:
+            print(f"{r['name']:<{width}}  ERROR {r['error']}")
+            continue
+        delta = r.get('rss_delta_kb')
+        delta_s = f"{delta / 1024:.1f}MiB" if delta is not None else "n/a"
+        print(f"{r['name']:<{width}}  {r['median_s'] * 1000:>7.1f}ms  "
+              f"{r['min_s'] * 1000:>7.1f}ms  {delta_s:>10}")
+
+
+def print_comparison(rows, threshold):
+    regressions = [r for r in rows if r['regression']]
+    for r in rows:
+        mark = "REGRESSION" if r['regression'] else ""
+        print(f"{r['name']} [{r['metric']}]: {r['baseline']:.4g} -> {r['current']:.4g} "
+              f"(x{r['ratio']:.2f}) {mark}")
+    print(f"{len(regressions)} regression(s) over {threshold:.0%} threshold")
+    return regressions
+
+
+def add_common_args(parser):
+    parser.add_argument("--out", help="write JSON results to this path")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="compare against a previous JSON result file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="regression threshold as a fraction (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--seed", type=int, default=0, help="corpus seed")
+    parser.add_argument("--quick", action="store_true", help="smaller corpus")
+    parser.add_argument("--filter", default="", help="only run cases containing this substring")
+
+
+def finish(args, results, meta):
+    """Print, optionally write and compare results. Returns the process exit code."""
+    print_results(results)
+    if args.out:
+        write_results(args.out, results, meta)
+        print(f"Wrote {args.out}")
+    if args.compare:
+        rows = compare(load_results(args.compare), {'results': results}, args.threshold)
+        if print_comparison(rows, args.threshold):
+            return 1
+    return 0
@@ -0,0 +1,160 @@
+"""Resumable chunked uploads.
+
+Large photos sent over the frame's own WiFi often lose the connection part
+way through. Instead of one multipart POST, a client can start an upload
+session, append the file in chunks at explicit offsets and ask for the
+current offset to resume after a drop. The assembled file is then handed to
+image_processor.process_upload like any other upload.
+
+Sessions live on disk (a .part file plus a small .json sidecar), so they
+also survive a restart of the app. Sessions idle for longer than
+STALE_AFTER are garbage-collected.
+"""
+
+import json
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+PARTIAL_DIR = Path(__file__).parent / "data" / "partial"
+CHUNK_SIZE = 1024 * 1024       # suggested to clients
+STALE_AFTER = 24 * 3600        # seconds without a chunk before a session is dropped
+COPY_BUFFER = 64 * 1024
+
+_UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_lock = threading.Lock()
+_session_locks = {}  # upload_id -> Lock; serializes appends so two retries can't interleave
+
+
+class OffsetMismatch(Exception):
+    """A chunk was sent for an offset other than the end of the received data."""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+def _paths(upload_id):
+    if not _UPLOAD_ID_RE.match(upload_id or ''):
+        return None
+    return PARTIAL_DIR / f"{upload_id}.part", PARTIAL_DIR / f"{upload_id}.json"
+
+
+def _session(upload_id, part, meta):
+    with open(meta) as f:
+        info = json.load(f)
+    return {
+        'upload_id': upload_id,
+        'filename': info['filename'],
+        'size': info['size'],
+        'offset': part.stat().st_size,
+        'chunk_size': CHUNK_SIZE,
+    }
+
+
+def start(filename, size):
+    """Open a new upload session for a file of `size` bytes. Returns the session dict."""
+    PARTIAL_DIR.mkdir(parents=True, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    part, meta = _paths(upload_id)
+    part.touch()
+    with open(meta, 'w') as f:
+        json.dump({'filename': filename, 'size': size, 'created': time.time()}, f)
+    return _session(upload_id, part, meta)
+
+
+def get(upload_id):
+    """Session dict (with the number of bytes received as 'offset'), or None"""
+    paths = _paths(upload_id)
+    if not paths or not paths[1].exists():
+        return None
+    try:
+        return _session(upload_id, *paths)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def append(upload_id, offset, stream):
+    """
+    Append the bytes of `stream` at `offset`.
+
+    Resuming is per chunk: the server (waitress) buffers the whole request
+    body before the view runs, so a chunk whose connection drops never gets
+    here, and the client resends it from the offset reported by get().
+
+    Returns:
+        the updated session dict, or None if the session does not exist
+
+    Raises:
+        OffsetMismatch: offset is not the current end of the data
+        ValueError: the data would exceed the size declared at start()
+    """
+    if get(upload_id) is None:
+        return None  # before making a lock, so unknown ids don't leave one behind
+    with _lock:
+        session_lock = _session_locks.setdefault(upload_id, threading.Lock())
+    with session_lock:
+        session = get(upload_id)
+        if session is None:  # discarded meanwhile
+            with _lock:
+                _session_locks.pop(upload_id, None)
+            return None
+        if offset != session['offset']:
+            raise OffsetMismatch(session['offset'])
+        part, _ = _paths(upload_id)
+        remaining = session['size'] - offset
+        with open(part, 'ab') as f:
+            while True:
+                chunk = stream.read(COPY_BUFFER)
+                if not chunk:
+                    break
+                if len(chunk) > remaining:
+                    f.write(chunk[:remaining])
+                    raise ValueError("Upload is larger than its declared size")
+                f.write(chunk)
+                remaining -= len(chunk)
+        return get(upload_id)
+
+
+def completed_path(upload_id):
+    """Path of the assembled file once every declared byte has arrived, else None"""
+    session = get(upload_id)
+    if session is None or session['offset'] != session['size']:
+        return None
+    return _paths(upload_id)[0]
+
+
+def discard(upload_id):
+    """Delete a session and its data"""
+    paths = _paths(upload_id)
+    if paths:
+        for path in paths:
+            path.unlink(missing_ok=True)
+    with _lock:
+        _session_locks.pop(upload_id, None)
+
+
+def collect_stale(max_age=STALE_AFTER):
+    """Delete sessions that have not received data for max_age seconds. Returns the count."""
+    if not PARTIAL_DIR.exists():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for meta in PARTIAL_DIR.glob("*.json"):
+        part = meta.with_suffix(".part")
+        try:
+            last_active = max(meta.stat().st_mtime,
+                              part.stat().st_mtime if part.exists() else 0)
+        except OSError:
+            continue
+        if last_active < cutoff:
+            discard(meta.stem)
+            removed += 1
+    # .part files whose sidecar was lost
+    for part in PARTIAL_DIR.glob("*.part"):
+        if not part.with_suffix(".json").exists() and part.stat().st_mtime < cutoff:
+            part.unlink(missing_ok=True)
+            removed += 1
+    return removed
@@ -1,28 +1,25 @@
 """E-ink display abstraction with MockDisplay for headless development"""
 
 import os
+import json
 import time
 import threading
 import socket
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
 
-try:
-    from inky.auto import auto
-    INKY_AVAILABLE = True
-except ImportError:
-    INKY_AVAILABLE = False
-
-try:
-    import qrcode
-    QRCODE_AVAILABLE = True
-except ImportError:
-    QRCODE_AVAILABLE = False
+import display_cache
+import dither
+import metrics
 
 DISPLAY_WIDTH = 600
 DISPLAY_HEIGHT = 448
 DATA_DIR = Path(__file__).parent / "data"
 MOCK_DISPLAY_PATH = DATA_DIR / "mock_display.png"
+# What the panel physically shows; e-ink keeps the image with power off
+PANEL_STATE_FILE = DATA_DIR / ".panel_state.json"
 
 # Display state
 _display = None
@@ -30,7 +27,33 @@ _actual_width = DISPLAY_WIDTH
 _actual_height = DISPLAY_HEIGHT
 _busy = False
 _busy_lock = threading.Lock()
+_display_lock = threading.Lock()  # Serializes the one-time hardware probe
 _font_cache = None  # Cached (large, medium, small) font tuple
+_dither_algorithm = dither.DEFAULT_ALGORITHM  # or "driver": leave it to the Inky driver
+
+# Composed info/message screens by their inputs, with their panel-ready
+# (quantized) versions: key -> {'image': RGB, 'ready': {(saturation, algorithm): P}}
+SCREEN_CACHE_SIZE = 8
+_screen_cache = OrderedDict()
+_screen_lock = threading.Lock()
+
+
+def _load_inky_auto():
+    """Import the Inky driver on first use; it pulls in numpy and the SPI/GPIO stack."""
+    try:
+        from inky.auto import auto
+        return auto
+    except ImportError:
+        return None
+
+
+def _load_qrcode():
+    """Import qrcode on first use (only the info screen needs it)."""
+    try:
+        import qrcode
+        return qrcode
+    except ImportError:
+        return None
 
 
 class MockDisplay:
@@ -43,6 +66,10 @@ class MockDisplay:
         print(f"MockDisplay initialized ({self.width}x{self.height})")
 
     def set_image(self, img, saturation=0.5):
+        # Quantize like the panel would, so the saved PNG shows the real
+        # output; with "driver" the RGB image is saved as it arrives
+        if img.mode != 'P' and _dither_algorithm in dither.ALGORITHMS:
+            img = dither.quantize(img, saturation, _dither_algorithm)
         self._img = img
 
     def show(self):
@@ -59,19 +86,34 @@ def get_display():
     if _display is not None:
         return _display
 
-    if INKY_AVAILABLE:
-        try:
-            _display = auto()
-            _display.set_border(_display.BLACK)
-            _actual_width = _display.width
-            _actual_height = _display.height
-            print(f"Inky display initialized: {_actual_width}x{_actual_height}")
+    with _display_lock:
+        if _display is not None:
             return _display
-        except Exception as e:
-            print(f"Failed to init Inky display: {e}")
 
-    _display = MockDisplay()
-    return _display
+        auto = _load_inky_auto()
+        if auto is not None:
+            try:
+                inky = auto()
+                inky.set_border(inky.BLACK)
+                _actual_width = inky.width
+                _actual_height = inky.height
+                _display = inky
+                print(f"Inky display initialized: {_actual_width}x{_actual_height}")
+                return _display
+            except Exception as e:
+                print(f"Failed to init Inky display: {e}")
+
+        _display = MockDisplay()
+        return _display
+
+
+def init_display_async():
+    """Probe the display hardware in a background thread so startup isn't blocked.
+
+    Anything that needs the panel (get_display_size, show_*) simply waits on
+    the probe if it is still running.
+    """
+    threading.Thread(target=get_display, daemon=True).start()
 
 
 def get_display_size():
@@ -86,41 +128,169 @@ def is_busy():
         return _busy
 
 
-def _show_on_display(img, saturation=0.5):
-    """Internal: send image to display with busy guard"""
+def _photo_fingerprint(image_path, saturation):
+    """Identity of a rendered photo as shown: the display file's path, size
+    and mtime (a reprocess replaces the file) plus the saturation used."""
+    st = os.stat(image_path)
+    return {'path': str(image_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+            'saturation': saturation}
+
+
+def _record_panel_state(fingerprint):
+    """Remember what is on the panel; None means unknown (mid-refresh or not a photo)"""
+    try:
+        if fingerprint is None:
+            PANEL_STATE_FILE.unlink(missing_ok=True)
+            return
+        state = dict(fingerprint, panel=[_actual_width, _actual_height], shown_at=time.time())
+        tmp = PANEL_STATE_FILE.with_name(PANEL_STATE_FILE.name + ".tmp")
+        tmp.write_text(json.dumps(state))
+        os.replace(tmp, PANEL_STATE_FILE)
+    except OSError as e:
+        print(f"Failed to record panel state: {e}")
+
+
+def get_panel_state():
+    """Last recorded panel state dict (see _record_panel_state), or None"""
+    try:
+        return json.loads(PANEL_STATE_FILE.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def panel_shows(image_path, saturation=0.5):
+    """
+    Whether the panel still shows exactly this display image (same file
+    contents and saturation, same panel), e.g. after a restart.
+
+    Returns:
+        the time it was shown (epoch seconds), or None if it doesn't match
+    """
+    state = get_panel_state()
+    if not state or not image_path:
+        return None
+    try:
+        current = _photo_fingerprint(image_path, saturation)
+    except OSError:
+        return None
+    if any(state.get(k) != v for k, v in current.items()):
+        return None
+    if state.get('panel') != list(get_display_size()):
+        return None
+    return state.get('shown_at')
+
+
+def set_dither_algorithm(algorithm):
+    """Choose the dithering algorithm (dither.ALGORITHMS, or "driver")"""
+    global _dither_algorithm
+    _dither_algorithm = algorithm
+
+
+def _quantizes(display):
+    """Whether display takes our palette images: MockDisplay, or an Inky with the
+    7-colour palette in dither's index order that can tell us its colours
+    (other panels keep their own dithering)"""
+    if isinstance(display, MockDisplay):
+        return True
+    return (getattr(display, 'WHITE', None) == 1 and getattr(display, 'ORANGE', None) == 6
+            and callable(getattr(display, '_palette_blend', None)))
+
+
+def _panel_colours(display, saturation):
+    """The driver's palette blended for saturation, as 7 RGB tuples in
+    dither's index order; None (dither's measured palette) for MockDisplay.
+    Panels measure differently (the 7.3" is not the 5.7"), so the driver's
+    table wins."""
+    blend = getattr(display, '_palette_blend', None)
+    if blend is None:
+        return None
+    flat = blend(saturation)
+    return tuple(tuple(int(c) for c in flat[i:i + 3]) for i in range(0, 21, 3))
+
+
+def _dithers_here(display):
+    """Whether images for display are quantized here rather than by its driver"""
+    return _dither_algorithm in dither.ALGORITHMS and _quantizes(display)
+
+
+def _panel_ready(img, saturation, display, screen_key=None):
+    """img (an Image, or an RGB array from display_cache.load_array) as the
+    panel takes it: quantized here unless the driver dithers (see
+    _quantizes). Cached screens keep their quantized version."""
+    if not isinstance(img, Image.Image):
+        if not _dithers_here(display):  # the setting changed since loading
+            return Image.fromarray(img)
+    elif img.mode == 'P' or not _dithers_here(display):
+        return img
+    colours = _panel_colours(display, saturation)
+    variant = (saturation, _dither_algorithm, colours)
+    with _screen_lock:
+        entry = _screen_cache.get(screen_key)
+        if entry is not None and variant in entry['ready']:
+            return entry['ready'][variant]
+    ready = dither.quantize(img, saturation, _dither_algorithm, colours)
+    if entry is not None and entry['image'] is img:
+        with _screen_lock:
+            entry['ready'][variant] = ready
+    return ready
+
+
+def _show_on_display(img, saturation=0.5, fingerprint=None, screen_key=None):
+    """Internal: send image to display with busy guard. `fingerprint`
+    identifies a photo so a restart can tell it is still on the panel;
+    `screen_key` a cached screen (see _cached_screen)."""
     global _busy
 
     with _busy_lock:
         if _busy:
             print("Display busy, skipping update")
+            metrics.inc("inkframe_display_updates_total", result="busy")
             return False
         _busy = True
 
     try:
         display = get_display()
-        display.set_image(img, saturation=saturation)
-        display.show()
+        _record_panel_state(None)
+        with metrics.timer("inkframe_display_seconds", phase="dither"):
+            img = _panel_ready(img, saturation, display, screen_key)
+            display.set_image(img, saturation=saturation)
+        with metrics.timer("inkframe_display_seconds", phase="spi"):
+            display.show()
+        _record_panel_state(fingerprint)
+        metrics.inc("inkframe_display_updates_total", result="ok")
         return True
     except Exception as e:
         print(f"Display error: {e}")
+        metrics.inc("inkframe_display_updates_total", result="error")
         return False
     finally:
         with _busy_lock:
             _busy = False
 
 
-def show_photo(image_path, saturation=0.5):
+def show_photo(image_path, saturation=0.5, prepare=None):
     """
     Display a pre-rendered display image on the e-ink screen.
-    The image should already be 600x448 (from image_processor).
-    Runs in a background thread to avoid blocking.
+    The image should already be 600x448 (from image_processor), in any
+    display_cache format; a raw one is memory-mapped and quantized without
+    being decoded or copied when dithering happens here.
+    Runs in a background thread to avoid blocking. `prepare`, if given, is
+    called with the path in that thread first and returns the path to show
+    (e.g. to wait for a pending re-render).
     """
     def _do_show():
+        nonlocal image_path
         try:
-            img = Image.open(image_path)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            _show_on_display(img, saturation)
+            if prepare is not None:
+                image_path = prepare(image_path)
+            with metrics.timer("inkframe_display_seconds", phase="load"):
+                fingerprint = _photo_fingerprint(image_path, saturation)
+                if _dithers_here(get_display()):
+                    # Raw images are dithered straight from the page cache
+                    img = display_cache.load_array(image_path)
+                else:
+                    img = display_cache.load(image_path)
+            _show_on_display(img, saturation, fingerprint)
             print(f"Displayed: {image_path}")
         except Exception as e:
             print(f"Error showing photo: {e}")
@@ -129,10 +299,10 @@ def show_photo(image_path, saturation=0.5):
     return True
 
 
-def show_image_object(img, saturation=0.5):
+def show_image_object(img, saturation=0.5, screen_key=None):
     """Display a PIL Image object (for info screens, messages)"""
     def _do_show():
-        _show_on_display(img, saturation)
+        _show_on_display(img, saturation, screen_key=screen_key)
 
     threading.Thread(target=_do_show, daemon=True).start()
     return True
@@ -196,15 +366,33 @@ def get_system_ip():
     except Exception:
         return "127.0.0.1"
 
-def generate_info_screen(photo_count=0, wifi_status="Unknown", ap_mode=False):
-    """Generate an info screen with QR code and system information"""
-    width, height = get_display_size()
+def _cached_screen(key, compose):
+    """
+    The screen for key (its inputs), composing it on a miss. Cached images
+    are shared between callers and must not be drawn on.
+    """
+    with _screen_lock:
+        entry = _screen_cache.get(key)
+        if entry is not None:
+            _screen_cache.move_to_end(key)
+            metrics.inc("inkframe_screen_cache_total", result="hit")
+            return entry['image']
+    metrics.inc("inkframe_screen_cache_total", result="miss")
+    img = compose()
+    with _screen_lock:
+        _screen_cache[key] = {'image': img, 'ready': {}}
+        while len(_screen_cache) > SCREEN_CACHE_SIZE:
+            _screen_cache.popitem(last=False)
+    return img
+
+
+@lru_cache(maxsize=4)
+def _info_layer(width, height, ap_mode, hostname):
+    """Static part of the info screen: frame, QR code and labels. Shared; copy
+    before drawing on it."""
     img = Image.new('RGB', (width, height), (255, 255, 255))
     draw = ImageDraw.Draw(img)
 
-    ip = get_system_ip()
-    hostname = socket.gethostname()
-
     # QR code
     if ap_mode:
         qr_data = "WIFI:T:WPA;S:inkframe-setup;P:photoframe;;"
@@ -212,7 +400,8 @@ def generate_info_screen(photo_count=0, wifi_status="Unknown", ap_mode=False):
         qr_data = f"http://{hostname}.local/"
 
     qr_size = min(width, height) // 2
-    if QRCODE_AVAILABLE:
+    qrcode = _load_qrcode()
+    if qrcode is not None:
         qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L,
                            box_size=10, border=2)
         qr.add_data(qr_data)
@@ -240,32 +429,58 @@ def generate_info_screen(photo_count=0, wifi_status="Unknown", ap_mode=False):
         text_y += 35
         draw.text((text_x, text_y), "Or scan QR to connect", font=font_small, fill=(100, 100, 100))
     else:
+        # The IP, WiFi and photo count lines are left blank for _compose_info
         draw.text((text_x, text_y), "InkFrame", font=font_large, fill=(0, 0, 0))
-        text_y += 70
-        draw.text((text_x, text_y), f"IP: {ip}", font=font_medium, fill=(0, 0, 0))
-        text_y += 45
+        text_y += 115
         draw.text((text_x, text_y), f"http://{hostname}.local/", font=font_small, fill=(100, 100, 100))
-        text_y += 40
-        wifi_color = (0, 128, 0) if wifi_status and wifi_status != "Unknown" else (200, 0, 0)
-        draw.text((text_x, text_y), f"WiFi: {wifi_status}", font=font_small, fill=wifi_color)
-        text_y += 35
-        draw.text((text_x, text_y), f"Photos: {photo_count}", font=font_small, fill=(0, 0, 0))
-        text_y += 35
+        text_y += 110
         draw.text((text_x, text_y), "Upload photos at the URL above", font=font_small, fill=(100, 100, 100))
 
     draw.rectangle([(0, 0), (width - 1, height - 1)], outline=(0, 0, 0), width=3)
     return img
 
 
+def _compose_info(width, height, hostname, ip, wifi_status, photo_count):
+    """The connected info screen: the static layer plus its changing fields"""
+    img = _info_layer(width, height, False, hostname).copy()
+    draw = ImageDraw.Draw(img)
+    _, font_medium, font_small = _load_fonts()
+    text_x = min(width, height) // 2 + 40
+
+    draw.text((text_x, 90), f"IP: {ip}", font=font_medium, fill=(0, 0, 0))
+    wifi_color = (0, 128, 0) if wifi_status and wifi_status != "Unknown" else (200, 0, 0)
+    draw.text((text_x, 175), f"WiFi: {wifi_status}", font=font_small, fill=wifi_color)
+    draw.text((text_x, 210), f"Photos: {photo_count}", font=font_small, fill=(0, 0, 0))
+    return img
+
+
+def _info_screen(photo_count, wifi_status, ap_mode):
+    """(cache key, image) of the info screen; setup mode shows no live fields"""
+    width, height = get_display_size()
+    if ap_mode:
+        key = ('info', width, height, True)
+        return key, _cached_screen(key, lambda: _info_layer(width, height, True, None))
+
+    hostname = socket.gethostname()
+    ip = get_system_ip()
+    key = ('info', width, height, False, hostname, ip, wifi_status, photo_count)
+    return key, _cached_screen(key, lambda: _compose_info(width, height, hostname, ip,
+                                                          wifi_status, photo_count))
+
+
+def generate_info_screen(photo_count=0, wifi_status="Unknown", ap_mode=False):
+    """Generate an info screen with QR code and system information.
+    The image is cached and shared: copy it before drawing on it."""
+    return _info_screen(photo_count, wifi_status, ap_mode)[1]
+
+
 def show_info_screen(photo_count=0, wifi_status="Unknown", ap_mode=False):
     """Generate and display the info screen"""
-    img = generate_info_screen(photo_count, wifi_status, ap_mode)
-    return show_image_object(img)
+    key, img = _info_screen(photo_count, wifi_status, ap_mode)
+    return show_image_object(img, screen_key=key)
 
 
-def show_message(title, message, submessage=None):
-    """Display a simple centered message on the e-ink screen"""
-    width, height = get_display_size()
+def _compose_message(width, height, title, message, submessage):
     img = Image.new('RGB', (width, height), (255, 255, 255))
     draw = ImageDraw.Draw(img)
 
@@ -288,4 +503,12 @@ def show_message(title, message, submessage=None):
         draw.text(((width - sub_w) // 2, title_y + 120), submessage, font=font_small, fill=(150, 150, 150))
 
     draw.rectangle([(0, 0), (width - 1, height - 1)], outline=(0, 0, 0), width=3)
-    return show_image_object(img)
+    return img
+
+
+def show_message(title, message, submessage=None):
+    """Display a simple centered message on the e-ink screen"""
+    width, height = get_display_size()
+    key = ('message', width, height, title, message, submessage)
+    img = _cached_screen(key, lambda: _compose_message(width, height, title, message, submessage))
+    return show_image_object(img, screen_key=key)
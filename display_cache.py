@@ -0,0 +1,128 @@
+"""On-disk formats for pre-rendered display images.
+
+Display images are written once per upload or reprocess but decoded at every
+slideshow transition, so the format trades disk space for load speed:
+
+    raw      12-byte header + packed RGB rows, no compression; memory-mapped
+             on load, so pixels come straight from the page cache
+    png      lossless PNG at a low zlib level
+    palette  adaptive 256-colour PNG; smallest, but quantised before the
+             panel driver's own 7-colour dither
+
+Files are replaced atomically, never rewritten in place, so a reader still
+holding a mapping of the old file keeps a consistent image.
+"""
+
+import mmap
+import os
+import struct
+from pathlib import Path
+
+from PIL import Image
+
+FORMATS = ("raw", "png", "palette")
+DEFAULT_FORMAT = "raw"
+EXTENSIONS = {"raw": ".rgb", "png": ".png", "palette": ".png"}
+PNG_COMPRESS_LEVEL = 1  # the default level 6 takes ~5x as long to encode for ~15% less disk
+
+RAW_MAGIC = b"IFRB"
+RAW_VERSION = 1
+RAW_HEADER = struct.Struct("<4sHHHH")  # magic, version, width, height, channels
+
+
+def path_for(base_path, fmt):
+    """Display image path for a stem path (no extension) in the given format"""
+    return Path(base_path).with_suffix(EXTENSIONS[fmt])
+
+
+def save(img, base_path, fmt=DEFAULT_FORMAT):
+    """
+    Write an RGB display image in the given format.
+
+    Args:
+        img: PIL Image (converted to RGB if needed)
+        base_path: destination path; its suffix is replaced by the format's
+        fmt: one of FORMATS
+
+    Returns:
+        Path written
+    """
+    if fmt not in EXTENSIONS:
+        raise ValueError(f"Unknown display cache format: {fmt}")
+    path = path_for(base_path, fmt)
+    tmp_path = path.with_name(path.name + ".tmp")
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    try:
+        if fmt == "raw":
+            with open(tmp_path, "wb") as f:
+                f.write(RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, img.width, img.height, 3))
+                f.write(img.tobytes())
+        elif fmt == "palette":
+            img.quantize(256, method=Image.Quantize.FASTOCTREE).save(
+                str(tmp_path), "PNG", compress_level=PNG_COMPRESS_LEVEL)
+        else:
+            img.save(str(tmp_path), "PNG", compress_level=PNG_COMPRESS_LEVEL)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return path
+
+
+def _map_raw(path):
+    """Map a raw display image read-only. Returns (mmap, width, height)."""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(mapped) < RAW_HEADER.size:
+        mapped.close()
+        raise ValueError(f"Not a raw display image: {path}")
+    magic, version, width, height, channels = RAW_HEADER.unpack_from(mapped)
+    if magic != RAW_MAGIC or version != RAW_VERSION or channels != 3:
+        mapped.close()
+        raise ValueError(f"Not a raw display image: {path}")
+    if len(mapped) < RAW_HEADER.size + width * height * 3:
+        mapped.close()
+        raise ValueError(f"Truncated raw display image: {path}")
+    return mapped, width, height
+
+
+def _read_raw(path):
+    mapped, width, height = _map_raw(path)
+    # Unpacked once, from the page cache straight into Pillow's pixel buffer
+    with mapped, memoryview(mapped) as view, view[RAW_HEADER.size:] as pixels:
+        return Image.frombuffer('RGB', (width, height), pixels, 'raw', 'RGB', 0, 1)
+
+
+def load_array(path):
+    """
+    Load a display image as a read-only (height, width, 3) uint8 NumPy array.
+
+    Raw images are returned as a view over a memory mapping of the file: no
+    decode and no copy. Other formats are decoded.
+    """
+    import numpy as np
+
+    if Path(path).suffix != EXTENSIONS["raw"]:
+        return np.asarray(load(path))
+    mapped, width, height = _map_raw(path)
+    # The array keeps the mapping alive; it is unmapped when the array is freed
+    return np.frombuffer(mapped, dtype=np.uint8, count=width * height * 3,
+                         offset=RAW_HEADER.size).reshape(height, width, 3)
+
+
+def load(path):
+    """Load a display image in any supported format as an RGB Image"""
+    if Path(path).suffix == EXTENSIONS["raw"]:
+        return _read_raw(path)
+    with Image.open(path) as img:
+        img.load()
+        return img.convert('RGB') if img.mode != 'RGB' else img
+
+
+def format_of(path):
+    """Identify the format of an existing display image file"""
+    if Path(path).suffix == EXTENSIONS["raw"]:
+        return "raw"
+    with Image.open(path) as img:
+        return "palette" if img.mode == 'P' else "png"
@@ -0,0 +1,259 @@
+"""Palette quantization and dithering for the 7-colour e-ink panel.
+
+The Inky driver maps RGB images to its palette inside set_image (PIL's
+Floyd-Steinberg against a saturation-blended palette) on every refresh,
+with no choice of algorithm, and MockDisplay did no quantization at all.
+This module does the mapping in-project, on NumPy arrays, and hands the
+driver a palette ("P") image, which it uses as is.
+
+    diffusion   Floyd-Steinberg error diffusion, vectorized over
+                anti-diagonal wavefronts (every pixel on one depends only
+                on earlier ones); closest to the driver's output
+    ordered     8x8 Bayer threshold matrix: fast, regular cross-hatch
+    blue-noise  threshold texture without low frequencies: fast, grain
+                instead of a visible pattern
+
+The threshold methods use pattern dithering: each pixel gets a short list
+of palette colours whose average approximates it (built by repeatedly
+picking the nearest colour to the pixel plus the error so far), sorted by
+luminance, and the threshold picks one. Flat palette colours (white
+backgrounds, black text) come out clean.
+
+Palette indices match the driver: 0 black, 1 white, 2 green, 3 blue,
+4 red, 5 yellow, 6 orange. The measured colours below are the 5.7"
+panel's; callers pass the driver's own blend when it has one.
+"""
+
+from functools import lru_cache
+
+from PIL import Image
+
+ALGORITHMS = ("diffusion", "ordered", "blue-noise")
+DEFAULT_ALGORITHM = "diffusion"
+
+# Measured panel colours (saturated) and their idealised sRGB counterparts;
+# the driver blends the two by the saturation setting
+SATURATED_PALETTE = [(57, 48, 57), (255, 255, 255), (58, 91, 70), (61, 59, 94),
+                     (156, 72, 75), (208, 190, 71), (177, 106, 73)]
+DESATURATED_PALETTE = [(0, 0, 0), (255, 255, 255), (0, 255, 0), (0, 0, 255),
+                       (255, 0, 0), (255, 255, 0), (255, 140, 0)]
+
+LUT_BITS = 5              # nearest-colour table resolution per channel
+PATTERN_CANDIDATES = 8    # colours mixed per pixel by the threshold methods
+PATTERN_ERROR = 0.75      # share of the accumulated error added to each attempt
+BLUE_NOISE_SIZE = 64
+BLUE_NOISE_SEED = 7
+
+
+@lru_cache(maxsize=8)
+def blend(saturation=0.5):
+    """The measured palette blended for a saturation, as 7 RGB tuples"""
+    s = float(saturation)
+    return tuple(tuple(int(cs * s + cd * (1.0 - s)) for cs, cd in zip(sat, desat))
+                 for sat, desat in zip(SATURATED_PALETTE, DESATURATED_PALETTE))
+
+
+@lru_cache(maxsize=8)
+def _as_array(colours):
+    import numpy as np
+
+    pal = np.array(colours, dtype=np.float32)
+    pal.flags.writeable = False
+    return pal
+
+
+def _colours(saturation, colours):
+    """Hashable palette key: colours as tuples, or the measured blend"""
+    return tuple(map(tuple, colours)) if colours else blend(saturation)
+
+
+def palette(saturation=0.5, colours=None):
+    """
+    The panel palette as a read-only (7, 3) float32 array: colours (7 RGB
+    tuples in driver index order, e.g. the driver's own blend) if given,
+    otherwise the measured palette blended for the saturation.
+    """
+    return _as_array(_colours(saturation, colours))
+
+
+def _distances(pixels, pal):
+    """Squared RGB distance, up to a per-pixel constant, from (n, 3) pixels to each colour"""
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2; |p|^2 is the same for every c
+    return (pal * pal).sum(1) - 2 * pixels @ pal.T
+
+
+def _nearest(pixels, pal):
+    """Index of the nearest palette colour for (n, 3) pixels"""
+    return _distances(pixels, pal).argmin(1)
+
+
+@lru_cache(maxsize=8)
+def _nearest_lut(colours):
+    """Index of the nearest palette colour for every LUT_BITS-per-channel RGB cell"""
+    import numpy as np
+
+    pal = _as_array(colours)
+    step = 256 >> LUT_BITS
+    centres = np.arange(step // 2, 256, step, dtype=np.float32)
+    cells = np.stack(np.meshgrid(centres, centres, centres, indexing='ij'), -1).reshape(-1, 3)
+    lut = _nearest(cells, pal).astype(np.uint8).reshape((1 << LUT_BITS,) * 3)
+    lut.flags.writeable = False
+    return lut
+
+
+def _lookup(rgb, colours):
+    """Nearest palette indices of an (h, w, 3) float array already clipped to 0-255"""
+    import numpy as np
+
+    cells = rgb.astype(np.uint16) >> (8 - LUT_BITS)
+    flat = (cells[..., 0] << (2 * LUT_BITS)) | (cells[..., 1] << LUT_BITS) | cells[..., 2]
+    return _nearest_lut(colours).ravel().take(flat)
+
+
+@lru_cache(maxsize=1)
+def _bayer_matrix():
+    """8x8 Bayer thresholds in (0, 1)"""
+    import numpy as np
+
+    m = np.zeros((1, 1), dtype=np.float32)
+    for _ in range(3):
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return (m + 0.5) / m.size
+
+
+@lru_cache(maxsize=1)
+def _blue_noise():
+    """Tileable blue-noise thresholds in (0, 1): white noise with the low
+    frequencies filtered out, rank-mapped back to a uniform distribution"""
+    import numpy as np
+
+    n = BLUE_NOISE_SIZE
+    noise = np.random.default_rng(BLUE_NOISE_SEED).standard_normal((n, n))
+    f = np.fft.fftfreq(n)
+    radius = np.hypot(*np.meshgrid(f, f, indexing='ij'))
+    high = np.fft.ifft2(np.fft.fft2(noise) * radius ** 2).real
+    ranks = high.ravel().argsort().argsort().reshape(n, n)
+    return ((ranks + 0.5) / ranks.size).astype(np.float32)
+
+
+def _threshold(rgb, colours, matrix):
+    """Pattern dithering: the threshold picks one of each pixel's candidate colours"""
+    import numpy as np
+
+    h, w = rgb.shape[:2]
+    pal = _as_array(colours)
+    # Candidates are sorted by luminance rank, then mapped back to indices
+    by_luma = (pal @ np.array([0.299, 0.587, 0.114], dtype=np.float32)).argsort()
+    rank = by_luma.argsort().astype(np.uint8)
+
+    target = rgb.astype(np.float32)
+    error = np.zeros_like(target)
+    attempt = np.empty_like(target)
+    candidates = np.empty((PATTERN_CANDIDATES, h, w), dtype=np.uint8)
+    for i in range(PATTERN_CANDIDATES):
+        np.multiply(error, PATTERN_ERROR, out=attempt)
+        attempt += target
+        np.clip(attempt, 0, 255, out=attempt)
+        nearest = _lookup(attempt, colours)
+        candidates[i] = rank[nearest]
+        error += target
+        error -= pal[nearest]
+    candidates.sort(axis=0)
+
+    mh, mw = matrix.shape
+    thresholds = np.tile(matrix, (-(-h // mh), -(-w // mw)))[:h, :w]
+    pick = (thresholds * PATTERN_CANDIDATES).astype(np.intp)
+    return by_luma.astype(np.uint8)[np.take_along_axis(candidates, pick[None], 0)[0]]
+
+
+@lru_cache(maxsize=4)
+def _wavefronts(h, w):
+    """Flat indices into an (h + 1, w + 2) padded buffer of each anti-diagonal
+    wavefront x + 2y = t, in order. A pixel's Floyd-Steinberg inputs (left,
+    up-left, up, up-right) all lie on earlier wavefronts."""
+    import numpy as np
+
+    stride = w + 2
+    fronts = []
+    for t in range(w + 2 * (h - 1)):
+        ys = np.arange(max(0, (t - w + 2) // 2), min(h - 1, t // 2) + 1)
+        xs = t - 2 * ys
+        fronts.append(ys * stride + xs + 1)
+    return fronts
+
+
+def _diffuse(rgb, colours):
+    import numpy as np
+
+    h, w = rgb.shape[:2]
+    stride = w + 2
+    pal = _as_array(colours)
+    buf = np.zeros((h + 1, stride, 3), dtype=np.float32)
+    buf[:h, 1:w + 1] = rgb
+    flat = buf.reshape(-1, 3)
+    out = np.empty((h + 1) * stride, dtype=np.uint8)
+
+    for idx in _wavefronts(h, w):
+        px = flat[idx]
+        np.clip(px, 0, 255, out=px)
+        nearest = _nearest(px, pal)
+        out[idx] = nearest
+        err = px - pal[nearest]
+        # Separate statements: on one wavefront, one pixel's right neighbour
+        # can be another's lower-left, and fancy-index += doesn't accumulate
+        flat[idx + 1] += err * (7 / 16)
+        flat[idx + stride - 1] += err * (3 / 16)
+        flat[idx + stride] += err * (5 / 16)
+        flat[idx + stride + 1] += err * (1 / 16)
+    return out.reshape(h + 1, stride)[:h, 1:w + 1]
+
+
+def quantize_array(rgb, saturation=0.5, algorithm=DEFAULT_ALGORITHM, colours=None):
+    """
+    Map an (h, w, 3) uint8 RGB array to panel palette indices.
+
+    Args:
+        colours: The panel's 7 RGB colours in driver index order when the
+            driver knows them; defaults to the measured palette blended for
+            the saturation
+
+    Returns:
+        (h, w) uint8 array of palette indices
+    """
+    import numpy as np
+
+    rgb = np.asarray(rgb)
+    colours = _colours(saturation, colours)
+    if algorithm == "diffusion":
+        return _diffuse(rgb, colours)
+    if algorithm == "ordered":
+        return _threshold(rgb, colours, _bayer_matrix())
+    if algorithm == "blue-noise":
+        return _threshold(rgb, colours, _blue_noise())
+    raise ValueError(f"Unknown dithering algorithm: {algorithm}")
+
+
+def to_image(indices, saturation=0.5, colours=None):
+    """Palette image of an index array, carrying the blended palette (for viewing)"""
+    h, w = indices.shape
+    img = Image.frombytes('P', (w, h), indices.tobytes())
+    flat = palette(saturation, colours).astype(int).ravel().tolist()
+    img.putpalette(flat + [255, 255, 255] * (256 - len(flat) // 3))
+    return img
+
+
+def to_rgb(indices, saturation=0.5, colours=None):
+    """The colours the panel shows for an index array, as an (h, w, 3) uint8 array"""
+    import numpy as np
+
+    return palette(saturation, colours).astype(np.uint8)[indices]
+
+
+def quantize(img, saturation=0.5, algorithm=DEFAULT_ALGORITHM, colours=None):
+    """Quantize an RGB PIL Image (or array) for the panel; returns a "P" Image"""
+    import numpy as np
+
+    if isinstance(img, Image.Image) and img.mode != 'RGB':
+        img = img.convert('RGB')
+    return to_image(quantize_array(np.asarray(img), saturation, algorithm, colours),
+                    saturation, colours)
@@ -2,14 +2,30 @@
 
 import gc
 import io
+import math
+import os
+import hashlib
 import threading
+import time
 import json
 import uuid
 import logging
 from pathlib import Path
-from PIL import Image, ImageOps
+from PIL import Image
 from datetime import datetime
 
+import admission
+import background
+import display_cache
+import metrics
+import models
+import originals
+import phash
+import renders
+import saliency
+import thumbnails
+import tonemap
+
 log = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).parent
@@ -17,11 +33,46 @@ DATA_DIR = BASE_DIR / "data"
 ORIGINALS_DIR = DATA_DIR / "originals"
 DISPLAY_DIR = DATA_DIR / "display"
 THUMBNAILS_DIR = DATA_DIR / "thumbnails"
+RENDERS_DIR = DATA_DIR / "renders"  # inactive display render variants (see renders)
 
-THUMBNAIL_SIZE = (300, 200)
 DISPLAY_STATE_FILE = DATA_DIR / ".display_state.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+DETECT_MAX_DIM = 640  # face detector input size (long edge)
+
+EXIF_ORIENTATION = 0x0112
+# EXIF orientation -> transpose that makes the image upright (as ImageOps.exif_transpose)
+_EXIF_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
 
 _reprocess_lock = threading.Lock()
+# Bump when the display pipeline's output changes: stored variants miss and
+# display images rendered before it count as stale
+RENDER_VERSION = 2
+RENDER_WAIT = 15  # seconds the slideshow waits for a prioritized render
+THUMBNAIL_WAIT = 5  # seconds a thumbnail request waits for the processing budget
+
+# Progress of the running (or last) reprocess, see get_reprocess_status()
+_reprocess_cond = threading.Condition()
+_reprocess_cancel = threading.Event()
+_reprocess_status = {'state': 'idle'}
+_reprocess_pending = {}    # stem -> original path, not yet rendered
+_reprocess_priority = []   # stems to render next, most recent request first
+_reprocess_rendered = {}   # stem -> display path rendered by the running job (None on error);
+                           # emptied when it ends, as later migrations may move the files
+
+REPROCESS_DEBOUNCE = 2  # seconds without a further settings change before re-rendering
+_request_lock = threading.Lock()
+_requested = None       # latest settings passed to request_reprocess, not yet started
+_request_timer = None
+_hash_backfill_report = None  # Result of the last backfill_content_hashes() run
+_compaction_report = None     # Result of the last compact_originals() run
 
 
 def get_display_size():
@@ -68,6 +119,33 @@ def get_exif_date(img):
     return None
 
 
+def read_and_hash(stream):
+    """
+    Read a stream to the end in chunks, hashing as it comes in.
+
+    Returns:
+        (data, hexdigest) with data as bytes
+    """
+    digest = hashlib.sha256()
+    chunks = []
+    while True:
+        chunk = stream.read(HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b''.join(chunks), digest.hexdigest()
+
+
+def hash_file(path):
+    """SHA-256 of a file on disk, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 YUNET_MODEL = Path(__file__).parent / "models" / "face_detection_yunet_2023mar.onnx"
 
 
@@ -143,7 +221,8 @@ def _cluster_faces(faces, scale, crop_size):
 
 def find_crop_center(img, crop_size):
     """
-    Detect faces in the image and return the best center point for cropping.
+    Find the best center point for cropping: detected faces, or else the
+    most salient region (see saliency).
 
     Args:
         img: PIL Image (original, EXIF-transposed)
@@ -151,32 +230,54 @@ def find_crop_center(img, crop_size):
                    coordinates (pre-resize, same coordinate space as img.size)
 
     Returns:
-        (cx, cy) in original image pixel coordinates, or None if no faces found.
+        (cx, cy) in original image pixel coordinates, or None if there are no
+        faces and nothing stands out (the caller crops at the center).
     """
     try:
-        import cv2
-        import numpy as np
+        import numpy  # noqa: F401 (both fallbacks need it)
     except ImportError:
         return None
 
     orig_w, orig_h = img.size
 
     # Downscale for detection (saves RAM)
-    MAX_DET = 640
-    scale = min(MAX_DET / orig_w, MAX_DET / orig_h, 1.0)
+    scale = min(DETECT_MAX_DIM / orig_w, DETECT_MAX_DIM / orig_h, 1.0)
     dw, dh = int(orig_w * scale), int(orig_h * scale)
     det_img = img.resize((dw, dh), Image.BILINEAR)
-    cv_img = np.array(det_img)
-    cv_img = cv2.cvtColor(cv_img, cv2.COLOR_RGB2BGR)
-    del det_img
+
+    center = _detect_faces(det_img, scale, crop_size)
+    if center is not None:
+        return center
+
+    with metrics.timer("inkframe_stage_seconds", stage="saliency"):
+        try:
+            found = saliency.find_center(det_img, (crop_size[0] * scale, crop_size[1] * scale))
+        except Exception as e:
+            log.warning("Saliency failed: %s", e)
+            found = None
+    if found is None:
+        return None
+    return (int(found[0] / scale), int(found[1] / scale))
+
+
+def _detect_faces(det_img, scale, crop_size):
+    """Crop center from YuNet faces in the downscaled image, or None (no faces,
+    or no OpenCV / model)"""
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        return None
 
     if not YUNET_MODEL.exists():
-        del cv_img
         return None
 
+    dw, dh = det_img.size
+    cv_img = cv2.cvtColor(np.array(det_img), cv2.COLOR_RGB2BGR)
     try:
-        detector = cv2.FaceDetectorYN.create(str(YUNET_MODEL), "", (dw, dh), 0.5)
-        _, faces = detector.detect(cv_img)
+        with metrics.timer("inkframe_stage_seconds", stage="detect"):
+            detector = cv2.FaceDetectorYN.create(str(YUNET_MODEL), "", (dw, dh), 0.5)
+            _, faces = detector.detect(cv_img)
         del detector, cv_img
         if faces is None or len(faces) == 0:
             return None
@@ -192,7 +293,8 @@ def find_crop_center(img, crop_size):
         return None
 
 
-def resize_for_display(img, fit_mode="contain", crop_mode="center", orientation="horizontal"):
+def resize_for_display(img, fit_mode="contain", crop_mode="center", orientation="horizontal",
+                       tone=None):
     """
     Resize image to display dimensions (600x448).
 
@@ -202,26 +304,30 @@ def resize_for_display(img, fit_mode="contain", crop_mode="center", orientation=
         "stretch" - stretch to fill (may distort)
     crop_mode:
         "center" - always crop from geometric center
-        "smart" - use face detection to find best crop center
+        "smart" - center on detected faces, else on the most salient region
     orientation:
         "horizontal" - frame mounted landscape (native panel orientation)
         "vertical" - frame mounted portrait: compose for a portrait canvas,
                      then rotate 90 degrees to the physical landscape panel
+    tone:
+        tonemap parameters (tonemap.from_settings) applied to the photo,
+        not to contain-mode bars; None leaves colours as they are
     """
     width, height = get_display_size()
     if orientation == "vertical":
         width, height = height, width
 
-    result = _compose_for_display(img, width, height, fit_mode, crop_mode)
-    if orientation == "vertical":
-        result = result.rotate(90, expand=True)
+    with metrics.timer("inkframe_stage_seconds", stage="resize"):
+        result = _compose_for_display(img, width, height, fit_mode, crop_mode, tone)
+        if orientation == "vertical":
+            result = result.rotate(90, expand=True)
     return result
 
 
-def _compose_for_display(img, width, height, fit_mode, crop_mode):
+def _compose_for_display(img, width, height, fit_mode, crop_mode, tone=None):
     """Compose img onto a width x height canvas according to fit/crop mode."""
     if fit_mode == "stretch":
-        return img.resize((width, height), Image.LANCZOS)
+        return _tone_map(img.resize((width, height), Image.LANCZOS), tone)
 
     img_w, img_h = img.size
     target_ratio = width / height
@@ -257,7 +363,7 @@ def _compose_for_display(img, width, height, fit_mode, crop_mode):
             else:
                 top = (img_h - new_h) // 2
             img = img.crop((0, top, img_w, top + new_h))
-        return img.resize((width, height), Image.LANCZOS)
+        return _tone_map(img.resize((width, height), Image.LANCZOS), tone)
 
     # contain (default)
     if img_ratio > target_ratio:
@@ -267,7 +373,7 @@ def _compose_for_display(img, width, height, fit_mode, crop_mode):
         new_h = height
         new_w = int(height * img_ratio)
 
-    img = img.resize((new_w, new_h), Image.LANCZOS)
+    img = _tone_map(img.resize((new_w, new_h), Image.LANCZOS), tone)
     background = Image.new('RGB', (width, height), (0, 0, 0))
     x = (width - new_w) // 2
     y = (height - new_h) // 2
@@ -275,7 +381,114 @@ def _compose_for_display(img, width, height, fit_mode, crop_mode):
     return background
 
 
-def process_upload(file_storage, fit_mode="contain", crop_mode="center", orientation="horizontal"):
+def _tone_map(img, tone):
+    if tone is None:
+        return img
+    with metrics.timer("inkframe_stage_seconds", stage="tone"):
+        return tonemap.apply(img, tone)
+
+
+def _canvas_size(orientation):
+    """Compose canvas (width, height) before the vertical-mount rotation"""
+    width, height = get_display_size()
+    return (height, width) if orientation == "vertical" else (width, height)
+
+
+def _decode_target(img, orientation, exif_orientation=1):
+    """Smallest stored-orientation size that still covers the canvas and detector input"""
+    w, h = img.size
+    upright_w, upright_h = (h, w) if exif_orientation in (5, 6, 7, 8) else (w, h)
+    canvas_w, canvas_h = _canvas_size(orientation)
+    scale = max(canvas_w / upright_w, canvas_h / upright_h,
+                DETECT_MAX_DIM / max(upright_w, upright_h))
+    scale = min(scale, 1.0)
+    return (max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale)))
+
+
+def estimate_render_cost(img, orientation="horizontal"):
+    """
+    Estimate peak pixel memory (bytes) of rendering an image, from its header only.
+
+    Mirrors open_rendition_source: JPEGs decode at the DCT-scaled draft size,
+    everything else at full size (plus a second buffer if it needs converting
+    to RGB). The reduced intermediate, its transpose and the display and
+    thumbnail renders are added on top. Pillow stores RGB at 4 bytes/pixel.
+
+    Args:
+        img: a lazily opened PIL Image (nothing decoded yet)
+        orientation: frame orientation, selects the canvas to cover
+    """
+    w, h = img.size
+    target = _decode_target(img, orientation, img.getexif().get(EXIF_ORIENTATION, 1))
+    if img.format == 'JPEG':
+        # draft() picks the largest 1/2^n scale (n <= 3) that still covers target
+        shrink = min(w // target[0], h // target[1], 8)
+        shrink = 1 << (max(shrink, 1).bit_length() - 1)
+        decoded = math.ceil(w / shrink) * math.ceil(h / shrink)
+    else:
+        decoded = w * h
+    converts = img.mode != 'RGB'
+    canvas_w, canvas_h = _canvas_size(orientation)
+    intermediate = target[0] * target[1]
+    return 4 * (decoded * (2 if converts else 1) + 2 * intermediate + 3 * canvas_w * canvas_h)
+
+
+def open_rendition_source(source, orientation="horizontal"):
+    """
+    Decode an image once, at the smallest size every rendition still needs.
+
+    The display render, thumbnail and face-detector input are all derived
+    from the returned intermediate, which just covers the display canvas (and
+    the detector's input size). JPEGs are decoded straight to a reduced size
+    via draft mode (DCT scaling); other formats are box-reduced right after
+    decoding. The EXIF rotation is applied to the reduced image, so no
+    full-size rotated copy is ever made.
+
+    Args:
+        source: file path or file object
+        orientation: frame orientation, selects the canvas to cover
+
+    Returns:
+        (img, meta): img is upright RGB; meta has width, height (full-size,
+        upright), format, mime_type, date_taken
+    """
+    img = Image.open(source)
+    img_format = img.format
+    exif_orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+    date_taken = get_exif_date(img)
+
+    w, h = img.size
+    upright_w, upright_h = (h, w) if exif_orientation in (5, 6, 7, 8) else (w, h)
+    target = _decode_target(img, orientation, exif_orientation)
+
+    with metrics.timer("inkframe_stage_seconds", stage="decode"):
+        if target != img.size:
+            img.draft('RGB', target)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        else:
+            img.load()
+        factor = int(min(img.width / target[0], img.height / target[1]))
+        if factor >= 2:
+            img = img.reduce(factor)
+
+    method = _EXIF_TRANSPOSE.get(exif_orientation)
+    if method is not None:
+        with metrics.timer("inkframe_stage_seconds", stage="transpose"):
+            img = img.transpose(method)
+
+    return img, {
+        'width': upright_w,
+        'height': upright_h,
+        'format': img_format,
+        'mime_type': Image.MIME.get(img_format, 'image/jpeg'),
+        'date_taken': date_taken,
+    }
+
+
+def process_upload(file_storage, fit_mode="contain", crop_mode="center", orientation="horizontal",
+                   find_duplicate=None, admission_timeout=None,
+                   cache_format=display_cache.DEFAULT_FORMAT, retention=None, tone=None):
     """
     Process an uploaded file: save original, create display version, create thumbnail.
 
@@ -284,111 +497,303 @@ def process_upload(file_storage, fit_mode="contain", crop_mode="center", orienta
         fit_mode: how to fit image to display
         crop_mode: "center" or "smart" for cover crop positioning
         orientation: "horizontal" or "vertical" frame mounting
+        find_duplicate: optional callable(content_hash) -> existing photo id or None;
+                        checked before any decoding
+        admission_timeout: seconds to wait for processing budget (None waits forever)
+        cache_format: display image storage format (see display_cache.FORMATS)
+        retention: settings["originals"] dict (see originals); None keeps the full upload
+        tone: tonemap parameters for the display render (see tonemap.from_settings)
 
     Returns:
         dict with keys: filename, original_path, display_path, thumbnail_path,
-                       width, height, file_size, mime_type, date_taken
+                       width, height, file_size, mime_type, date_taken, content_hash, phash
+        or {'duplicate_of': photo_id, 'content_hash': ...} if find_duplicate matched,
         or None on error
+
+    Raises:
+        admission.Busy: the processing budget stayed full for admission_timeout
     """
     ensure_dirs()
 
     original_name = file_storage.filename or "unknown.jpg"
     if not is_allowed_file(original_name):
+        metrics.inc("inkframe_uploads_total", result="rejected")
         return None
 
-    # Validate image in memory before touching disk
+    with metrics.timer("inkframe_stage_seconds", stage="hash"):
+        file_data, content_hash = read_and_hash(file_storage)
+    if find_duplicate is not None:
+        existing_id = find_duplicate(content_hash)
+        if existing_id is not None:
+            metrics.inc("inkframe_uploads_total", result="duplicate")
+            return {'duplicate_of': existing_id, 'content_hash': content_hash}
+
+    # Validate image in memory before touching disk; the header alone sizes the job
     try:
-        file_data = file_storage.read()
-        img = Image.open(io.BytesIO(file_data))
-        img.verify()  # Raises if the file is corrupt or not a valid image
-        # Re-open after verify() (verify exhausts the internal stream)
-        img = Image.open(io.BytesIO(file_data))
+        with metrics.timer("inkframe_stage_seconds", stage="verify"):
+            # verify() must come straight after open: reading EXIF from a PNG
+            # parses past the header, so size the job from a second handle
+            Image.open(io.BytesIO(file_data)).verify()  # Raises if corrupt or not an image
+            header = Image.open(io.BytesIO(file_data))
+            # Upload's own dimensions and type; a stored master is smaller and always JPEG
+            upright = header.size[::-1] if header.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8) \
+                else header.size
+            mime_type = Image.MIME.get(header.format, 'image/jpeg')
+            cost = estimate_render_cost(header, orientation)
+            if originals.wants_master(retention):
+                cost += originals.estimate_master_cost(
+                    header, retention.get('max_edge', originals.DEFAULT_MAX_EDGE))
     except Exception as e:
         print(f"Invalid image {original_name}: {e}")
+        metrics.inc("inkframe_uploads_total", result="invalid")
         return None
 
+    # Wait for room in the processing budget, or let the client retry later
+    if not admission.acquire(cost, timeout=admission_timeout):
+        metrics.inc("inkframe_uploads_total", result="busy")
+        raise admission.Busy()
+
     filename = sanitize_filename(original_name)
     original_path = ORIGINALS_DIR / filename
-
-    # Save validated original
-    original_path.write_bytes(file_data)
-    file_size = len(file_data)
-    del file_data  # Free memory
-
+    offload_path = None
     display_path = None
-    thumb_path = None
     try:
-        # Capture format before exif_transpose (which returns a new Image without .format)
-        img_format = img.format
-        mime_type = Image.MIME.get(img_format, 'image/jpeg')
+        # Save the validated original (or its bounded master), then decode from
+        # disk so the upload buffer is freed before any pixels are allocated
+        original_path, offload_path = originals.store(file_data, ORIGINALS_DIR, filename, retention)
+        file_size = len(file_data)
+        del file_data
 
-        # Apply EXIF orientation transpose
-        img = ImageOps.exif_transpose(img)
-
-        # Get remaining metadata
-        date_taken = get_exif_date(img)
-        orig_width, orig_height = img.size
-
-        # Convert to RGB for processing
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+        # One reduced-size decode feeds every rendition
+        img, meta = open_rendition_source(original_path, orientation)
 
-        # Create display version (600x448 PNG)
+        # Create display version (600x448, in the configured cache format)
         display_img = resize_for_display(img, fit_mode, crop_mode=crop_mode,
-                                         orientation=orientation)
-        display_filename = Path(filename).stem + ".png"
-        display_path = DISPLAY_DIR / display_filename
-        display_img.save(str(display_path), "PNG")
-
-        # Create thumbnail (300x200 JPEG)
-        thumb = img.copy()
-        thumb.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
-        thumb_filename = Path(filename).stem + ".jpg"
-        thumb_path = THUMBNAILS_DIR / thumb_filename
-        thumb.save(str(thumb_path), "JPEG", quality=85)
+                                         orientation=orientation, tone=tone)
+        display_path = display_cache.path_for(DISPLAY_DIR / Path(filename).stem, cache_format)
+        with metrics.timer("inkframe_stage_seconds", stage="encode"):
+            display_cache.save(display_img, display_path, cache_format)
+
+        # The thumbnail is rendered on first request (see get_thumbnail)
+        thumb_path = THUMBNAILS_DIR / (Path(filename).stem + ".jpg")
+        perceptual_hash = phash.dhash(img)
 
+        metrics.inc("inkframe_uploads_total", result="ok")
         return {
-            'filename': filename,
+            'filename': original_path.name,
             'original_path': str(original_path),
             'display_path': str(display_path),
             'thumbnail_path': str(thumb_path),
-            'width': orig_width,
-            'height': orig_height,
+            'width': upright[0],
+            'height': upright[1],
             'file_size': file_size,
             'mime_type': mime_type,
-            'date_taken': date_taken,
+            'date_taken': meta['date_taken'],
+            'content_hash': content_hash,
+            'phash': perceptual_hash,
         }
 
     except Exception as e:
         # Clean up all files created so far
         original_path.unlink(missing_ok=True)
+        if offload_path:
+            offload_path.unlink(missing_ok=True)
         if display_path:
             display_path.unlink(missing_ok=True)
-        if thumb_path:
-            thumb_path.unlink(missing_ok=True)
         print(f"Error processing upload {original_name}: {e}")
+        metrics.inc("inkframe_uploads_total", result="error")
         return None
+    finally:
+        admission.release(cost)
 
 
 def delete_photo_files(photo_dict):
     """Delete all files associated with a photo record"""
-    for key in ['original_path', 'display_path', 'thumbnail_path']:
+    for key in ['original_path', 'display_path']:
         path = photo_dict.get(key)
         if path:
             Path(path).unlink(missing_ok=True)
+    if photo_dict.get('thumbnail_path'):
+        thumb = Path(photo_dict['thumbnail_path'])
+        thumbnails.discard(thumb.parent, thumb.name)
+    if photo_dict.get('content_hash'):
+        renders.discard_photo(RENDERS_DIR, photo_dict['content_hash'])
+
+
+def _thumbnail_source(photo):
+    """
+    Upright RGB image to render a photo's thumbnail from: the original,
+    decoded at draft scale, or the display image if the original is gone.
+
+    Raises:
+        admission.Busy: the processing budget stayed full for THUMBNAIL_WAIT
+    """
+    original = Path(photo['original_path'])
+    if original.exists():
+        with Image.open(original) as header:
+            exif_orientation = header.getexif().get(EXIF_ORIENTATION, 1)
+            w, h = header.size
+            upright_w, upright_h = (h, w) if exif_orientation in (5, 6, 7, 8) else (w, h)
+            scale = min(1.0, max(thumbnails.SIZE[0] / upright_w, thumbnails.SIZE[1] / upright_h))
+            target = (max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale)))
+            if header.format == 'JPEG':
+                header.draft('RGB', target)
+            cost = 4 * header.size[0] * header.size[1] * 2
+        with admission.reserve(cost, timeout=THUMBNAIL_WAIT), Image.open(original) as img:
+            if img.format == 'JPEG':
+                img.draft('RGB', target)
+            img = img.convert('RGB')
+            method = _EXIF_TRANSPOSE.get(exif_orientation)
+            return img.transpose(method) if method is not None else img
+    if Path(photo['display_path']).exists():
+        return display_cache.load(photo['display_path'])
+    return None
+
+
+def get_thumbnail(name):
+    """
+    Path of the gallery thumbnail `name` ("<stem>.jpg"), rendering it on a
+    cache miss. Returns None for unknown photos, before touching the disk.
+    Raises admission.Busy if rendering could not get the processing budget.
+    """
+    if not thumbnails.valid_name(name):
+        return None
+    photo = models.get_photo_by_thumbnail(str(THUMBNAILS_DIR / name))
+    if photo is None:
+        return None
+
+    def open_source():
+        with metrics.timer("inkframe_stage_seconds", stage="thumbnail"):
+            return _thumbnail_source(photo)
+
+    return thumbnails.get(THUMBNAILS_DIR, name, open_source)
+
+
+def backfill_content_hashes():
+    """
+    Hash the originals of photos uploaded before content hashing existed.
+
+    Photos whose original matches an already-hashed photo are reported as
+    duplicates and left unhashed (the unique index allows one owner per hash).
+
+    Returns:
+        dict with keys: hashed, missing, duplicates (list of {id, duplicate_of})
+    """
+    global _hash_backfill_report
+    report = {'hashed': 0, 'missing': 0, 'duplicates': []}
+    try:
+        for photo in models.get_photos_without_hash():
+            background.wait_idle("hash_backfill")
+            path = Path(photo['original_path'])
+            if not path.exists():
+                report['missing'] += 1
+                continue
+            try:
+                content_hash = hash_file(path)
+            except OSError as e:
+                log.warning("Failed to hash %s: %s", path.name, e)
+                continue
+            if models.set_content_hash(photo['id'], content_hash):
+                report['hashed'] += 1
+            else:
+                report['duplicates'].append({
+                    'id': photo['id'],
+                    'duplicate_of': models.get_photo_id_by_hash(content_hash),
+                })
+        if report['hashed'] or report['duplicates']:
+            log.info("Content hash backfill: %d hashed, %d duplicates, %d missing",
+                     report['hashed'], len(report['duplicates']), report['missing'])
+        _hash_backfill_report = report
+        return report
+    finally:
+        models.close_db()
+
+
+def backfill_perceptual_hashes():
+    """
+    Compute dHashes for photos uploaded before perceptual hashing, from their
+    thumbnails (rendered again if evicted). Returns count hashed.
+    """
+    count = 0
+    try:
+        for photo in models.get_photos_without_phash():
+            background.wait_idle("phash_backfill")
+            try:
+                thumb_path = get_thumbnail(Path(photo['thumbnail_path']).name)
+                if thumb_path is None:
+                    continue
+                with Image.open(thumb_path) as thumb:
+                    models.set_phash(photo['id'], phash.dhash(thumb))
+                count += 1
+            except OSError as e:
+                log.warning("Failed to phash %s: %s", photo['thumbnail_path'], e)
+        if count:
+            phash.invalidate()
+            log.info("Perceptual hash backfill: %d photos", count)
+        return count
+    finally:
+        models.close_db()
+
+
+def get_hash_backfill_report():
+    """Last backfill_content_hashes() result, or None if it hasn't run yet"""
+    return _hash_backfill_report
 
 
-def _save_display_state(fit_mode, crop_mode, orientation):
-    """Save the current display processing state to a marker file."""
+def _save_display_state(fit_mode, crop_mode, orientation, cache_format, rendered=None,
+                        tone=None, render_version=None):
+    """
+    Save the current display processing state to a marker file.
+
+    rendered maps display image stems to the render key they were rendered
+    with when that differs from the state's own (an interrupted reprocess).
+    tone parameters are stored alongside, as in the display settings.
+    render_version is the RENDER_VERSION the state's own images came from
+    (default: this one); the rendered entries are always this version's.
+    """
+    state = {'fit_mode': fit_mode, 'crop_mode': crop_mode,
+             'orientation': orientation, 'cache_format': cache_format,
+             'render_version': render_version or RENDER_VERSION}
+    state.update(tone or {})
+    if rendered:
+        state['rendered'] = rendered
+        state['rendered_version'] = RENDER_VERSION
     try:
         DISPLAY_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
         with open(DISPLAY_STATE_FILE, 'w') as f:
-            json.dump({'fit_mode': fit_mode, 'crop_mode': crop_mode,
-                       'orientation': orientation}, f)
+            json.dump(state, f)
     except Exception as e:
         log.warning("Failed to save display state: %s", e)
 
 
+def _render_key(fit_mode, crop_mode, orientation, tone=None):
+    """What a display render depends on; crop_mode only matters in cover mode"""
+    key = f"{fit_mode}/{crop_mode if fit_mode == 'cover' else '-'}/{orientation}"
+    return f"{key}/{tonemap.key(tone)}" if tone is not None else key
+
+
+def _state_version(state):
+    """RENDER_VERSION a saved state's display images were rendered with;
+    states from before it was recorded are version 1"""
+    return state.get('render_version', 1)
+
+
+def _rendered_keys(state):
+    """A saved state's rendered map, empty if an older pipeline wrote it"""
+    if not state or state.get('rendered_version', _state_version(state)) != RENDER_VERSION:
+        return {}
+    return state.get('rendered', {})
+
+
+def _state_render_key(state):
+    """Render key of the display images a saved state describes, or None
+    (also when an older pipeline rendered them: nothing is up to date)"""
+    if not state or 'fit_mode' not in state or _state_version(state) != RENDER_VERSION:
+        return None
+    return _render_key(state['fit_mode'], state.get('crop_mode', 'center'),
+                       state.get('orientation', 'horizontal'), tonemap.from_settings(state))
+
+
 def get_display_state():
     """Read the last-processed display state. Returns dict or None."""
     try:
@@ -398,59 +803,504 @@ def get_display_state():
         return None
 
 
-def reprocess_needed(last_state, fit_mode, crop_mode, orientation):
+def reprocess_needed(last_state, fit_mode, crop_mode, orientation, tone=None):
     """
     Decide whether display images must be regenerated given the last-processed
     state (dict or None). crop_mode only affects output in cover mode.
     """
     if last_state is None:
         return True
+    if _state_version(last_state) != RENDER_VERSION:
+        return True  # rendered by an older pipeline, e.g. smart crop before saliency
+    key = _render_key(fit_mode, crop_mode, orientation, tone)
+    if any(k != key for k in _rendered_keys(last_state).values()):
+        return True  # an interrupted reprocess left photos rendered for other settings
     if last_state.get('fit_mode') != fit_mode:
         return True
     if last_state.get('orientation', 'horizontal') != orientation:
         return True
     if fit_mode == 'cover' and last_state.get('crop_mode') != crop_mode:
         return True
+    if tonemap.from_settings(last_state) != tone:
+        return True
     return False
 
 
-def reprocess_display_images(fit_mode="contain", crop_mode="center", orientation="horizontal"):
+def migration_needed(last_state, cache_format):
+    """Whether existing display images are stored in a different format.
+    Images rendered before formats were configurable are PNG."""
+    if last_state is None:
+        return False
+    return last_state.get('cache_format', 'png') != cache_format
+
+
+def _replace_display_path(old_path, new_path):
+    """Point the photo row at a re-encoded display image and drop the old file"""
+    if old_path == new_path:
+        return
+    models.set_display_path(str(old_path), str(new_path))
+    Path(old_path).unlink(missing_ok=True)
+
+
+def migrate_display_cache(cache_format=display_cache.DEFAULT_FORMAT):
+    """
+    Re-encode existing display images into cache_format without re-rendering
+    them from the originals, after any running reprocess. Settings changes go
+    through request_reprocess instead, so the latest one wins. Returns the
+    number of images converted.
+    """
+    with _reprocess_lock:
+        return _migrate(cache_format)
+
+
+def _migrate(cache_format):
+    """migrate_display_cache body; caller holds _reprocess_lock"""
+    try:
+        count = 0
+        for photo in models.get_all_photos():
+            background.wait_idle("migrate")
+            old_path = Path(photo['display_path'])
+            try:
+                if display_cache.format_of(old_path) == cache_format:
+                    continue
+                new_path = display_cache.path_for(old_path, cache_format)
+                img = display_cache.load(old_path)
+                with metrics.timer("inkframe_stage_seconds", stage="encode"):
+                    display_cache.save(img, new_path, cache_format)
+                _replace_display_path(old_path, new_path)
+                count += 1
+            except Exception as e:
+                log.error("Error migrating %s: %s", old_path.name, e)
+
+        last_state = get_display_state() or {}
+        _save_display_state(last_state.get('fit_mode', 'contain'),
+                            last_state.get('crop_mode', 'center'),
+                            last_state.get('orientation', 'horizontal'), cache_format,
+                            rendered=_rendered_keys(last_state),
+                            tone=tonemap.from_settings(last_state),
+                            render_version=_state_version(last_state) if last_state else None)
+        if count:
+            phash.invalidate()
+        log.info("Display cache migrated to %s: %d images", cache_format, count)
+        return count
+    finally:
+        models.close_db()
+
+
+def get_reprocess_status():
+    """
+    Progress of the running or last reprocess: state (idle, running, done,
+    cancelled), processed, total, errors, elapsed_seconds, images_per_minute,
+    eta_seconds and the settings being rendered. total counts the photos to
+    render; skipped ones were up to date and restored ones were swapped in
+    from the render store.
+    """
+    with _reprocess_cond:
+        status = dict(_reprocess_status)
+    if 'started' in status:
+        end = status.pop('finished', None) or time.monotonic()
+        elapsed = end - status.pop('started')
+        status['elapsed_seconds'] = round(elapsed, 1)
+        rate = status['processed'] / elapsed if elapsed > 0 else 0
+        status['images_per_minute'] = round(rate * 60, 1)
+        remaining = status['total'] - status['processed']
+        status['eta_seconds'] = round(remaining / rate) if rate and status['state'] == 'running' \
+            else None
+    return status
+
+
+def cancel_reprocess():
+    """Ask the running reprocess to stop after the current image. Returns False if none runs.
+    A cancelled run leaves the display state unsaved, so the startup check finishes it later."""
+    with _reprocess_cond:
+        if _reprocess_status['state'] != 'running':
+            return False
+        _reprocess_cancel.set()
+        return True
+
+
+def prioritize_reprocess(display_path):
+    """Render this photo next if the running reprocess hasn't reached it. Returns True if bumped."""
+    stem = Path(display_path).stem
+    with _reprocess_cond:
+        if stem not in _reprocess_pending:
+            return False
+        if stem in _reprocess_priority:
+            _reprocess_priority.remove(stem)
+        _reprocess_priority.insert(0, stem)
+        return True
+
+
+def wait_for_render(display_path, timeout=RENDER_WAIT):
+    """
+    Make sure a photo about to be shown has its up-to-date render: bump it
+    to the front of a running reprocess and wait up to `timeout` seconds.
+
+    Returns:
+        the display path to show (its extension changes with the cache format)
+    """
+    stem = Path(display_path).stem
+    prioritize_reprocess(display_path)
+    with _reprocess_cond:
+        _reprocess_cond.wait_for(lambda: stem not in _reprocess_pending
+                                 and _reprocess_status.get('current') != stem, timeout)
+        rendered = _reprocess_rendered.get(stem)
+    if rendered:
+        return rendered
+    if Path(display_path).exists():
+        return display_path
+    # Re-encoded since the caller read it: the database has the new path
+    base = Path(display_path)
+    candidates = [str(base.with_suffix(ext)) for ext in sorted(set(display_cache.EXTENSIONS.values()))]
+    return models.find_display_path(candidates) or display_path
+
+
+def _variant_name(content_hash, render_key, fmt):
+    """Render store name of a photo's display image for a render key and format"""
+    width, height = get_display_size()
+    return renders.variant_name(content_hash, f"{render_key}/{width}x{height}/{fmt}/v{RENDER_VERSION}",
+                                display_cache.EXTENSIONS[fmt])
+
+
+def _swap_variant(stem, content_hash, current_key, target_key, cache_format):
+    """
+    Keep a photo's current display render in the render store and move a
+    stored render for the target settings into its place.
+
+    Returns:
+        the display path if a stored render was swapped in, None if the
+        photo has to be rendered
+    """
+    base = DISPLAY_DIR / stem
+    current = [p for p in map(base.with_suffix, set(display_cache.EXTENSIONS.values()))
+               if p.exists()]
+    target = display_cache.path_for(base, cache_format)
+    # Taken out before stashing, so stashing can't evict it
+    restoring = target.with_name(target.name + ".restore")
+    found = renders.take(RENDERS_DIR, _variant_name(content_hash, target_key, cache_format),
+                         restoring)
+    if current_key is not None and current_key != target_key:
+        for path in current:
+            try:
+                renders.put(RENDERS_DIR, _variant_name(content_hash, current_key,
+                                                       display_cache.format_of(path)), path)
+            except OSError as e:
+                log.warning("Could not keep %s in the render store: %s", path.name, e)
+    if not found:
+        return None
+    os.replace(restoring, target)
+    for path in current:
+        if path != target:
+            _replace_display_path(path, target)
+    return target
+
+
+def _next_original():
+    """Pop the next original to render, prioritized stems first. Caller holds _reprocess_cond."""
+    while _reprocess_priority:
+        stem = _reprocess_priority.pop(0)
+        if stem in _reprocess_pending:
+            return stem, _reprocess_pending.pop(stem)
+    stem = next(iter(_reprocess_pending))
+    return stem, _reprocess_pending.pop(stem)
+
+
+def request_reprocess(fit_mode="contain", crop_mode="center", orientation="horizontal",
+                      cache_format=display_cache.DEFAULT_FORMAT, delay=REPROCESS_DEBOUNCE,
+                      tone=None):
+    """
+    Bring the display images to these settings in the background.
+
+    Requests within `delay` seconds of each other are coalesced into one run
+    of the latest settings. A running reprocess for other settings is
+    cancelled; the new run starts once it has stopped and skips photos that
+    are already rendered for the target. When only the storage format
+    differs, the renders are converted instead (see migrate_display_cache)
+    and a running reprocess is left to finish first.
+    """
+    global _requested, _request_timer
+    target = {'fit_mode': fit_mode, 'crop_mode': crop_mode,
+              'orientation': orientation, 'cache_format': cache_format, 'tone': tone}
+    with _request_lock:
+        _requested = target
+        with _reprocess_cond:
+            obsolete = _reprocess_status.get('state') == 'running' and \
+                any(_reprocess_status.get(k) != v for k, v in target.items()
+                    if k != 'cache_format')
+        if obsolete:
+            log.info("Cancelling obsolete reprocess for fit_mode=%s",
+                     _reprocess_status.get('fit_mode'))
+            cancel_reprocess()
+        if _request_timer is not None:
+            _request_timer.cancel()
+        _request_timer = threading.Timer(delay, _run_requested)
+        _request_timer.daemon = True
+        _request_timer.start()
+
+
+def _run_requested():
+    """Run the latest requested reprocess, waiting for a running one to stop first"""
+    global _requested
+    background.lower_priority()
+    with _reprocess_lock:
+        with _request_lock:
+            target, _requested = _requested, None
+        if target is None:
+            return
+        state = get_display_state()
+        if migration_needed(state, target['cache_format']) and not reprocess_needed(
+                state, target['fit_mode'], target['crop_mode'], target['orientation'],
+                target['tone']):
+            _migrate(target['cache_format'])
+        else:
+            _reprocess(**target, only_stale=True)
+
+
+def reprocess_display_images(fit_mode="contain", crop_mode="center", orientation="horizontal",
+                             cache_format=display_cache.DEFAULT_FORMAT, only_stale=False,
+                             tone=None):
     """
     Reprocess all display images from originals (e.g. after fit_mode change).
-    Returns count of reprocessed images. No-ops if already running.
+    With only_stale, photos already rendered for these settings are skipped.
+    Renders for earlier settings are kept in the render store (see renders),
+    and photos with a stored render for these settings get it back instead
+    of being rendered again.
+    Progress is reported by get_reprocess_status(); cancel_reprocess() stops
+    it and prioritize_reprocess() reorders it. Returns count of reprocessed
+    images (rendered or restored). No-ops if already running.
     """
     if not _reprocess_lock.acquire(blocking=False):
         log.info("Reprocess already in progress, skipping")
         return 0
+    try:
+        return _reprocess(fit_mode, crop_mode, orientation, cache_format, only_stale, tone)
+    finally:
+        _reprocess_lock.release()
+
+
+def _reprocess(fit_mode, crop_mode, orientation, cache_format, only_stale, tone=None):
+    """reprocess_display_images body; caller holds _reprocess_lock"""
     try:
         log.info("Reprocessing display images: fit_mode=%s, crop_mode=%s, orientation=%s",
                  fit_mode, crop_mode, orientation)
         ensure_dirs()
         count = 0
         errors = 0
-        for original in ORIGINALS_DIR.iterdir():
-            if original.suffix.lower() not in ALLOWED_EXTENSIONS:
+        renamed = False
+        last_state = get_display_state()
+        base_key = _state_render_key(last_state)
+        rendered_keys = dict(_rendered_keys(last_state))
+        target_key = _render_key(fit_mode, crop_mode, orientation, tone)
+        originals_list = sorted(p for p in ORIGINALS_DIR.iterdir()
+                                if p.suffix.lower() in ALLOWED_EXTENSIONS)
+        skipped = 0
+        if only_stale:
+            todo = [p for p in originals_list
+                    if rendered_keys.get(p.stem, base_key) != target_key
+                    or not display_cache.path_for(DISPLAY_DIR / p.stem, cache_format).exists()]
+            skipped = len(originals_list) - len(todo)
+            originals_list = todo
+
+        # Renders kept from earlier settings are swapped back in, not re-rendered
+        photos = {Path(p['display_path']).stem: p for p in models.get_all_photos()}
+        restored = {}
+        todo = []
+        for original in originals_list:
+            photo = photos.get(original.stem)
+            path = None
+            if photo and photo.get('content_hash'):
+                path = _swap_variant(original.stem, photo['content_hash'],
+                                     rendered_keys.get(original.stem, base_key), target_key,
+                                     cache_format)
+            if path is None:
+                todo.append(original)
+                continue
+            restored[original.stem] = str(path)
+            rendered_keys[original.stem] = target_key
+            renamed = renamed or Path(photo['display_path']).suffix != path.suffix
+        originals_list = todo
+        if restored:
+            metrics.inc("inkframe_reprocessed_total", len(restored), result="restored")
+
+        def checkpoint():
+            """Remember what was re-rendered, so the next run can skip it"""
+            if last_state and 'fit_mode' in last_state:
+                _save_display_state(last_state['fit_mode'], last_state.get('crop_mode', 'center'),
+                                    last_state.get('orientation', 'horizontal'),
+                                    last_state.get('cache_format', 'png'),
+                                    rendered={s: k for s, k in rendered_keys.items()
+                                              if k != base_key},
+                                    tone=tonemap.from_settings(last_state),
+                                    render_version=_state_version(last_state))
+
+        def interrupted():
+            return _reprocess_cancel.is_set() or bool(_reprocess_priority)
+
+        with _reprocess_cond:
+            _reprocess_cancel.clear()
+            _reprocess_pending.clear()
+            _reprocess_pending.update((p.stem, p) for p in originals_list)
+            _reprocess_priority.clear()
+            _reprocess_rendered.clear()
+            _reprocess_rendered.update(restored)
+            _reprocess_status.clear()
+            _reprocess_status.update({
+                'state': 'running', 'processed': 0, 'total': len(originals_list), 'errors': 0,
+                'skipped': skipped, 'restored': len(restored),
+                'fit_mode': fit_mode, 'crop_mode': crop_mode, 'orientation': orientation,
+                'cache_format': cache_format, 'tone': tone, 'started': time.monotonic(),
+            })
+        while True:
+            with _reprocess_cond:
+                if not _reprocess_pending or _reprocess_cancel.is_set():
+                    break
+                urgent = bool(_reprocess_priority)
+            # A photo someone is waiting for is rendered even when the frame is busy
+            if not urgent and not background.wait_idle("reprocess", interrupt=interrupted,
+                                                        on_pause=checkpoint):
                 continue
+            with _reprocess_cond:
+                stem, original = _next_original()
+                _reprocess_status['current'] = stem
+            display_path = None
             try:
-                img = Image.open(str(original))
-                img = ImageOps.exif_transpose(img)
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-
-                display_img = resize_for_display(img, fit_mode, crop_mode=crop_mode,
-                                                 orientation=orientation)
-                display_filename = original.stem + ".png"
-                display_path = DISPLAY_DIR / display_filename
-                display_img.save(str(display_path), "PNG")
+                with Image.open(original) as header:
+                    cost = estimate_render_cost(header, orientation)
+                with admission.reserve(cost):
+                    img, _ = open_rendition_source(original, orientation)
+                    display_img = resize_for_display(img, fit_mode, crop_mode=crop_mode,
+                                                     orientation=orientation, tone=tone)
+                    display_path = display_cache.path_for(DISPLAY_DIR / original.stem, cache_format)
+                    with metrics.timer("inkframe_stage_seconds", stage="encode"):
+                        display_cache.save(display_img, display_path, cache_format)
+                    del img, display_img
+                # A format change leaves the previous encoding behind
+                for ext in set(display_cache.EXTENSIONS.values()) - {display_path.suffix}:
+                    stale = display_path.with_suffix(ext)
+                    if stale.exists():
+                        _replace_display_path(stale, display_path)
+                        renamed = True
                 count += 1
+                rendered_keys[stem] = target_key
+                metrics.inc("inkframe_reprocessed_total", result="ok")
             except Exception as e:
                 errors += 1
+                metrics.inc("inkframe_reprocessed_total", result="error")
                 log.error("Error reprocessing %s: %s", original.name, e)
             finally:
                 gc.collect()
+                with _reprocess_cond:
+                    _reprocess_rendered[stem] = str(display_path) if display_path else None
+                    _reprocess_status['current'] = None
+                    _reprocess_status['processed'] = count + errors
+                    _reprocess_status['errors'] = errors
+                    _reprocess_cond.notify_all()
+
+        cancelled = _reprocess_cancel.is_set()
+        if not cancelled:
+            _save_display_state(fit_mode, crop_mode, orientation, cache_format, tone=tone)
+        else:
+            checkpoint()
+        if renamed:
+            phash.invalidate()
+        if cancelled:
+            log.info("Reprocess cancelled: %d ok, %d errors, %d left",
+                     count, errors, len(_reprocess_pending))
+        else:
+            log.info("Reprocess complete: %d ok, %d restored, %d errors",
+                     count, len(restored), errors)
+        return count + len(restored)
+    finally:
+        with _reprocess_cond:
+            if _reprocess_status.get('state') == 'running':
+                _reprocess_status['state'] = 'cancelled' if _reprocess_cancel.is_set() else 'done'
+                _reprocess_status['finished'] = time.monotonic()
+            _reprocess_pending.clear()
+            _reprocess_priority.clear()
+            _reprocess_rendered.clear()
+            _reprocess_cond.notify_all()
 
-        _save_display_state(fit_mode, crop_mode, orientation)
-        log.info("Reprocess complete: %d ok, %d errors", count, errors)
-        return count
+
+def compact_originals(retention):
+    """
+    Apply a "master" retention policy to the existing library: replace each
+    original larger than max_edge with its bounded master, offloading the full
+    file first if an offload directory is set.
+
+    Photos not yet content-hashed are skipped, so dedup still sees the hash
+    of the real upload. A failed offload leaves that photo untouched.
+
+    Args:
+        retention: settings["originals"] dict
+
+    Returns:
+        report dict: photos, compacted, offloaded, skipped, missing, errors,
+        bytes_before, bytes_after, saved_bytes; None if the policy keeps
+        full originals. Waits for a running reprocess to finish first.
+    """
+    global _compaction_report
+    if not originals.wants_master(retention):
+        return None
+    _compaction_report = None
+    if not _reprocess_lock.acquire(blocking=False):
+        log.info("Reprocess in progress, compacting originals once it is done")
+        _reprocess_lock.acquire()
+    max_edge = retention.get('max_edge', originals.DEFAULT_MAX_EDGE)
+    offload_dir = retention.get('offload_dir')
+    report = {'photos': 0, 'compacted': 0, 'offloaded': 0, 'skipped': 0, 'missing': 0,
+              'errors': 0, 'bytes_before': 0, 'bytes_after': 0, 'saved_bytes': 0}
+    try:
+        for photo in models.get_all_photos():
+            background.wait_idle("compact")
+            report['photos'] += 1
+            path = Path(photo['original_path'])
+            if not path.exists():
+                report['missing'] += 1
+                continue
+            if not photo.get('content_hash'):
+                report['skipped'] += 1
+                continue
+            try:
+                with Image.open(path) as header:
+                    if originals.master_size(header.size, max_edge) is None:
+                        continue
+                    cost = originals.estimate_master_cost(header, max_edge)
+                with admission.reserve(cost):
+                    master = originals.encode_master(path, max_edge)
+                size = path.stat().st_size
+                if master is None or len(master) >= size:
+                    continue
+                if offload_dir:
+                    originals.offload(path, offload_dir, path.name)
+                    report['offloaded'] += 1
+
+                master_path = path.with_suffix('.jpg')
+                tmp = master_path.with_name(master_path.name + '.tmp')
+                tmp.write_bytes(master)
+                tmp.replace(master_path)
+                if master_path != path:
+                    models.set_original_path(photo['id'], str(master_path), master_path.name)
+                    path.unlink(missing_ok=True)
+                report['compacted'] += 1
+                report['bytes_before'] += size
+                report['bytes_after'] += len(master)
+            except Exception as e:
+                report['errors'] += 1
+                log.error("Error compacting %s: %s", path.name, e)
+            finally:
+                gc.collect()
+
+        report['saved_bytes'] = report['bytes_before'] - report['bytes_after']
+        log.info("Originals compaction: %d of %d photos, %.1f MB saved, %d offloaded, %d errors",
+                 report['compacted'], report['photos'], report['saved_bytes'] / 1e6,
+                 report['offloaded'], report['errors'])
+        _compaction_report = report
+        return report
     finally:
         _reprocess_lock.release()
+        models.close_db()
+
+
+def get_compaction_report():
+    """Last compact_originals() result, or None if it hasn't run yet"""
+    return _compaction_report
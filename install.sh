@@ -85,9 +85,9 @@ sudo cp captive-dnsmasq.conf /etc/NetworkManager/dnsmasq-shared.d/inkframe-capti
 
 # Install and enable systemd service
 echo "Installing systemd service..."
-sudo cp inkframe.service /etc/systemd/system/
+sudo cp inkframe.service inkframe.socket /etc/systemd/system/
 sudo systemctl daemon-reload
-sudo systemctl enable inkframe
+sudo systemctl enable inkframe.socket inkframe
 
 echo ""
 echo "=== Installation Complete ==="
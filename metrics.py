@@ -0,0 +1,165 @@
+"""Lightweight in-process metrics: counters, gauges and timing histograms.
+
+Rendered in Prometheus text exposition format at /api/metrics so a fleet of
+frames can be scraped. Everything lives in module-level dicts behind one lock;
+there are no external dependencies and recording costs a dict lookup.
+"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds. Covers a fast DB query up to a full ~30s e-ink refresh.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "inkframe_stage_seconds": "Time spent in each image pipeline stage",
+    "inkframe_display_seconds": "Time spent driving the e-ink panel",
+    "inkframe_db_query_seconds": "Time spent in SQLite queries",
+    "inkframe_command_seconds": "Time spent in external commands (nmcli)",
+    "inkframe_scheduler_tick_seconds": "Time spent in a slideshow scheduler tick",
+    "inkframe_uploads_total": "Uploads processed, by result",
+    "inkframe_reprocessed_total": "Display images reprocessed, by result",
+    "inkframe_display_updates_total": "Panel updates requested, by result",
+    "inkframe_display_busy": "1 while the e-ink panel is refreshing",
+    "inkframe_slideshow_running": "1 while the slideshow cycle job is scheduled",
+    "inkframe_processing_reserved_bytes": "Estimated pixel memory reserved by running image jobs",
+    "inkframe_processing_queued": "Image jobs waiting for processing budget",
+    "inkframe_boot_refresh_skipped_total": "Boots that kept the photo already on the panel",
+    "inkframe_background_pauses_total": "Background maintenance pauses for foreground work, by task",
+    "inkframe_screen_cache_total": "Info/message screen cache lookups, by result",
+}
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> float
+_gauges = {}      # (name, labels) -> float
+_histograms = {}  # (name, labels) -> [bucket_counts list, sum, count]
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Increment a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to an absolute value."""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def observe(name, value, **labels):
+    """Record one observation (in seconds) into a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = [[0] * len(DEFAULT_BUCKETS), 0.0, 0]
+            _histograms[key] = hist
+        buckets = hist[0]
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                buckets[i] += 1
+        hist[1] += value
+        hist[2] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """Time the enclosed block into histogram `name`, even if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorator form of timer()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_histogram(name, **labels):
+    """Return (count, sum) for a histogram series, or None. Used by tests and status."""
+    with _lock:
+        hist = _histograms.get(_key(name, labels))
+        return (hist[2], hist[1]) if hist else None
+
+
+def get_counter(name, **labels):
+    """Return the current value of a counter series (0 if never incremented)."""
+    with _lock:
+        return _counters.get(_key(name, labels), 0)
+
+
+def reset():
+    """Drop all recorded series (tests)."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + (list(extra) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _header(lines, name, kind, seen):
+    if name in seen:
+        return
+    seen.add(name)
+    if name in HELP:
+        lines.append(f"# HELP {name} {HELP[name]}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render_prometheus():
+    """Render every recorded series in Prometheus text format (version 0.0.4)."""
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+        histograms = sorted((k, [list(v[0]), v[1], v[2]]) for k, v in _histograms.items())
+
+    lines = []
+    seen = set()
+    for (name, labels), value in counters:
+        _header(lines, name, "counter", seen)
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), value in gauges:
+        _header(lines, name, "gauge", seen)
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), (buckets, total, count) in histograms:
+        _header(lines, name, "histogram", seen)
+        for bound, n in zip(DEFAULT_BUCKETS, buckets):
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {n}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
@@ -1,11 +1,14 @@
 """SQLite database models and JSON settings for InkFrame"""
 
+import copy
 import sqlite3
 import json
 import threading
 from datetime import datetime
 from pathlib import Path
 
+import metrics
+
 DB_PATH = Path(__file__).parent / "config" / "photos.db"
 SETTINGS_PATH = Path(__file__).parent / "config" / "settings.json"
 
@@ -18,16 +21,30 @@ DEFAULT_SETTINGS = {
         "orientation": "horizontal",
         "fit_mode": "contain",
         "saturation": 0.5,
-        "crop_mode": "center"
+        "crop_mode": "center",
+        "cache_format": "raw",
+        "dither": "diffusion",
+        "contrast": 1.0,
+        "gamma": 1.0,
+        "color_boost": 1.0
     },
     "slideshow": {
         "order": "random",
         "interval_minutes": 60,
         "enabled": True,
-        "auto_start": True
+        "auto_start": True,
+        "one_per_cluster": False,
+        "align_to_clock": False
+    },
+    "originals": {
+        "retention": "full",
+        "max_edge": 2400,
+        "offload_dir": ""
     },
     "upload": {
-        "max_file_size_mb": 20
+        "max_file_size_mb": 20,
+        "resize_in_browser": False,
+        "resize_max_edge": 2400
     }
 }
 
@@ -73,18 +90,37 @@ def init_db():
             date_taken TEXT,
             uploaded_at TEXT NOT NULL,
             display_order INTEGER DEFAULT 0,
-            is_favorite INTEGER DEFAULT 0
+            is_favorite INTEGER DEFAULT 0,
+            content_hash TEXT,
+            phash TEXT
         )
     ''')
 
+    # Migrate databases created before content/perceptual hashing
+    _add_column_if_missing(cursor, 'photos', 'content_hash', 'TEXT')
+    _add_column_if_missing(cursor, 'photos', 'phash', 'TEXT')
+    # NULLs don't collide, so photos not yet backfilled are unaffected
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_photos_content_hash '
+                   'ON photos(content_hash)')
+    # Every gallery thumbnail request looks its photo up by path
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_photos_thumbnail_path '
+                   'ON photos(thumbnail_path)')
+
     conn.commit()
 
 
+def _add_column_if_missing(cursor, table, column, decl):
+    """ALTER TABLE ADD COLUMN unless the column already exists"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
 def load_settings():
     """Load settings from JSON file"""
     if not SETTINGS_PATH.exists():
         save_settings(DEFAULT_SETTINGS)
-        return DEFAULT_SETTINGS.copy()
+        return copy.deepcopy(DEFAULT_SETTINGS)
 
     try:
         with open(SETTINGS_PATH, 'r') as f:
@@ -110,7 +146,7 @@ def load_settings():
 
         return merged
     except (json.JSONDecodeError, IOError):
-        return DEFAULT_SETTINGS.copy()
+        return copy.deepcopy(DEFAULT_SETTINGS)
 
 
 def save_settings(settings):
@@ -134,24 +170,62 @@ def update_settings(updates):
 
 # Photo CRUD operations
 
+@metrics.timed("inkframe_db_query_seconds", query="add_photo")
 def add_photo(filename, original_path, display_path, thumbnail_path,
-              width=None, height=None, file_size=None, mime_type=None, date_taken=None):
-    """Add a photo record"""
+              width=None, height=None, file_size=None, mime_type=None, date_taken=None,
+              content_hash=None, phash=None):
+    """Add a photo record. Raises sqlite3.IntegrityError if content_hash already exists."""
     conn = get_db()
     cursor = conn.cursor()
 
     cursor.execute('''
         INSERT INTO photos (filename, original_path, display_path, thumbnail_path,
-                           width, height, file_size, mime_type, date_taken, uploaded_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                           width, height, file_size, mime_type, date_taken, uploaded_at,
+                           content_hash, phash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (filename, original_path, display_path, thumbnail_path,
-          width, height, file_size, mime_type, date_taken, datetime.now().isoformat()))
+          width, height, file_size, mime_type, date_taken, datetime.now().isoformat(),
+          content_hash, phash))
 
     conn.commit()
     photo_id = cursor.lastrowid
     return photo_id
 
 
+@metrics.timed("inkframe_db_query_seconds", query="add_photos")
+def add_photos(photos):
+    """
+    Add many photo records in one transaction (batch upload).
+
+    Args:
+        photos: list of dicts with add_photo's keyword arguments (extra keys ignored)
+
+    Returns:
+        list of new ids, in order; None where the content_hash already existed
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    ids = []
+    try:
+        for p in photos:
+            cursor.execute('''
+                INSERT OR IGNORE INTO photos (filename, original_path, display_path, thumbnail_path,
+                                              width, height, file_size, mime_type, date_taken,
+                                              uploaded_at, content_hash, phash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (p['filename'], p['original_path'], p['display_path'], p['thumbnail_path'],
+                  p.get('width'), p.get('height'), p.get('file_size'), p.get('mime_type'),
+                  p.get('date_taken'), datetime.now().isoformat(),
+                  p.get('content_hash'), p.get('phash')))
+            ids.append(cursor.lastrowid if cursor.rowcount else None)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return ids
+
+
+@metrics.timed("inkframe_db_query_seconds", query="get_photo")
 def get_photo(photo_id):
     """Get a photo by ID"""
     conn = get_db()
@@ -161,6 +235,94 @@ def get_photo(photo_id):
     return dict(row) if row else None
 
 
+def get_photo_by_thumbnail(thumbnail_path):
+    """Get the photo whose thumbnail is stored at this path, or None"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM photos WHERE thumbnail_path = ?', (thumbnail_path,))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+
+@metrics.timed("inkframe_db_query_seconds", query="get_photo_id_by_hash")
+def get_photo_id_by_hash(content_hash):
+    """Get the id of the photo with this content hash, or None"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM photos WHERE content_hash = ?', (content_hash,))
+    row = cursor.fetchone()
+    return row['id'] if row else None
+
+
+def get_photos_without_hash():
+    """Get (id, original_path) dicts for photos uploaded before content hashing"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, original_path FROM photos WHERE content_hash IS NULL ORDER BY id')
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def set_content_hash(photo_id, content_hash):
+    """Store a photo's content hash. Returns False if another photo already has it."""
+    conn = get_db()
+    try:
+        conn.execute('UPDATE photos SET content_hash = ? WHERE id = ?', (content_hash, photo_id))
+        conn.commit()
+        return True
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return False
+
+
+@metrics.timed("inkframe_db_query_seconds", query="get_photo_phashes")
+def get_photo_phashes():
+    """Get (id, display_path, phash) dicts for every photo with a perceptual hash"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, display_path, phash FROM photos WHERE phash IS NOT NULL ORDER BY id')
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def get_photos_without_phash():
+    """Get (id, thumbnail_path) dicts for photos uploaded before perceptual hashing"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, thumbnail_path FROM photos WHERE phash IS NULL ORDER BY id')
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def set_phash(photo_id, phash):
+    """Store a photo's perceptual hash"""
+    conn = get_db()
+    conn.execute('UPDATE photos SET phash = ? WHERE id = ?', (phash, photo_id))
+    conn.commit()
+
+
+def set_display_path(old_path, new_path):
+    """Repoint photos from one display image path to another (format migration)"""
+    conn = get_db()
+    conn.execute('UPDATE photos SET display_path = ? WHERE display_path = ?', (new_path, old_path))
+    conn.commit()
+
+
+def find_display_path(candidates):
+    """The one of these display image paths a photo currently points at, or None"""
+    conn = get_db()
+    marks = ','.join('?' * len(candidates))
+    row = conn.execute(f'SELECT display_path FROM photos WHERE display_path IN ({marks})',
+                       list(candidates)).fetchone()
+    return row[0] if row else None
+
+
+def set_original_path(photo_id, original_path, filename):
+    """Point a photo at a replacement original (retention compaction)"""
+    conn = get_db()
+    conn.execute('UPDATE photos SET original_path = ?, filename = ? WHERE id = ?',
+                 (original_path, filename, photo_id))
+    conn.commit()
+
+
+@metrics.timed("inkframe_db_query_seconds", query="get_all_photos")
 def get_all_photos(limit=None, offset=0):
     """Get all photos, optionally paginated"""
     conn = get_db()
@@ -173,6 +335,7 @@ def get_all_photos(limit=None, offset=0):
     return [dict(row) for row in rows]
 
 
+@metrics.timed("inkframe_db_query_seconds", query="get_photo_count")
 def get_photo_count():
     """Get total photo count"""
     conn = get_db()
@@ -182,6 +345,7 @@ def get_photo_count():
     return count
 
 
+@metrics.timed("inkframe_db_query_seconds", query="get_display_photos")
 def get_display_photos():
     """Get photos for display cycling, returns list of display_path strings.
     Always returns stable ASC order; shuffling is handled by the caller (scheduler).
@@ -193,6 +357,7 @@ def get_display_photos():
     return [row['display_path'] for row in rows]
 
 
+@metrics.timed("inkframe_db_query_seconds", query="delete_photo")
 def delete_photo(photo_id):
     """Delete a photo record, returns the photo dict for file cleanup"""
     conn = get_db()
@@ -206,6 +371,7 @@ def delete_photo(photo_id):
     return photo
 
 
+@metrics.timed("inkframe_db_query_seconds", query="delete_photos_bulk")
 def delete_photos_bulk(photo_ids):
     """Delete multiple photos, returns list of photo dicts for file cleanup"""
     if not photo_ids:
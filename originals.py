@@ -0,0 +1,137 @@
+"""Retention policy for uploaded originals.
+
+Originals only feed re-renders (fit/crop/orientation changes), which never
+need much more than twice the display resolution. Under the "master" policy
+each upload is kept as a bounded-resolution JPEG master instead of the full
+camera file; the full file can optionally be offloaded to another directory
+(a USB stick, a NAS mount) rather than deleted.
+
+    full    keep uploads byte-for-byte (default)
+    master  keep a JPEG whose long edge is at most max_edge; offload or
+            drop the full file
+
+Masters keep the stored pixel orientation and the original EXIF block, so
+the rotation tag and capture date still apply. Files already within
+max_edge, and masters that would not be smaller, are kept as uploaded.
+
+Settings (settings["originals"]): retention, max_edge, offload_dir.
+"""
+
+import io
+import math
+import os
+from pathlib import Path
+
+from PIL import Image
+
+POLICIES = ("full", "master")
+DEFAULT_MAX_EDGE = 2400
+MIN_MAX_EDGE = 1200  # 2x the display's long edge
+MAX_MAX_EDGE = 8000
+MASTER_QUALITY = 90
+
+
+def wants_master(retention):
+    """Whether a retention settings dict (or None) asks for bounded masters"""
+    return bool(retention) and retention.get('retention') == 'master'
+
+
+def master_size(size, max_edge=DEFAULT_MAX_EDGE):
+    """Size of the master for an image of `size`, or None if it already fits"""
+    w, h = size
+    if max(w, h) <= max_edge:
+        return None
+    scale = max_edge / max(w, h)
+    return (max(1, round(w * scale)), max(1, round(h * scale)))
+
+
+def estimate_master_cost(img, max_edge=DEFAULT_MAX_EDGE):
+    """Peak pixel memory (bytes) of encode_master, from a lazily opened image's header"""
+    target = master_size(img.size, max_edge)
+    if target is None:
+        return 0
+    w, h = img.size
+    if img.format == 'JPEG':
+        shrink = min(w // target[0], h // target[1], 8)
+        shrink = 1 << (max(shrink, 1).bit_length() - 1)
+        decoded = math.ceil(w / shrink) * math.ceil(h / shrink)
+    else:
+        decoded = w * h * (2 if img.mode != 'RGB' else 1)
+    return 4 * (decoded + target[0] * target[1])
+
+
+def encode_master(source, max_edge=DEFAULT_MAX_EDGE):
+    """
+    Encode a bounded-resolution JPEG master of an image.
+
+    Args:
+        source: file path or file object
+        max_edge: longest edge of the master in pixels
+
+    Returns:
+        JPEG bytes, or None if the image already fits within max_edge
+    """
+    with Image.open(source) as img:
+        target = master_size(img.size, max_edge)
+        if target is None:
+            return None
+        exif = img.info.get('exif', b'')
+        icc = img.info.get('icc_profile')
+        img.draft('RGB', target)
+        pixels = img.convert('RGB') if img.mode != 'RGB' else img
+        master = pixels.resize(target, Image.LANCZOS, reducing_gap=3.0)
+
+    buf = io.BytesIO()
+    master.save(buf, "JPEG", quality=MASTER_QUALITY, exif=exif, icc_profile=icc)
+    return buf.getvalue()
+
+
+def offload(data, offload_dir, filename):
+    """
+    Copy a full original to the offload directory. Raises OSError if the
+    directory is unusable (e.g. the USB stick is unplugged).
+
+    Args:
+        data: file contents (bytes) or a path to copy from
+    """
+    dest = Path(offload_dir) / filename
+    if not Path(offload_dir).is_dir():
+        raise OSError(f"Offload directory not available: {offload_dir}")
+    if not isinstance(data, bytes):
+        data = Path(data).read_bytes()
+    tmp = dest.with_name(dest.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, dest)
+    return dest
+
+
+def store(data, dest_dir, filename, retention=None):
+    """
+    Write an upload under the retention policy.
+
+    Returns:
+        (stored_path, offload_path): offload_path is None unless the full file
+        was copied to the offload directory
+
+    If the offload directory is set but unusable, the full file is kept in
+    dest_dir instead of being lost.
+    """
+    full_path = Path(dest_dir) / filename
+    master = encode_master(io.BytesIO(data), retention.get('max_edge', DEFAULT_MAX_EDGE)) \
+        if wants_master(retention) else None
+    if master is None or len(master) >= len(data):
+        full_path.write_bytes(data)
+        return full_path, None
+
+    offload_path = None
+    if retention.get('offload_dir'):
+        try:
+            offload_path = offload(data, retention['offload_dir'], filename)
+        except OSError as e:
+            print(f"Offload failed, keeping full original {filename}: {e}")
+            full_path.write_bytes(data)
+            return full_path, None
+
+    master_path = full_path.with_suffix('.jpg')
+    master_path.write_bytes(master)
+    return master_path, offload_path
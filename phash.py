@@ -0,0 +1,175 @@
+"""Perceptual hashing and a near-duplicate index for burst shots and resends.
+
+Each photo gets a 64-bit dHash computed from a reduced copy of the image
+(the upload's decode intermediate; the thumbnail for older photos).
+Near-identical photos (burst sequences, re-encoded resends) land within a
+few bits of each other, so a BK-tree over Hamming distance finds neighbours
+without comparing against the whole library.
+"""
+
+import random
+import threading
+
+from PIL import Image
+
+import models
+
+HASH_SIZE = 8                 # 8x8 gradient bits -> 64-bit hash
+NEAR_DUPLICATE_DISTANCE = 8   # max differing bits to count as the same shot
+
+_lock = threading.Lock()
+_tree = None    # BKTree of (phash int, photo dict); None until first query
+_dirty = False  # set when photos are deleted; next query rebuilds
+
+
+def dhash(img, hash_size=HASH_SIZE):
+    """
+    Difference hash: compare horizontally adjacent pixels of a tiny grayscale
+    copy. Robust to scaling, recompression and small exposure shifts.
+
+    Returns:
+        16-character hex string (64 bits for the default hash_size)
+    """
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def hamming(a, b):
+    """Number of differing bits between two integer hashes"""
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance.
+
+    A node's children are keyed by their distance to it; the triangle
+    inequality lets a radius search skip every child whose key is outside
+    [d - radius, d + radius].
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, item, {distance: child}]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, value, item):
+        self._size += 1
+        if self._root is None:
+            self._root = [value, item, {}]
+            return
+        node = self._root
+        while True:
+            d = hamming(value, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, item, {}]
+                return
+            node = child
+
+    def search(self, value, radius):
+        """Return [(distance, item)] for every entry within radius of value"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= radius:
+                found.append((d, node[1]))
+            for key, child in node[2].items():
+                if d - radius <= key <= d + radius:
+                    stack.append(child)
+        return found
+
+
+def _build_tree():
+    tree = BKTree()
+    for photo in models.get_photo_phashes():
+        tree.add(int(photo['phash'], 16), {'id': photo['id'], 'display_path': photo['display_path']})
+    return tree
+
+
+def _get_tree():
+    """Return the index, (re)building it from the DB if needed. Caller holds _lock."""
+    global _tree, _dirty
+    if _tree is None or _dirty:
+        _tree = _build_tree()
+        _dirty = False
+    return _tree
+
+
+def index_photo(photo_id, display_path, phash_hex):
+    """Add a newly uploaded photo to the index (no-op until the index is first used)"""
+    if not phash_hex:
+        return
+    with _lock:
+        if _tree is not None and not _dirty:
+            _tree.add(int(phash_hex, 16), {'id': photo_id, 'display_path': display_path})
+
+
+def invalidate():
+    """Mark the index stale after photos are deleted or rehashed"""
+    global _dirty
+    with _lock:
+        _dirty = True
+
+
+def find_similar(phash_hex, max_distance=NEAR_DUPLICATE_DISTANCE):
+    """Photos within max_distance bits of phash_hex, nearest first: [(distance, photo dict)]"""
+    with _lock:
+        matches = _get_tree().search(int(phash_hex, 16), max_distance)
+    return sorted(matches, key=lambda m: (m[0], m[1]['id']))
+
+
+def get_clusters(max_distance=NEAR_DUPLICATE_DISTANCE):
+    """
+    Group the library into near-duplicate clusters (single-link: A~B and B~C
+    puts A, B and C together).
+
+    Returns:
+        list of clusters with 2+ photos, each a list of photo dicts sorted by id
+    """
+    with _lock:
+        tree = _get_tree()
+        photos = models.get_photo_phashes()
+        parent = {p['id']: p['id'] for p in photos}
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for p in photos:
+            for _, match in tree.search(int(p['phash'], 16), max_distance):
+                if match['id'] in parent:
+                    a, b = find(p['id']), find(match['id'])
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for p in photos:
+        groups.setdefault(find(p['id']), []).append(
+            {'id': p['id'], 'display_path': p['display_path']})
+    return [sorted(g, key=lambda x: x['id']) for g in groups.values() if len(g) > 1]
+
+
+def one_per_cluster(display_paths, max_distance=NEAR_DUPLICATE_DISTANCE):
+    """Drop all but one randomly chosen member of each near-duplicate cluster"""
+    present = set(display_paths)
+    drop = set()
+    for cluster in get_clusters(max_distance):
+        members = [p['display_path'] for p in cluster if p['display_path'] in present]
+        if len(members) > 1:
+            keep = random.choice(members)
+            drop.update(m for m in members if m != keep)
+    return [p for p in display_paths if p not in drop]
@@ -0,0 +1,133 @@
+"""Store of inactive display render variants, as a size-capped disk cache.
+
+A photo's display image lives at one path (display_path in the database)
+and shows the current settings. When a reprocess changes the settings,
+the render being replaced is kept here first, content-addressed by the
+photo's hash and its variant (what it was rendered with), and a variant
+already stored for the new settings is moved back into place instead of
+being rendered again. Toggling orientation or fit mode back and forth
+therefore only renders each variant once.
+
+Variants are stashed as hard links (copied where the filesystem has none),
+so stashing costs no space until the display file is replaced, and keeps
+the file's mtime, which the panel fingerprint relies on. Recency is tracked
+in memory and, across restarts, by ctime (linking updates it). The least
+recently stashed variants are evicted once the store exceeds CACHE_MAX_BYTES.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+CACHE_MAX_BYTES = int(os.environ.get('INKFRAME_RENDER_CACHE_MB', 256)) * 1024 * 1024
+HASH_PREFIX = 20  # hex digits of the content hash in file names
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # name -> bytes, least recently stashed first
+_total = 0
+_cache_dir = None         # directory _entries describes
+
+
+def variant_name(content_hash, variant, suffix):
+    """File name of a stored variant. variant is everything the render
+    depends on besides the photo (settings key, panel size, pipeline version)."""
+    digest = hashlib.sha1(variant.encode()).hexdigest()[:12]
+    return f"{content_hash[:HASH_PREFIX]}-{digest}{suffix}"
+
+
+def _load(cache_dir):
+    """Index the directory. Caller holds _lock."""
+    global _total, _cache_dir
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    stats = []
+    for path in cache_dir.iterdir():
+        if path.name.endswith(".tmp"):
+            path.unlink(missing_ok=True)
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        stats.append((st.st_ctime, path.name, st.st_size))
+    _entries.clear()
+    for _, name, size in sorted(stats):
+        _entries[name] = size
+    _total = sum(_entries.values())
+    _cache_dir = cache_dir
+
+
+def _ensure_loaded(cache_dir):
+    if _cache_dir != cache_dir:
+        _load(cache_dir)
+
+
+def _evict(cache_dir):
+    """Drop least recently stashed variants until under the cap. Caller holds _lock."""
+    global _total
+    while _total > CACHE_MAX_BYTES and _entries:
+        name, size = _entries.popitem(last=False)
+        _total -= size
+        (cache_dir / name).unlink(missing_ok=True)
+
+
+def put(cache_dir, name, src):
+    """Keep a copy of the render at src as `name` (replacing any older one)"""
+    global _total
+    cache_dir = Path(cache_dir)
+    path = cache_dir / name
+    tmp = path.with_name(name + ".tmp")
+    with _lock:
+        _ensure_loaded(cache_dir)
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, path)
+        _total -= _entries.pop(name, 0)
+        _entries[name] = path.stat().st_size
+        _total += _entries[name]
+        _evict(cache_dir)
+
+
+def take(cache_dir, name, dest):
+    """
+    Move the stored variant `name` to dest (atomically replacing it).
+
+    Returns:
+        True if it was stored, False if it has to be rendered
+    """
+    global _total
+    cache_dir = Path(cache_dir)
+    with _lock:
+        _ensure_loaded(cache_dir)
+        if name not in _entries:
+            return False
+        _total -= _entries.pop(name)
+        try:
+            os.replace(cache_dir / name, dest)
+            return True
+        except OSError:
+            (cache_dir / name).unlink(missing_ok=True)
+            return False
+
+
+def discard_photo(cache_dir, content_hash):
+    """Remove every stored variant of a photo (it was deleted)"""
+    global _total
+    cache_dir = Path(cache_dir)
+    prefix = content_hash[:HASH_PREFIX] + "-"
+    with _lock:
+        _ensure_loaded(cache_dir)
+        for name in [n for n in _entries if n.startswith(prefix)]:
+            _total -= _entries.pop(name)
+            (cache_dir / name).unlink(missing_ok=True)
+
+
+def get_status():
+    """Store usage for /api/status"""
+    with _lock:
+        return {'count': len(_entries), 'bytes': _total, 'max_bytes': CACHE_MAX_BYTES}
@@ -0,0 +1,119 @@
+"""Spectral-residual saliency for smart crops of photos without faces.
+
+When the face detector finds nobody (landscapes, pets, still lifes), smart
+crop used to fall back to the geometric center. The Sobel edge saliency it
+once had was dropped for picking arbitrary edge detail and for being slow.
+
+This computes a spectral-residual saliency map (Hou & Zhang, CVPR 2007): in
+the log amplitude spectrum, whatever deviates from its local average is
+"unexpected", and transforming that residual back with the original phase
+highlights the regions that stand out. It runs on a map of MAP_DIM pixels
+on the long edge, for intensity and two opponent colour channels (so a red
+fox on green grass counts, not just edges), so the cost per image is fixed
+whatever the photo's size. The size is fixed rather than adapted to how
+fast the board is: the crop must not depend on when a photo was rendered. An integral image then gives
+the saliency held by every crop window in one vectorized sweep.
+
+The chosen window must hold clearly more saliency than the centered one
+(MIN_GAIN); otherwise the caller keeps the center crop.
+"""
+
+from PIL import Image
+
+MAP_DIM = 64          # long edge of the saliency map (the method's usual scale)
+BLUR_SIGMA = 2.5      # smoothing of the map, in map pixels
+MIN_GAIN = 1.15       # best window vs the centered one
+MIN_CONTRAST = 1e-3   # channels flatter than this (std, 0-1 scale) carry no signal
+TIME_BUDGET = 0.15    # seconds per map the benchmark checks against
+
+
+def _box3(a):
+    """3x3 mean with wrap-around (the spectrum is periodic)"""
+    import numpy as np
+
+    rows = a + np.roll(a, 1, 0) + np.roll(a, -1, 0)
+    return (rows + np.roll(rows, 1, 1) + np.roll(rows, -1, 1)) / 9
+
+
+def _gaussian_matrix(n, sigma):
+    """(n, n) matrix applying a Gaussian blur along one axis, renormalized at the edges"""
+    import numpy as np
+
+    idx = np.arange(n, dtype=np.float32)
+    k = np.exp(-((idx[:, None] - idx[None, :]) ** 2) / (2 * sigma ** 2))
+    return k / k.sum(1, keepdims=True)
+
+
+def saliency_map(img, max_dim=MAP_DIM):
+    """
+    Saliency of an RGB PIL image.
+
+    Returns:
+        (h, w) float32 array, max_dim on the long edge, summing to 1; or
+        None for a flat image
+    """
+    import numpy as np
+
+    scale = max_dim / max(img.size)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    rgb = np.asarray(img.convert('RGB').resize(size, Image.BILINEAR), dtype=np.float32) / 255
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    total = np.zeros(rgb.shape[:2], dtype=np.float64)
+    for channel in (0.299 * r + 0.587 * g + 0.114 * b, r - g, (r + g) / 2 - b):
+        if channel.std() < MIN_CONTRAST:
+            continue
+        spectrum = np.fft.fft2(channel - channel.mean())
+        log_amplitude = np.log(np.abs(spectrum) + 1e-6)
+        residual = log_amplitude - _box3(log_amplitude)
+        total += np.abs(np.fft.ifft2(np.exp(residual + 1j * np.angle(spectrum)))) ** 2
+
+    if not total.any():
+        return None
+    h, w = total.shape
+    smooth = _gaussian_matrix(h, BLUR_SIGMA) @ total.astype(np.float32) @ _gaussian_matrix(w, BLUR_SIGMA).T
+    return smooth / smooth.sum()
+
+
+def window_sums(smap, window):
+    """
+    Saliency held by every placement of a (w, h) window, from an integral
+    image: sums[y, x] for the window with top-left corner (x, y).
+    """
+    import numpy as np
+
+    h, w = smap.shape
+    ww, wh = window
+    integral = np.zeros((h + 1, w + 1), dtype=np.float64)
+    integral[1:, 1:] = smap.cumsum(0).cumsum(1)
+    return (integral[wh:, ww:] - integral[:h + 1 - wh, ww:]
+            - integral[wh:, :w + 1 - ww] + integral[:h + 1 - wh, :w + 1 - ww])
+
+
+def find_center(img, crop_size):
+    """
+    Center of the most salient crop window.
+
+    Args:
+        img: RGB PIL Image (e.g. the downscaled face-detection input)
+        crop_size: (width, height) of the crop window in img's pixels
+
+    Returns:
+        (cx, cy) in img's pixel coordinates, or None if no window stands
+        out from the centered one
+    """
+    import numpy as np
+
+    smap = saliency_map(img)
+    if smap is None:
+        return None
+
+    h, w = smap.shape
+    sx, sy = w / img.width, h / img.height
+    window = (min(w, max(1, round(crop_size[0] * sx))), min(h, max(1, round(crop_size[1] * sy))))
+    sums = window_sums(smap, window)
+    centered = sums[(h - window[1]) // 2, (w - window[0]) // 2]
+    y, x = np.unravel_index(sums.argmax(), sums.shape)
+    if sums[y, x] < centered * MIN_GAIN:
+        return None
+    return (int((x + window[0] / 2) / sx), int((y + window[1] / 2) / sy))
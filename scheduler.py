@@ -1,14 +1,17 @@
 """Photo cycling scheduler using APScheduler"""
 
+import json
+import os
 import random
 import threading
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 
 import models
 import display
+import image_processor
+import metrics
+import phash
 
 _scheduler = None
 _scheduler_lock = threading.Lock()
@@ -17,6 +20,10 @@ _shuffle_bag = []     # Shuffle-bag for random mode: ensures all photos shown be
 _history = []         # History stack for "previous" button
 _initialized = False  # Whether we've loaded persisted state from disk
 
+# The cadence's next tick when it was last set; kept out of settings.json,
+# which request threads rewrite
+SCHEDULE_STATE_FILE = Path(__file__).parent / "data" / ".schedule_state.json"
+
 INTERVAL_OPTIONS = [5, 15, 30, 60, 180, 360, 720, 1440]
 RECENT_REPEAT_GUARD = 10  # keep this many recently shown photos out of the front of a fresh bag
 
@@ -25,11 +32,69 @@ def get_scheduler():
     """Get or create the background scheduler"""
     global _scheduler
     if _scheduler is None:
+        # Imported on first use to keep app startup fast
+        from apscheduler.schedulers.background import BackgroundScheduler
         _scheduler = BackgroundScheduler()
         _scheduler.start()
     return _scheduler
 
 
+def _cycle_trigger(minutes, aligned=False, start_date=None):
+    """Trigger for the photo_cycle job.
+
+    Aligned ticks fall on wall-clock boundaries that are multiples of the
+    interval (every interval in INTERVAL_OPTIONS divides an hour or a day),
+    so frames with the same interval flip together: 60 -> on the hour,
+    15 -> :00/:15/:30/:45, 180 -> 00:00, 03:00, ...
+    Otherwise ticks are `minutes` apart, starting at start_date (default:
+    one interval from now).
+    """
+    if aligned:
+        from apscheduler.triggers.cron import CronTrigger
+        if minutes < 60:
+            return CronTrigger(minute=f"*/{minutes}")
+        if minutes < 1440:
+            return CronTrigger(hour=f"*/{minutes // 60}", minute=0)
+        return CronTrigger(hour=0, minute=0)
+    from apscheduler.triggers.interval import IntervalTrigger
+    return IntervalTrigger(minutes=minutes, start_date=start_date)
+
+
+def _interval_settings():
+    """(interval_minutes, align_to_clock) from settings, interval validated"""
+    slideshow = models.load_settings().get("slideshow", {})
+    interval_minutes = slideshow.get("interval_minutes", 60)
+    if interval_minutes not in INTERVAL_OPTIONS:
+        interval_minutes = 60
+    return interval_minutes, bool(slideshow.get("align_to_clock", False))
+
+
+def _saved_next_run():
+    """A cycle time of the cadence persisted before the last shutdown (tz-aware), or None"""
+    try:
+        value = json.loads(SCHEDULE_STATE_FILE.read_text()).get("next_run")
+        return datetime.fromisoformat(value).astimezone() if value else None
+    except (OSError, AttributeError, TypeError, ValueError):
+        return None
+
+
+def _persist_next_run():
+    """Save the photo_cycle job's next fire time so a restart keeps the cadence.
+    Called when the cadence is set (start, stop, manual change), not on every
+    tick: later ticks follow from this one."""
+    try:
+        job = get_scheduler().get_job("photo_cycle")
+        if job is None or job.next_run_time is None:
+            SCHEDULE_STATE_FILE.unlink(missing_ok=True)
+            return
+        SCHEDULE_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = SCHEDULE_STATE_FILE.with_name(SCHEDULE_STATE_FILE.name + ".tmp")
+        tmp.write_text(json.dumps({"next_run": job.next_run_time.isoformat()}))
+        os.replace(tmp, SCHEDULE_STATE_FILE)
+    except Exception as e:
+        print(f"Failed to persist next cycle time: {e}")
+
+
 def _load_persisted_state():
     """Load saved current photo path and shuffle bag from settings on startup"""
     global _current_path, _shuffle_bag, _history, _initialized
@@ -74,9 +139,24 @@ def _get_sequential_list():
     return models.get_display_photos()
 
 
+def _follow_renames(all_photos):
+    """Display images change extension when the cache format changes; keep the
+    bag, history and current photo pointing at the same photos (matched by stem)."""
+    global _current_path, _shuffle_bag
+    by_stem = {Path(p).stem: p for p in all_photos}
+
+    def resolve(path):
+        return by_stem.get(Path(path).stem, path) if path else path
+
+    _current_path = resolve(_current_path)
+    _shuffle_bag = [resolve(p) for p in _shuffle_bag]
+    _history[:] = [resolve(p) for p in _history]
+
+
 def _next_from_shuffle_bag(all_photos):
     """Pick next photo from shuffle bag, refilling when empty.
-    Guarantees every photo is shown exactly once per cycle."""
+    Guarantees every photo is shown exactly once per cycle (or, with
+    one_per_cluster, one photo from each group of near-duplicates)."""
     global _shuffle_bag, _current_path
 
     # Remove any photos from bag that no longer exist
@@ -85,13 +165,24 @@ def _next_from_shuffle_bag(all_photos):
 
     # Refill bag when empty
     if not _shuffle_bag:
-        _shuffle_bag = list(all_photos)
+        _shuffle_bag = _cycle_photos(all_photos)
         random.shuffle(_shuffle_bag)
         _space_out_recent(valid_photos)
 
     return _shuffle_bag.pop(0)
 
 
+def _cycle_photos(all_photos):
+    """Photos for one shuffle-bag cycle: all of them, or one per burst cluster"""
+    settings = models.load_settings()
+    if settings.get("slideshow", {}).get("one_per_cluster", False):
+        try:
+            return phash.one_per_cluster(all_photos)
+        except Exception as e:
+            print(f"Near-duplicate filtering failed, using all photos: {e}")
+    return list(all_photos)
+
+
 def _space_out_recent(valid_photos):
     """Keep recently shown photos out of the front of a freshly refilled bag,
     so a photo shown at the end of one cycle can't reappear right at the
@@ -138,6 +229,7 @@ def show_next_photo(_from_scheduler=False):
     if not all_photos:
         print("No photos available")
         return False
+    _follow_renames(all_photos)
 
     settings = models.load_settings()
     order = settings.get("slideshow", {}).get("order", "random")
@@ -163,7 +255,7 @@ def show_next_photo(_from_scheduler=False):
 
     _current_path = path
     _persist_state()
-    display.show_photo(path, saturation)
+    display.show_photo(path, saturation, prepare=image_processor.wait_for_render)
     print(f"Showing photo: {path} ({len(all_photos)} total)")
     if not _from_scheduler:
         _reset_cycle_timer()
@@ -182,6 +274,7 @@ def show_previous_photo():
     all_photos = _get_sequential_list()
     if not all_photos:
         return False
+    _follow_renames(all_photos)
 
     settings = models.load_settings()
     order = settings.get("slideshow", {}).get("order", "random")
@@ -208,7 +301,7 @@ def show_previous_photo():
             path = all_photos[-1]
 
     _current_path = path
-    display.show_photo(path, saturation)
+    display.show_photo(path, saturation, prepare=image_processor.wait_for_render)
     _reset_cycle_timer()
     return True
 
@@ -240,7 +333,8 @@ def show_specific_photo(photo_id):
     if _current_path in _shuffle_bag:
         _shuffle_bag.remove(_current_path)
     _persist_state()
-    display.show_photo(photo['display_path'], saturation)
+    display.show_photo(photo['display_path'], saturation,
+                       prepare=image_processor.wait_for_render)
     _reset_cycle_timer()
     return True
 
@@ -251,7 +345,7 @@ def _reset_cycle_timer():
     Called after a manual photo change (select/next/prev) so that a user-chosen
     photo gets the full rotation interval before the next auto-cycle, instead
     of being replaced by whatever remained on the original schedule. No-op if
-    the slideshow is stopped (no job registered).
+    the slideshow is stopped (no job registered) or aligned to the clock.
     """
     scheduler = get_scheduler()
     with _scheduler_lock:
@@ -261,35 +355,64 @@ def _reset_cycle_timer():
         except Exception:
             return
 
-        settings = models.load_settings()
-        interval_minutes = settings.get("slideshow", {}).get("interval_minutes", 60)
-        if interval_minutes not in INTERVAL_OPTIONS:
-            interval_minutes = 60
+        interval_minutes, aligned = _interval_settings()
+        if aligned:
+            return  # stay on the shared clock boundaries
 
         try:
             scheduler.reschedule_job(
                 "photo_cycle",
-                trigger=IntervalTrigger(minutes=interval_minutes),
+                trigger=_cycle_trigger(interval_minutes),
             )
         except Exception as e:
             print(f"Failed to reset cycle timer: {e}")
+    _persist_next_run()
 
 
 def _cycle_photo_job():
     """Job function called by scheduler"""
     print(f"[{datetime.now().isoformat()}] Cycling to next photo...")
-    show_next_photo(_from_scheduler=True)
+    with metrics.timer("inkframe_scheduler_tick_seconds"):
+        show_next_photo(_from_scheduler=True)
 
 
-def start_slideshow():
-    """Start automatic photo cycling"""
-    settings = models.load_settings()
-    slideshow = settings.get("slideshow", {})
-    interval_minutes = slideshow.get("interval_minutes", 60)
+def _resume_time(interval_minutes, aligned=False):
+    """
+    If the panel still shows the current photo (e-ink keeps its image across
+    restarts), when its next tick is due: the first tick of the persisted
+    cadence (or the clock boundaries) after it was shown, or one interval
+    after it was shown. None if a refresh is due now, including when ticks
+    were missed while the frame was off.
+    """
+    _load_persisted_state()
+    all_photos = _get_sequential_list()
+    _follow_renames(all_photos)
+    if _current_path not in all_photos:
+        return None
+    saturation = models.load_settings().get("display", {}).get("saturation", 0.5)
+    shown_at = display.panel_shows(_current_path, saturation)
+    if shown_at is None:
+        return None
+    shown = datetime.fromtimestamp(shown_at).astimezone()
+    cadence = _saved_next_run()
+    if aligned or cadence is not None:
+        trigger = _cycle_trigger(interval_minutes, aligned, start_date=cadence)
+        due = trigger.get_next_fire_time(None, shown)
+    else:
+        due = shown + timedelta(minutes=interval_minutes)
+    return due if due > datetime.now().astimezone() else None
 
-    if interval_minutes not in INTERVAL_OPTIONS:
-        interval_minutes = 60
 
+def start_slideshow(resume=False):
+    """Start automatic photo cycling.
+
+    With resume=True (boot), the cadence from before the restart continues:
+    a photo still on the panel is kept until its persisted next tick instead
+    of being replaced by a full refresh. However many ticks were missed while
+    the frame was off, at most one refresh happens now.
+    """
+    interval_minutes, aligned = _interval_settings()
+    resume_at = _resume_time(interval_minutes, aligned) if resume else None
     scheduler = get_scheduler()
 
     with _scheduler_lock:
@@ -298,15 +421,26 @@ def start_slideshow():
         except Exception:
             pass
 
+        # coalesce + no grace limit: ticks missed while the process was
+        # stalled (or the Pi suspended) run once, late, rather than in a burst
         scheduler.add_job(
             _cycle_photo_job,
-            trigger=IntervalTrigger(minutes=interval_minutes),
+            trigger=_cycle_trigger(interval_minutes, aligned,
+                                   start_date=None if aligned else resume_at),
             id="photo_cycle",
-            replace_existing=True
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=None,
         )
 
-    print(f"Started slideshow with {interval_minutes}min interval")
-    show_next_photo()
+    print(f"Started slideshow with {interval_minutes}min interval"
+          + (" (aligned to the clock)" if aligned else ""))
+    if resume_at is not None:
+        print(f"Panel still shows {_current_path}, keeping it")
+        metrics.inc("inkframe_boot_refresh_skipped_total")
+    else:
+        show_next_photo()
+    _persist_next_run()
     return True
 
 
@@ -316,10 +450,11 @@ def stop_slideshow():
     with _scheduler_lock:
         try:
             scheduler.remove_job("photo_cycle")
-            print("Stopped slideshow")
-            return True
         except Exception:
             return False
+    print("Stopped slideshow")
+    _persist_next_run()
+    return True
 
 
 def is_slideshow_running():
@@ -1,4 +1,4 @@
-/* Upload handling: drag-drop + file picker, sequential upload with progress */
+/* Upload handling: drag-drop + file picker, batched parallel upload with progress */
 
 (function() {
     const zone = document.getElementById('uploadZone');
@@ -36,7 +36,8 @@
 
     function handleFiles(files) {
         const validFiles = Array.from(files).filter(f =>
-            f.type.startsWith('image/') && f.size <= 20 * 1024 * 1024
+            f.type.startsWith('image/') &&
+            (f.size <= 20 * 1024 * 1024 || (RESIZE_MAX_EDGE && f.type === 'image/jpeg'))
         );
 
         if (validFiles.length === 0) return;
@@ -57,59 +58,310 @@
             progress.appendChild(item);
         });
 
-        // Upload sequentially
-        uploadSequential(validFiles, 0);
-    }
+        // Upload in batches, a couple of requests at a time
+        const queue = validFiles.map((file, i) => ({file, index: i, attempts: 0}));
+        let running = 0;
+        let waiting = 0;  // busy files scheduled for a retry
+
+        function pump() {
+            while (running < PARALLEL_BATCHES && queue.length > 0) {
+                running++;
+                const finish = () => {
+                    running--;
+                    pump();
+                };
+                if (queue[0].file.size > CHUNKED_THRESHOLD) {
+                    uploadChunked(queue.shift(), requeue, finish);
+                } else {
+                    const firstLarge = queue.findIndex(item => item.file.size > CHUNKED_THRESHOLD);
+                    const count = firstLarge === -1 ? BATCH_SIZE : Math.min(firstLarge, BATCH_SIZE);
+                    uploadBatch(queue.splice(0, count), requeue, finish);
+                }
+            }
+            if (running === 0 && waiting === 0 && queue.length === 0) {
+                // All done, reload after short delay
+                setTimeout(() => location.reload(), 500);
+            }
+        }
 
-    function uploadSequential(files, index) {
-        if (index >= files.length) {
-            // All done, reload after short delay
-            setTimeout(() => location.reload(), 500);
-            return;
+        function requeue(item, seconds) {
+            waiting++;
+            setTimeout(() => {
+                waiting--;
+                queue.push(item);
+                pump();
+            }, seconds * 1000);
         }
 
-        const file = files[index];
+        pump();
+    }
+
+    const BATCH_SIZE = 6;
+    const PARALLEL_BATCHES = 2;
+    const MAX_BUSY_RETRIES = 5;
+    // Files above this go through the resumable /api/uploads protocol
+    const CHUNKED_THRESHOLD = 4 * 1024 * 1024;
+    const MAX_CHUNK_RETRIES = 8;
+    // Longest edge for in-browser downscaling (0 = send originals), from settings
+    const RESIZE_MAX_EDGE = parseInt(zone.dataset.resizeMaxEdge || '0', 10);
+
+    function setStatus(index, text, state) {
         const bar = document.getElementById('bar-' + index);
         const status = document.getElementById('status-' + index);
-        status.textContent = 'Uploading...';
+        status.textContent = text;
+        if (state === 'complete' || state === 'error') {
+            bar.style.width = '100%';
+            bar.classList.add(state);
+        }
+    }
 
+    function uploadBatch(items, requeue, done) {
+        prepare(items).then(() => sendBatch(items, requeue, done));
+    }
+
+    // POST a batch to /api/photos/upload-batch and follow its NDJSON result
+    // lines as they stream in. Busy files go back to the queue via requeue().
+    function sendBatch(items, requeue, done) {
         const formData = new FormData();
-        formData.append('file', file);
+        items.forEach(item => {
+            formData.append('files', item.file);
+            setStatus(item.index, 'Uploading...');
+        });
 
         const xhr = new XMLHttpRequest();
-        xhr.open('POST', '/api/photos/upload');
+        xhr.open('POST', '/api/photos/upload-batch');
+        let consumed = 0;
+        const finished = new Set();
 
         xhr.upload.addEventListener('progress', (e) => {
             if (e.lengthComputable) {
                 const pct = Math.round((e.loaded / e.total) * 100);
-                bar.style.width = pct + '%';
-                status.textContent = pct + '%';
+                items.forEach(item => {
+                    document.getElementById('bar-' + item.index).style.width = pct + '%';
+                    setStatus(item.index, pct < 100 ? pct + '%' : 'Processing...');
+                });
             }
         });
 
+        function readLines() {
+            const text = xhr.responseText;
+            let end;
+            while ((end = text.indexOf('\n', consumed)) !== -1) {
+                const line = text.slice(consumed, end);
+                consumed = end + 1;
+                if (!line) continue;
+                const msg = JSON.parse(line);
+                if (msg.done) continue;
+                const item = items[msg.index];
+                finished.add(msg.index);
+                if (msg.status === 'processed') {
+                    setStatus(item.index, 'Done', 'complete');
+                } else if (msg.status === 'duplicate') {
+                    setStatus(item.index, 'Already uploaded', 'complete');
+                } else if (msg.status === 'busy' && item.attempts < MAX_BUSY_RETRIES) {
+                    item.attempts++;
+                    setStatus(item.index, 'Busy, retrying...');
+                    requeue(item, msg.retry_after || 10);
+                } else {
+                    setStatus(item.index, msg.error || 'Error', 'error');
+                }
+            }
+        }
+
+        xhr.addEventListener('progress', readLines);
         xhr.addEventListener('load', () => {
             if (xhr.status === 200) {
-                bar.style.width = '100%';
-                bar.classList.add('complete');
-                status.textContent = 'Done';
-            } else {
-                bar.classList.add('error');
-                try {
-                    const resp = JSON.parse(xhr.responseText);
-                    status.textContent = resp.error || 'Error';
-                } catch(e) {
-                    status.textContent = 'Error';
-                }
+                readLines();
             }
-            uploadSequential(files, index + 1);
+            let error = 'Error';
+            try {
+                error = JSON.parse(xhr.responseText).error || error;
+            } catch(e) {}
+            items.forEach((item, i) => {
+                if (!finished.has(i)) setStatus(item.index, error, 'error');
+            });
+            done();
         });
 
         xhr.addEventListener('error', () => {
-            bar.classList.add('error');
-            status.textContent = 'Failed';
-            uploadSequential(files, index + 1);
+            items.forEach((item, i) => {
+                if (!finished.has(i)) setStatus(item.index, 'Failed', 'error');
+            });
+            done();
         });
 
         xhr.send(formData);
     }
+
+    // Resumable upload: the session id is kept in localStorage so a reload
+    // (or a dropped connection) continues from the server's offset instead
+    // of starting the file over.
+    function sessionKey(file) {
+        return 'inkframe-upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+    }
+
+    function api(method, url, body, headers) {
+        return fetch(url, {method, body, headers}).then(resp =>
+            resp.json().catch(() => ({})).then(data => ({status: resp.status, data})));
+    }
+
+    async function openSession(file) {
+        const saved = localStorage.getItem(sessionKey(file));
+        if (saved) {
+            const r = await api('GET', '/api/uploads/' + saved);
+            if (r.status === 200) return r.data;
+            localStorage.removeItem(sessionKey(file));
+        }
+        const r = await api('POST', '/api/uploads',
+            JSON.stringify({filename: file.name, size: file.size}),
+            {'Content-Type': 'application/json'});
+        if (r.status !== 200) throw new Error(r.data.error || 'Error');
+        localStorage.setItem(sessionKey(file), r.data.upload_id);
+        return r.data;
+    }
+
+    async function uploadChunked(item, requeue, done) {
+        try {
+            await prepare([item]);
+            const file = item.file;
+            const key = sessionKey(file);
+            setStatus(item.index, 'Uploading...');
+            let session = await openSession(file);
+            let offset = session.offset;
+            let failures = 0;
+            while (offset < file.size) {
+                const pct = Math.round((offset / file.size) * 100);
+                document.getElementById('bar-' + item.index).style.width = pct + '%';
+                setStatus(item.index, pct + '%');
+                const chunk = file.slice(offset, offset + session.chunk_size);
+                let r;
+                try {
+                    r = await api('PUT', '/api/uploads/' + session.upload_id + '?offset=' + offset, chunk);
+                } catch (e) {
+                    r = {status: 0, data: {}};
+                }
+                if (r.status === 200 || r.status === 409) {
+                    offset = r.data.offset;
+                    failures = 0;
+                    continue;
+                }
+                if (r.status === 404 || r.status === 413 || ++failures > MAX_CHUNK_RETRIES) {
+                    localStorage.removeItem(key);
+                    throw new Error(r.data.error || 'Failed');
+                }
+                // Connection dropped: back off, then ask the server how much arrived
+                await new Promise(res => setTimeout(res, Math.min(1000 * 2 ** failures, 30000)));
+                const s = await api('GET', '/api/uploads/' + session.upload_id).catch(() => null);
+                if (s && s.status === 200) offset = s.data.offset;
+            }
+
+            setStatus(item.index, 'Processing...');
+            const r = await api('POST', '/api/uploads/' + session.upload_id + '/complete');
+            if (r.status === 503 && item.attempts < MAX_BUSY_RETRIES) {
+                item.attempts++;
+                setStatus(item.index, 'Busy, retrying...');
+                requeue(item, r.data.retry_after || 10);
+            } else {
+                localStorage.removeItem(key);
+                if (r.status === 200 && r.data.duplicate) {
+                    setStatus(item.index, 'Already uploaded', 'complete');
+                } else if (r.status === 200) {
+                    setStatus(item.index, 'Done', 'complete');
+                } else {
+                    setStatus(item.index, r.data.error || 'Error', 'error');
+                }
+            }
+        } catch (e) {
+            setStatus(item.index, e.message || 'Failed', 'error');
+        }
+        done();
+    }
+
+    // Optional in-browser downscaling. The pixels are decoded upright (browsers
+    // apply EXIF orientation whatever imageOrientation says) and the original
+    // EXIF block is copied into the new JPEG with its Orientation reset to 1, so
+    // the server keeps the capture date and doesn't rotate the photo again.
+    async function prepare(items) {
+        if (!RESIZE_MAX_EDGE) return;
+        for (const item of items) {
+            if (item.prepared) continue;
+            setStatus(item.index, 'Resizing...');
+            try {
+                item.file = await shrink(item.file, RESIZE_MAX_EDGE);
+            } catch (e) {}  // keep the original
+            item.prepared = true;
+        }
+    }
+
+    // Returns {exif, width, height} from the JPEG markers before the image data
+    function readJpegHeader(bytes) {
+        const info = {exif: null, width: 0, height: 0};
+        if (bytes[0] !== 0xFF || bytes[1] !== 0xD8) return null;
+        let i = 2;
+        while (i + 4 <= bytes.length && bytes[i] === 0xFF) {
+            const marker = bytes[i + 1];
+            const length = (bytes[i + 2] << 8) | bytes[i + 3];
+            if (marker === 0xDA) break;  // start of scan
+            if (marker === 0xE1 && !info.exif &&
+                String.fromCharCode(...bytes.subarray(i + 4, i + 8)) === 'Exif') {
+                info.exif = bytes.subarray(i, i + 2 + length);
+            }
+            if (marker >= 0xC0 && marker <= 0xCF && marker !== 0xC4 && marker !== 0xC8 && marker !== 0xCC) {
+                info.height = (bytes[i + 5] << 8) | bytes[i + 6];
+                info.width = (bytes[i + 7] << 8) | bytes[i + 8];
+            }
+            i += 2 + length;
+        }
+        return info;
+    }
+
+    // Copy of an EXIF APP1 segment with the Orientation tag (if any) set to 1
+    function uprightExif(segment) {
+        const exif = segment.slice();
+        const view = new DataView(exif.buffer);
+        const tiff = 10;  // after marker, length and "Exif\0\0"
+        if (tiff + 8 > exif.length) return exif;
+        const little = view.getUint16(tiff) === 0x4949;  // "II"
+        const ifd = tiff + view.getUint32(tiff + 4, little);
+        if (ifd + 2 > exif.length) return exif;
+        const count = view.getUint16(ifd, little);
+        for (let n = 0; n < count && ifd + 14 + n * 12 <= exif.length; n++) {
+            const entry = ifd + 2 + n * 12;
+            if (view.getUint16(entry, little) === 0x0112) {
+                view.setUint16(entry + 8, 1, little);
+                break;
+            }
+        }
+        return exif;
+    }
+
+    async function shrink(file, maxEdge) {
+        if (file.type !== 'image/jpeg') return file;
+        const bytes = new Uint8Array(await file.arrayBuffer());
+        const header = readJpegHeader(bytes);
+        if (!header || Math.max(header.width, header.height) <= maxEdge) return file;
+
+        const bitmap = await createImageBitmap(file, {imageOrientation: 'from-image'});
+        const scale = maxEdge / Math.max(bitmap.width, bitmap.height);
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(bitmap.width * scale);
+        canvas.height = Math.round(bitmap.height * scale);
+        const ctx = canvas.getContext('2d');
+        ctx.imageSmoothingQuality = 'high';
+        ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        bitmap.close();
+
+        const blob = await new Promise(res => canvas.toBlob(res, 'image/jpeg', 0.9));
+        if (!blob) return file;
+        let parts = [blob];
+        if (header.exif) {
+            // Insert the EXIF segment after SOI and the canvas encoder's JFIF APP0
+            const out = new Uint8Array(await blob.arrayBuffer());
+            let at = 2;
+            if (out[2] === 0xFF && out[3] === 0xE0) at = 4 + ((out[4] << 8) | out[5]);
+            parts = [out.subarray(0, at), uprightExif(header.exif), out.subarray(at)];
+        }
+        const resized = new File(parts, file.name, {type: 'image/jpeg', lastModified: file.lastModified});
+        return resized.size < file.size ? resized : file;
+    }
 })();
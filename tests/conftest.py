@@ -0,0 +1,36 @@
+"""Shared fixtures: an isolated photo library and a Flask test client on it."""
+
+import pytest
+
+
+@pytest.fixture
+def data_dirs(monkeypatch, tmp_path):
+    """Database, settings and every data directory under tmp_path, a 600x448
+    panel and no idle grace for background work. Yields image_processor."""
+    import models
+    import image_processor
+
+    models.close_db()
+    monkeypatch.setattr(models, "DB_PATH", tmp_path / "photos.db")
+    monkeypatch.setattr(models, "SETTINGS_PATH", tmp_path / "settings.json")
+    monkeypatch.setattr(image_processor, "ORIGINALS_DIR", tmp_path / "originals")
+    monkeypatch.setattr(image_processor, "DISPLAY_DIR", tmp_path / "display")
+    monkeypatch.setattr(image_processor, "RENDERS_DIR", tmp_path / "renders")
+    monkeypatch.setattr(image_processor, "THUMBNAILS_DIR", tmp_path / "thumbnails")
+    monkeypatch.setattr(image_processor, "DISPLAY_STATE_FILE", tmp_path / "state.json")
+    monkeypatch.setattr(image_processor, "get_display_size", lambda: (600, 448))
+    monkeypatch.setattr(image_processor.background, "IDLE_GRACE", 0)
+    models.init_db()
+    image_processor.ensure_dirs()
+    yield image_processor
+    models.close_db()
+
+
+@pytest.fixture
+def app_client(data_dirs, monkeypatch):
+    """Test client for the app on data_dirs, with the slideshow kept stopped"""
+    import app as app_module
+
+    monkeypatch.setattr(app_module.scheduler, "start_slideshow", lambda: None)
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
@@ -0,0 +1,139 @@
+"""Memory-aware admission control for image processing.
+
+Bug: nothing limited how many process_upload calls ran at once, so several
+large uploads decoding alongside a reprocess could get the frame OOM-killed.
+Every job now reserves its estimated pixel memory against a shared budget;
+uploads that cannot be admitted in time get 503 + Retry-After.
+"""
+
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+
+def _jpeg_bytes(size=(640, 480), color=(200, 30, 30)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    import admission
+    monkeypatch.setattr(admission, "BUDGET_BYTES", 100)
+    yield admission
+    assert admission.get_status()['active'] == 0
+
+
+def test_jobs_within_budget_run_together(budget):
+    assert budget.acquire(60, timeout=0)
+    assert budget.acquire(40, timeout=0)
+    assert not budget.acquire(1, timeout=0)
+    budget.release(60)
+    budget.release(40)
+
+
+def test_oversized_job_runs_alone(budget):
+    assert budget.acquire(500, timeout=0)
+    assert not budget.acquire(1, timeout=0)
+    budget.release(500)
+    assert budget.acquire(500, timeout=0)
+    budget.release(500)
+
+
+def test_waiting_job_admitted_when_budget_frees(budget):
+    assert budget.acquire(80, timeout=0)
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(budget.acquire(50, timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    assert not admitted
+    budget.release(80)
+    waiter.join()
+    assert admitted == [True]
+    budget.release(50)
+
+
+def test_queue_is_fifo_so_large_jobs_are_not_starved(budget):
+    assert budget.acquire(60, timeout=0)
+    order = []
+
+    def job(cost):
+        budget.acquire(cost, timeout=5)
+        order.append(cost)
+        budget.release(cost)
+
+    big = threading.Thread(target=job, args=(90,))
+    big.start()
+    time.sleep(0.05)
+    # Would fit right now, but must queue behind the waiting 90
+    small = threading.Thread(target=job, args=(10,))
+    small.start()
+    time.sleep(0.05)
+    assert order == []
+    budget.release(60)
+    big.join()
+    small.join()
+    assert order == [90, 10]
+
+
+def test_reserve_raises_busy_on_timeout(budget):
+    with budget.reserve(100):
+        with pytest.raises(budget.Busy) as exc:
+            with budget.reserve(10, timeout=0.01):
+                pass
+    assert exc.value.retry_after == budget.RETRY_AFTER
+
+
+def test_estimate_uses_jpeg_draft_size(monkeypatch):
+    import image_processor
+    monkeypatch.setattr(image_processor, "get_display_size", lambda: (600, 448))
+
+    buf = io.BytesIO()
+    Image.new('RGB', (8000, 6000)).save(buf, "JPEG")
+    jpeg = image_processor.estimate_render_cost(Image.open(buf))
+    buf = io.BytesIO()
+    Image.new('RGB', (8000, 6000)).save(buf, "PNG")
+    png = image_processor.estimate_render_cost(Image.open(buf))
+
+    assert png > 8000 * 6000 * 4       # full-size decode
+    assert jpeg < 8000 * 6000 * 4 / 8  # 1/8 DCT scaling
+
+
+@pytest.fixture
+def client(app_client):
+    import models
+
+    models.update_settings({"slideshow": {"auto_start": False}})
+    return app_client
+
+
+def test_upload_gets_503_when_budget_stays_full(client, budget, monkeypatch):
+    import image_processor
+    monkeypatch.setattr(budget, "QUEUE_TIMEOUT", 0.01)
+
+    with budget.reserve(100):
+        resp = client.post('/api/photos/upload',
+                           data={'file': (io.BytesIO(_jpeg_bytes()), 'a.jpg')},
+                           content_type='multipart/form-data')
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == str(budget.RETRY_AFTER)
+    assert not any(image_processor.ORIGINALS_DIR.iterdir())  # nothing written
+
+    resp = client.post('/api/photos/upload',
+                       data={'file': (io.BytesIO(_jpeg_bytes()), 'a.jpg')},
+                       content_type='multipart/form-data')
+    assert resp.status_code == 200
+
+
+def test_png_upload_is_admitted(client, budget):
+    # Sizing the job reads EXIF, which made a later verify() reject every PNG
+    buf = io.BytesIO()
+    Image.new('RGB', (640, 480), (30, 90, 200)).save(buf, "PNG")
+    resp = client.post('/api/photos/upload',
+                       data={'file': (io.BytesIO(buf.getvalue()), 'a.png')},
+                       content_type='multipart/form-data')
+    assert resp.status_code == 200
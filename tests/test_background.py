@@ -0,0 +1,131 @@
+"""Idle-aware background maintenance.
+
+Reprocessing and the hash backfills ran flat out at normal priority,
+competing with uploads, gallery requests and panel refreshes for the Pi's
+cores. Maintenance now runs at reduced priority and pauses between items
+while a request is in flight or the panel is busy, checkpointing its
+progress so nothing is lost if the frame is switched off while paused.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import background
+import display_cache
+
+
+@pytest.fixture(autouse=True)
+def quick(monkeypatch):
+    monkeypatch.setattr(background, "IDLE_GRACE", 0)
+    monkeypatch.setattr(background, "POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(background.display, "is_busy", lambda: False)
+
+
+@pytest.fixture
+def library(data_dirs):
+    for stem in ("a", "b", "c", "d"):
+        Image.new('RGB', (800, 600), (90, 120, 150)).save(
+            data_dirs.ORIGINALS_DIR / f"{stem}.jpg", "JPEG")
+    return data_dirs
+
+
+def _until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_task_waits_for_foreground_work():
+    assert background.wait_idle("test")  # idle: no wait
+
+    pauses = []
+    background.begin()
+    waiter = threading.Thread(target=background.wait_idle, args=("test",),
+                              kwargs={'on_pause': lambda: pauses.append(1)})
+    waiter.start()
+    _until(lambda: background.get_status()['paused'] == ["test"])
+    assert not background.get_status()['idle']
+
+    background.end()
+    waiter.join(5)
+    assert not waiter.is_alive()
+    assert pauses == [1]
+    assert background.get_status() == {'idle': True, 'active_requests': 0, 'paused': []}
+
+
+def test_busy_panel_pauses_and_interrupt_stops_waiting(monkeypatch):
+    monkeypatch.setattr(background.display, "is_busy", lambda: True)
+    stop = threading.Event()
+    threading.Timer(0.05, stop.set).start()
+
+    assert background.wait_idle("test", interrupt=stop.is_set) is False
+
+
+def test_progress_polling_does_not_count_as_foreground(library, monkeypatch):
+    import app as app_module
+
+    for name in ("is_wifi_connected", "get_wifi_status", "is_ap_mode"):
+        monkeypatch.setattr(app_module.wifi_manager, name, lambda: None)
+    seen = []
+    get_all_photos = app_module.models.get_all_photos
+
+    def recording(*args, **kwargs):
+        seen.append(background.get_status()['active_requests'])
+        return get_all_photos(*args, **kwargs)
+
+    monkeypatch.setattr(app_module.models, "get_all_photos", recording)
+    client = app_module.app.test_client()
+
+    assert client.get('/api/status').get_json()['background']['active_requests'] == 0
+    client.get('/api/photos')
+    assert seen == [1]
+    assert background.get_status()['active_requests'] == 0
+
+
+def test_reprocess_pauses_with_checkpoint_and_serves_priority(library, monkeypatch):
+    library.reprocess_display_images("cover")
+    rendered = []
+    save = display_cache.save
+
+    def recording_save(img, path, fmt):
+        if path.stem == "a":
+            background.begin()  # a request arrives while "a" renders
+        rendered.append(path.stem)
+        save(img, path, fmt)
+
+    monkeypatch.setattr(library.display_cache, "save", recording_save)
+    worker = threading.Thread(target=library.reprocess_display_images, args=("contain",))
+    worker.start()
+    try:
+        _until(lambda: background.get_status()['paused'] == ["reprocess"])
+        # Paused after "a", with its progress on disk
+        assert rendered == ["a"]
+        assert library.get_display_state()['rendered'] == {"a": "contain/-/horizontal"}
+
+        # The slideshow still gets the photo it is about to show
+        assert library.prioritize_reprocess(library.DISPLAY_DIR / "c.png")
+        _until(lambda: rendered == ["a", "c"] and background.get_status()['paused'])
+    finally:
+        background.end()
+    worker.join(5)
+
+    assert rendered == ["a", "c", "b", "d"]
+    state = library.get_display_state()
+    assert state['fit_mode'] == "contain" and 'rendered' not in state
+
+
+@pytest.mark.skipif(not hasattr(os, "getpriority"), reason="POSIX only")
+def test_tasks_run_at_reduced_priority():
+    main = os.getpriority(os.PRIO_PROCESS, threading.get_native_id())
+    seen = []
+    background.start(lambda: seen.append(
+        os.getpriority(os.PRIO_PROCESS, threading.get_native_id()))).join(5)
+
+    assert seen == [max(main, background.NICE)]
+    # Only the task's own thread is reniced
+    assert os.getpriority(os.PRIO_PROCESS, threading.get_native_id()) == main
@@ -0,0 +1,122 @@
+"""Batch upload endpoint.
+
+The web client uploaded files strictly one at a time, each a separate POST
+with its own settings load, validation and photo count. /api/photos/upload-batch
+takes many files in one request, streams a result line per file as NDJSON and
+stores all new rows in one transaction.
+"""
+
+import io
+import json
+
+import pytest
+from PIL import Image
+
+
+def _jpeg_bytes(color, size=(640, 480)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def library(data_dirs):
+    import models
+
+    return models, data_dirs
+
+
+@pytest.fixture
+def client(library, monkeypatch):
+    import app as app_module
+    started = []
+    monkeypatch.setattr(app_module.scheduler, "start_slideshow", lambda: started.append(1))
+    app_module.app.config['TESTING'] = True
+    client = app_module.app.test_client()
+    client.slideshow_starts = started
+    return client
+
+
+def _post_batch(client, files, **kwargs):
+    return client.post('/api/photos/upload-batch',
+                       data={'files': [(io.BytesIO(data), name) for name, data in files]},
+                       content_type='multipart/form-data', **kwargs)
+
+
+def _lines(resp):
+    return [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+
+def test_batch_reports_each_file_and_stores_in_one_transaction(client, library, monkeypatch):
+    models, _ = library
+    existing = _jpeg_bytes((0, 0, 200))
+    client.post('/api/photos/upload', data={'file': (io.BytesIO(existing), 'old.jpg')},
+                content_type='multipart/form-data')
+    client.slideshow_starts.clear()
+
+    single_inserts = []
+    monkeypatch.setattr(models, "add_photo", lambda *a, **k: single_inserts.append(a))
+    red, green = _jpeg_bytes((200, 0, 0)), _jpeg_bytes((0, 200, 0))
+    resp = _post_batch(client, [("a.jpg", red), ("b.jpg", green), ("c.jpg", red),
+                                ("d.jpg", existing), ("e.txt", b"not an image")])
+
+    assert resp.mimetype == 'application/x-ndjson'
+    *per_file, summary = _lines(resp)
+    assert [(l['index'], l['status']) for l in per_file] == [
+        (0, 'processed'), (1, 'processed'), (2, 'duplicate'), (3, 'duplicate'), (4, 'error')]
+    assert per_file[3]['photo']['filename'].endswith('.jpg')
+    assert summary['done'] and summary['added'] == 2
+    assert [p['index'] for p in summary['photos']] == [0, 1]
+    assert single_inserts == []
+    assert models.get_photo_count() == 3
+    assert client.slideshow_starts == []  # library wasn't empty
+
+
+def test_first_batch_starts_slideshow(client):
+    resp = _post_batch(client, [("a.jpg", _jpeg_bytes((1, 2, 3)))])
+    assert _lines(resp)[-1]['added'] == 1
+    assert client.slideshow_starts == [1]
+
+
+def test_busy_files_are_reported_for_retry(client, library, monkeypatch):
+    import admission
+    monkeypatch.setattr(admission, "BUDGET_BYTES", 100)
+    monkeypatch.setattr(admission, "QUEUE_TIMEOUT", 0.01)
+
+    with admission.reserve(100):
+        resp = _post_batch(client, [("a.jpg", _jpeg_bytes((9, 9, 9)))])
+    line, summary = _lines(resp)
+    assert line['status'] == 'busy'
+    assert line['retry_after'] == admission.RETRY_AFTER
+    assert summary['added'] == 0
+
+
+def test_duplicate_deleted_mid_batch_is_reported(client, library, monkeypatch):
+    models, image_processor = library
+    monkeypatch.setattr(image_processor, "process_upload",
+                        lambda *a, **k: {'duplicate_of': 999, 'content_hash': "gone"})
+    line, summary = _lines(_post_batch(client, [("a.jpg", _jpeg_bytes((5, 5, 5)))]))
+    assert line['status'] == 'error'
+    assert summary['done'] and summary['added'] == 0
+
+
+def test_processed_files_are_stored_if_client_disconnects(client, library):
+    models, _ = library
+    resp = _post_batch(client, [("a.jpg", _jpeg_bytes((1, 1, 1))),
+                                ("b.jpg", _jpeg_bytes((2, 2, 2)))], buffered=False)
+    first = json.loads(next(iter(resp.response)))
+    assert first['status'] == 'processed'
+    resp.close()
+
+    assert models.get_photo_count() == 1
+
+
+def test_add_photos_skips_existing_hashes(library):
+    models, _ = library
+    models.add_photo("a.jpg", "/o/a", "/d/a", "/t/a", content_hash="h1")
+    rows = [dict(filename=n, original_path=f"/o/{n}", display_path=f"/d/{n}",
+                 thumbnail_path=f"/t/{n}", content_hash=h)
+            for n, h in (("b.jpg", "h1"), ("c.jpg", "h2"))]
+    ids = models.add_photos(rows)
+    assert ids[0] is None and ids[1] is not None
+    assert models.get_photo_count() == 2
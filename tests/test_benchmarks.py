@@ -0,0 +1,44 @@
+"""Benchmark harness sanity checks: reproducible corpus, regression comparison."""
+
+import io
+
+from PIL import Image, ImageOps
+
+from benchmarks import harness
+from benchmarks.corpus import build_corpus
+
+
+def test_corpus_is_deterministic():
+    a = build_corpus(seed=7, quick=True)
+    b = build_corpus(seed=7, quick=True)
+    assert [x['name'] for x in a] == [x['name'] for x in b]
+    assert all(x['data'] == y['data'] for x, y in zip(a, b))
+
+
+def test_corpus_exif_orientation_is_honoured():
+    item = next(x for x in build_corpus(quick=True) if x['orientation'] == 6)
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(item['data'])))
+    w, h = item['size']
+    assert img.size == (h, w)
+
+
+def test_compare_flags_regressions_over_threshold():
+    baseline = {'results': [
+        {'name': 'a', 'median_s': 0.100, 'rss_delta_kb': 10000},
+        {'name': 'b', 'median_s': 0.100, 'rss_delta_kb': 10000},
+    ]}
+    current = {'results': [
+        {'name': 'a', 'median_s': 0.105, 'rss_delta_kb': 10000},   # within 15%
+        {'name': 'b', 'median_s': 0.200, 'rss_delta_kb': 30000},   # 2x slower, 3x bigger
+        {'name': 'c', 'median_s': 9.0, 'rss_delta_kb': 1},         # no baseline
+    ]}
+    rows = harness.compare(baseline, current, threshold=0.15)
+    flagged = {(r['name'], r['metric']) for r in rows if r['regression']}
+    assert flagged == {('b', 'median_s'), ('b', 'rss_delta_kb')}
+
+
+def test_measure_reports_timing_and_memory():
+    result = harness.measure("alloc", lambda: bytearray(8 * 1024 * 1024), repeat=2)
+    assert 'error' not in result
+    assert result['repeat'] == 2
+    assert result['median_s'] >= 0
@@ -0,0 +1,123 @@
+"""Boot without a redundant panel refresh.
+
+Every restart called start_slideshow(), which showed the next photo at once:
+a ~30 s full e-ink refresh that also advanced the slideshow, although the
+panel still showed the last photo. The display now records a fingerprint of
+what is on the panel, and a boot-time start keeps that photo for the rest of
+its interval.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def boot(monkeypatch, tmp_path):
+    import importlib
+    import display
+    import models
+    import scheduler
+
+    monkeypatch.setattr(models, "SETTINGS_PATH", tmp_path / "settings.json")
+    monkeypatch.setattr(display, "PANEL_STATE_FILE", tmp_path / "panel.json")
+    monkeypatch.setattr(scheduler, "SCHEDULE_STATE_FILE", tmp_path / "schedule.json")
+    monkeypatch.setattr(display, "MOCK_DISPLAY_PATH", tmp_path / "mock.png")
+    monkeypatch.setattr(display, "_display", display.MockDisplay())
+
+    photos = []
+    for i in range(3):
+        path = tmp_path / f"p{i}.png"
+        Image.new('RGB', (600, 448), (i * 80, 0, 0)).save(path)
+        photos.append(str(path))
+    monkeypatch.setattr(scheduler.models, "get_display_photos", lambda: photos)
+
+    shown = []
+    monkeypatch.setattr(scheduler.display, "show_photo", lambda path, sat, **kw: shown.append(path))
+    models.save_settings({
+        "slideshow": {"order": "sequential", "interval_minutes": 60, "enabled": True,
+                      "current_photo_path": photos[1]},
+        "display": {"saturation": 0.5},
+    })
+    scheduler._scheduler = None
+    scheduler._current_path = None
+    scheduler._shuffle_bag = []
+    scheduler._history = []
+    scheduler._initialized = False  # load persisted state like a fresh process
+
+    yield scheduler, display, photos, shown
+
+    if scheduler._scheduler is not None:
+        scheduler._scheduler.shutdown(wait=False)
+    importlib.reload(scheduler)
+
+
+def _put_on_panel(display, path, saturation=0.5, minutes_ago=0):
+    display._record_panel_state(display._photo_fingerprint(path, saturation))
+    state = display.get_panel_state()
+    state['shown_at'] = time.time() - minutes_ago * 60
+    display.PANEL_STATE_FILE.write_text(json.dumps(state))
+
+
+def _next_run(scheduler):
+    job = scheduler.get_scheduler().get_job("photo_cycle")
+    return job.next_run_time.replace(tzinfo=None)
+
+
+def test_photo_on_panel_is_kept_for_rest_of_interval(boot):
+    scheduler, display, photos, shown = boot
+    _put_on_panel(display, photos[1], minutes_ago=20)
+
+    scheduler.start_slideshow(resume=True)
+
+    assert shown == []
+    remaining = _next_run(scheduler) - datetime.now()
+    assert timedelta(minutes=39) < remaining < timedelta(minutes=41)
+
+
+def test_different_photo_on_panel_refreshes(boot):
+    scheduler, display, photos, shown = boot
+    _put_on_panel(display, photos[0])
+    scheduler.start_slideshow(resume=True)
+    assert shown == [photos[2]]
+
+
+def test_rerendered_file_or_new_saturation_refreshes(boot):
+    scheduler, display, photos, shown = boot
+    _put_on_panel(display, photos[1], saturation=0.8)
+    scheduler.start_slideshow(resume=True)
+    assert len(shown) == 1
+
+    shown.clear()
+    _put_on_panel(display, photos[1])
+    Image.new('RGB', (600, 448), (0, 0, 255)).save(photos[1])  # reprocessed
+    scheduler._initialized = False
+    scheduler.start_slideshow(resume=True)
+    assert len(shown) == 1
+
+
+def test_overdue_photo_refreshes(boot):
+    scheduler, display, photos, shown = boot
+    _put_on_panel(display, photos[1], minutes_ago=90)
+    scheduler.start_slideshow(resume=True)
+    assert shown == [photos[2]]
+
+
+def test_manual_start_always_shows_next(boot):
+    scheduler, display, photos, shown = boot
+    _put_on_panel(display, photos[1])
+    scheduler.start_slideshow()
+    assert shown == [photos[2]]
+
+
+def test_panel_state_follows_refreshes(boot):
+    _, display, photos, _ = boot
+    display._show_on_display(Image.new('RGB', (600, 448)), 0.5,
+                             display._photo_fingerprint(photos[0], 0.5))
+    assert display.panel_shows(photos[0]) is not None
+
+    display._show_on_display(Image.new('RGB', (600, 448)))  # info screen
+    assert display.panel_shows(photos[0]) is None
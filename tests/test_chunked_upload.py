@@ -0,0 +1,113 @@
+"""Resumable chunked uploads.
+
+A large photo sent over flaky WiFi was one multipart POST: a dropped
+connection near the end threw away everything and the browser started the
+file over. /api/uploads keeps received bytes on disk per session so clients
+resume from the server's offset.
+"""
+
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+
+def _jpeg_bytes(color, size=(640, 480)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(app_client, monkeypatch, tmp_path):
+    import chunked_upload
+
+    monkeypatch.setattr(chunked_upload, "PARTIAL_DIR", tmp_path / "partial")
+    monkeypatch.setattr(chunked_upload, "_session_locks", {})
+    return app_client
+
+
+def _start(client, data, name="big.jpg"):
+    resp = client.post('/api/uploads', json={'filename': name, 'size': len(data)})
+    assert resp.status_code == 200
+    return resp.get_json()['upload_id']
+
+
+def test_resume_after_dropped_chunk_then_complete(client):
+    import models
+    data = _jpeg_bytes((200, 10, 10))
+    upload_id = _start(client, data)
+    half = len(data) // 2
+
+    assert client.put(f'/api/uploads/{upload_id}?offset=0', data=data[:half]).get_json()['offset'] == half
+    # The client lost the response and asks where to continue
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['offset'] == half
+
+    incomplete = client.post(f'/api/uploads/{upload_id}/complete')
+    assert incomplete.status_code == 409
+
+    client.put(f'/api/uploads/{upload_id}?offset={half}', data=data[half:])
+    resp = client.post(f'/api/uploads/{upload_id}/complete')
+    assert resp.status_code == 200
+    assert resp.get_json()['photo']['filename'].endswith('.jpg')
+    assert models.get_photo_count() == 1
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
+
+
+def test_offset_mismatch_reports_current_offset(client):
+    data = _jpeg_bytes((10, 200, 10))
+    upload_id = _start(client, data)
+    client.put(f'/api/uploads/{upload_id}?offset=0', data=data[:100])
+
+    resp = client.put(f'/api/uploads/{upload_id}?offset=0', data=data[:100])
+    assert resp.status_code == 409
+    assert resp.get_json()['offset'] == 100
+
+
+def test_data_beyond_declared_size_is_rejected(client):
+    upload_id = _start(client, b"x" * 10)
+    resp = client.put(f'/api/uploads/{upload_id}?offset=0', data=b"x" * 20)
+    assert resp.status_code == 413
+    assert client.get(f'/api/uploads/{upload_id}').status_code == 404
+
+
+def test_start_validates_type_and_size(client):
+    assert client.post('/api/uploads', json={'filename': 'a.txt', 'size': 10}).status_code == 400
+    assert client.post('/api/uploads', json={'filename': 'a.jpg', 'size': 10 ** 10}).status_code == 413
+
+
+def test_bad_upload_ids_are_not_paths(client):
+    import chunked_upload
+    assert client.get('/api/uploads/..%2F..%2Fsettings').status_code == 404
+    assert client.put('/api/uploads/nothex?offset=0', data=b"x").status_code == 404
+    assert client.put(f'/api/uploads/{"0" * 32}?offset=0', data=b"x").status_code == 404
+    assert chunked_upload._session_locks == {}  # nothing kept for ids without a session
+
+
+def test_busy_complete_keeps_session(client, monkeypatch):
+    import admission
+    monkeypatch.setattr(admission, "BUDGET_BYTES", 100)
+    monkeypatch.setattr(admission, "QUEUE_TIMEOUT", 0.01)
+    data = _jpeg_bytes((1, 2, 3))
+    upload_id = _start(client, data)
+    client.put(f'/api/uploads/{upload_id}?offset=0', data=data)
+
+    with admission.reserve(100):
+        resp = client.post(f'/api/uploads/{upload_id}/complete')
+    assert resp.status_code == 503
+    assert client.get(f'/api/uploads/{upload_id}').get_json()['offset'] == len(data)
+
+
+def test_stale_sessions_are_collected(client):
+    import chunked_upload
+    old = chunked_upload.start("old.jpg", 10)
+    fresh = chunked_upload.start("new.jpg", 10)
+    past = time.time() - chunked_upload.STALE_AFTER - 60
+    for suffix in (".part", ".json"):
+        os.utime(chunked_upload.PARTIAL_DIR / f"{old['upload_id']}{suffix}", (past, past))
+
+    assert chunked_upload.collect_stale() == 1
+    assert chunked_upload.get(old['upload_id']) is None
+    assert chunked_upload.get(fresh['upload_id']) is not None
@@ -0,0 +1,123 @@
+"""Uploads shrunk in the browser.
+
+With upload.resize_in_browser on, upload.js resizes JPEGs to
+upload.resize_max_edge before sending. Browsers decode the pixels upright
+(they apply EXIF orientation even when asked not to), so it copies the
+original APP1 (EXIF) segment into the re-encoded file with Orientation reset
+to 1, after the encoder's JFIF header. These tests build such a file the
+same way and check the server shows it upright, not rotated twice, and
+keeps the capture date.
+"""
+
+import io
+import struct
+
+import pytest
+from PIL import Image, ImageChops, ImageOps, ImageStat
+
+DATE = "2024:06:01 12:34:56"
+
+
+def _camera_jpeg(orientation=6):
+    """1600x800 sensor image, red on the left and blue at bottom right, with
+    the given EXIF orientation (6: sideways, 'rotate 90 CW')"""
+    img = Image.new('RGB', (1600, 800), (200, 30, 30))
+    img.paste((30, 30, 200), (1200, 400, 1600, 800))
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[306] = DATE
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def _segments(data):
+    """(marker, start, end) of each JPEG segment before the scan"""
+    i = 2
+    while data[i] == 0xFF and data[i + 1] != 0xDA:
+        end = i + 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+        yield data[i + 1], i, end
+        i = end
+
+
+def _upright_exif(segment):
+    """upload.js uprightExif(): the APP1 segment with Orientation set to 1"""
+    exif = bytearray(segment)
+    tiff = 10
+    order = '<' if exif[tiff:tiff + 2] == b'II' else '>'
+    ifd = tiff + struct.unpack_from(order + 'I', exif, tiff + 4)[0]
+    for n in range(struct.unpack_from(order + 'H', exif, ifd)[0]):
+        entry = ifd + 2 + n * 12
+        if struct.unpack_from(order + 'H', exif, entry)[0] == 0x0112:
+            struct.pack_into(order + 'H', exif, entry + 8, 1)
+    return bytes(exif)
+
+
+def _browser_resize(data, max_edge):
+    """What upload.js shrink() produces"""
+    exif = next(data[s:e] for m, s, e in _segments(data) if m == 0xE1)
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))  # imageOrientation: 'from-image'
+    scale = max_edge / max(img.size)
+    small = img.resize((round(img.width * scale), round(img.height * scale)))
+    buf = io.BytesIO()
+    small.save(buf, "JPEG", quality=90)
+    out = buf.getvalue()
+    app0_end = next(e for m, s, e in _segments(out) if m == 0xE0)
+    return out[:app0_end] + _upright_exif(exif) + out[app0_end:]
+
+
+@pytest.fixture
+def client(app_client):
+    return app_client
+
+
+def test_resized_upload_keeps_orientation_and_date(client):
+    import display_cache
+    import models
+
+    data = _browser_resize(_camera_jpeg(), 800)
+    assert Image.open(io.BytesIO(data)).size == (400, 800)
+
+    resp = client.post('/api/photos/upload', data={'file': (io.BytesIO(data), 'IMG_1.jpg')},
+                       content_type='multipart/form-data')
+    assert resp.get_json()['success']
+
+    photo = models.get_all_photos()[0]
+    assert photo['date_taken'] == DATE
+    # Upright the photo is portrait, so "contain" letterboxes left and right
+    shown = display_cache.load(photo['display_path'])
+    assert shown.getpixel((5, 224)) == (0, 0, 0)
+    assert shown.getpixel((300, 224))[0] > 150
+
+
+@pytest.mark.parametrize("orientation", range(1, 9))
+def test_resized_upload_is_shown_like_the_original(client, orientation):
+    import display_cache
+    import image_processor
+    import models
+
+    original = _camera_jpeg(orientation)
+    data = _browser_resize(original, 800)
+    resp = client.post('/api/photos/upload', data={'file': (io.BytesIO(data), 'IMG_1.jpg')},
+                       content_type='multipart/form-data')
+    assert resp.get_json()['success']
+
+    shown = display_cache.load(models.get_all_photos()[0]['display_path'])
+    expected = image_processor.resize_for_display(
+        ImageOps.exif_transpose(Image.open(io.BytesIO(original))))
+    assert ImageStat.Stat(ImageChops.difference(shown, expected).convert('L')).mean[0] < 8
+
+
+def test_resize_settings_are_validated(client):
+    resp = client.post('/api/settings', json={'upload': {'resize_in_browser': 1,
+                                                         'resize_max_edge': 50}})
+    upload = resp.get_json()['settings']['upload']
+    assert upload['resize_in_browser'] is True
+    assert upload['resize_max_edge'] == 800
+    assert upload['max_file_size_mb'] == 20
+
+
+def test_gallery_passes_max_edge_only_when_enabled(client):
+    assert b'data-resize-max-edge="0"' in client.get('/').data
+    client.post('/api/settings', json={'upload': {'resize_in_browser': True}})
+    assert b'data-resize-max-edge="2400"' in client.get('/').data
@@ -0,0 +1,51 @@
+"""Cold-start guard: importing the app must not pull in heavy modules.
+
+On a Pi Zero, importing cv2/numpy/qrcode/inky/APScheduler eagerly and probing
+the panel before app.run() kept the web server offline for many seconds after
+boot. These modules are now imported on first use; this test fails if a
+top-level import sneaks one back in.
+"""
+
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ("cv2", "numpy", "qrcode", "inky", "apscheduler")
+
+
+def test_importing_app_does_not_load_heavy_modules():
+    code = (
+        "import sys, app\n"
+        f"print('LOADED=' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR,
+                         capture_output=True, text=True, check=True)
+    loaded = out.stdout.rsplit("LOADED=", 1)[1].strip()
+    assert loaded == "", f"heavy modules imported at startup: {loaded}"
+
+
+def test_concurrent_display_init_probes_once(monkeypatch):
+    import display
+
+    created = []
+
+    class CountingMock(display.MockDisplay):
+        def __init__(self):
+            created.append(self)
+            super().__init__()
+
+    monkeypatch.setattr(display, "_display", None)
+    monkeypatch.setattr(display, "_load_inky_auto", lambda: None)
+    monkeypatch.setattr(display, "MockDisplay", CountingMock)
+
+    display.init_display_async()
+    threads = [threading.Thread(target=display.get_display) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(created) == 1
+    assert display.get_display_size() == (display.DISPLAY_WIDTH, display.DISPLAY_HEIGHT)
@@ -0,0 +1,113 @@
+"""Content-hash deduplication of uploads.
+
+Bug: every upload got a fresh uuid4 name, so the same photo uploaded from two
+phones was decoded, face-detected, rendered and stored twice, and showed up
+twice in the shuffle bag. Uploads are now SHA-256 hashed as they are read,
+the hash is unique in the photos table, and duplicates short-circuit before
+any image work.
+"""
+
+import io
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+
+def _jpeg_bytes(color=(200, 30, 30), size=(640, 480)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def library(data_dirs):
+    import models
+
+    models.update_settings({"slideshow": {"auto_start": False}})
+    return models, data_dirs
+
+
+@pytest.fixture
+def client(library, app_client):
+    return app_client
+
+
+def _upload(client, data, name="photo.jpg"):
+    return client.post('/api/photos/upload',
+                       data={'file': (io.BytesIO(data), name)},
+                       content_type='multipart/form-data')
+
+
+def test_second_upload_returns_existing_photo(client, library):
+    models, image_processor = library
+    data = _jpeg_bytes()
+
+    first = _upload(client, data, "a.jpg").get_json()
+    with patch.object(image_processor, "resize_for_display") as resize:
+        second = _upload(client, data, "b.jpg").get_json()
+        resize.assert_not_called()  # short-circuited before any image work
+
+    assert first['success'] and second['success']
+    assert second['duplicate'] is True
+    assert second['photo']['id'] == first['photo']['id']
+    assert models.get_photo_count() == 1
+    assert len(list(image_processor.ORIGINALS_DIR.iterdir())) == 1
+
+
+def test_different_photos_are_both_stored(client, library):
+    models, _ = library
+    _upload(client, _jpeg_bytes((10, 10, 10)))
+    resp = _upload(client, _jpeg_bytes((250, 250, 250))).get_json()
+    assert 'duplicate' not in resp
+    assert models.get_photo_count() == 2
+
+
+def test_unique_index_rejects_same_hash(library):
+    models, _ = library
+    models.add_photo("a.jpg", "/o/a.jpg", "/d/a.png", "/t/a.jpg", content_hash="abc")
+    with pytest.raises(sqlite3.IntegrityError):
+        models.add_photo("b.jpg", "/o/b.jpg", "/d/b.png", "/t/b.jpg", content_hash="abc")
+
+
+def test_init_db_migrates_old_schema(monkeypatch, tmp_path):
+    import models
+    models.close_db()
+    db = tmp_path / "old.db"
+    conn = sqlite3.connect(str(db))
+    conn.execute('''CREATE TABLE photos (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT NOT NULL UNIQUE, original_path TEXT NOT NULL,
+                    display_path TEXT NOT NULL, thumbnail_path TEXT NOT NULL,
+                    width INTEGER, height INTEGER, file_size INTEGER, mime_type TEXT,
+                    date_taken TEXT, uploaded_at TEXT NOT NULL,
+                    display_order INTEGER DEFAULT 0, is_favorite INTEGER DEFAULT 0)''')
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(models, "DB_PATH", db)
+    try:
+        models.init_db()
+        cols = {row[1] for row in models.get_db().execute('PRAGMA table_info(photos)')}
+        assert 'content_hash' in cols
+    finally:
+        models.close_db()
+
+
+def test_backfill_hashes_existing_and_reports_duplicates(library):
+    models, image_processor = library
+    image_processor.ensure_dirs()
+    data = _jpeg_bytes()
+    for name in ("a.jpg", "b.jpg"):
+        (image_processor.ORIGINALS_DIR / name).write_bytes(data)
+    (image_processor.ORIGINALS_DIR / "c.jpg").write_bytes(_jpeg_bytes((0, 0, 255)))
+    ids = [models.add_photo(n, str(image_processor.ORIGINALS_DIR / n), f"/d/{n}", f"/t/{n}")
+           for n in ("a.jpg", "b.jpg", "c.jpg")]
+    models.add_photo("gone.jpg", "/nowhere/gone.jpg", "/d/g", "/t/g")
+
+    report = image_processor.backfill_content_hashes()
+
+    assert report['hashed'] == 2
+    assert report['missing'] == 1
+    assert report['duplicates'] == [{'id': ids[1], 'duplicate_of': ids[0]}]
+    assert models.get_photo_id_by_hash(image_processor.hash_file(
+        image_processor.ORIGINALS_DIR / "a.jpg")) == ids[0]
@@ -0,0 +1,135 @@
+"""Configurable storage format for display images.
+
+Display images were always zlib-6 PNGs, which are slow to encode on ARM and
+decoded again at every slideshow transition. They can now be stored raw
+(header + RGB rows), as fast-compressed PNG or as 256-colour PNG, and
+existing images are converted when the format setting changes.
+"""
+
+import pytest
+from PIL import Image
+
+import display_cache
+
+
+def _gradient(size=(600, 448)):
+    return Image.merge('RGB', [Image.linear_gradient('L').resize(size)] * 2
+                       + [Image.new('L', size, 90)])
+
+
+@pytest.mark.parametrize("fmt", ["raw", "png"])
+def test_lossless_formats_round_trip(tmp_path, fmt):
+    img = _gradient()
+    path = display_cache.save(img, tmp_path / "a", fmt)
+    assert path.suffix == display_cache.EXTENSIONS[fmt]
+    assert display_cache.format_of(path) == fmt
+    assert display_cache.load(path).tobytes() == img.tobytes()
+
+
+def test_palette_is_smallest(tmp_path):
+    img = _gradient()
+    sizes = {fmt: display_cache.save(img, tmp_path / fmt, fmt).stat().st_size
+             for fmt in display_cache.FORMATS}
+    assert sizes['palette'] < sizes['png'] < sizes['raw']
+    loaded = display_cache.load(tmp_path / "palette.png")
+    assert loaded.mode == 'RGB' and loaded.size == img.size
+    assert display_cache.format_of(tmp_path / "palette.png") == "palette"
+
+
+def test_truncated_raw_is_rejected(tmp_path):
+    path = display_cache.save(_gradient(), tmp_path / "a", "raw")
+    path.write_bytes(path.read_bytes()[:1000])
+    with pytest.raises(ValueError):
+        display_cache.load(path)
+
+
+def test_raw_array_is_a_view_of_the_file(tmp_path):
+    np = pytest.importorskip("numpy")
+    img = _gradient()
+    path = display_cache.save(img, tmp_path / "a", "raw")
+
+    arr = display_cache.load_array(path)
+    assert arr.shape == (448, 600, 3)
+    assert not arr.flags.owndata and not arr.flags.writeable
+    assert np.array_equal(arr, np.asarray(img))
+
+    # Re-rendering replaces the file; the existing mapping keeps the old pixels
+    display_cache.save(Image.new('RGB', (600, 448), (1, 2, 3)), tmp_path / "a", "raw")
+    assert np.array_equal(arr, np.asarray(img))
+    assert display_cache.load_array(path)[0, 0].tolist() == [1, 2, 3]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_raw_photo_is_dithered_from_the_mapping(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    import threading
+    import display
+    import dither
+
+    img = _gradient()
+    path = display_cache.save(img, tmp_path / "a", "raw")
+    panel = display.MockDisplay()
+    monkeypatch.setattr(display, "get_display", lambda: panel)
+    monkeypatch.setattr(display, "MOCK_DISPLAY_PATH", tmp_path / "mock.png")
+    monkeypatch.setattr(display, "PANEL_STATE_FILE", tmp_path / "panel.json")
+    monkeypatch.setattr(display_cache, "load", lambda p: pytest.fail("decoded a raw image"))
+    shown = threading.Event()
+    show = display._show_on_display
+    monkeypatch.setattr(display, "_show_on_display",
+                        lambda *a, **kw: (show(*a, **kw), shown.set()))
+
+    display.show_photo(path, 0.5)
+    assert shown.wait(10)
+    assert panel._img.tobytes() == dither.quantize(img, 0.5).tobytes()
+
+
+@pytest.fixture
+def library(data_dirs):
+    import models
+
+    return models, data_dirs
+
+
+def test_migration_converts_legacy_png(library):
+    models, image_processor = library
+    legacy = image_processor.DISPLAY_DIR / "abc.png"
+    _gradient().save(legacy, "PNG")
+    pid = models.add_photo("abc.jpg", "/o/abc.jpg", str(legacy), "/t/abc.jpg")
+    image_processor._save_display_state("contain", "center", "horizontal", "png")
+
+    assert image_processor.migration_needed(image_processor.get_display_state(), "raw")
+    assert image_processor.migrate_display_cache("raw") == 1
+
+    new_path = models.get_photo(pid)['display_path']
+    assert new_path.endswith("abc.rgb")
+    assert not legacy.exists()
+    assert display_cache.load(new_path).tobytes() == _gradient().tobytes()
+    assert image_processor.get_display_state()['cache_format'] == "raw"
+    assert image_processor.migrate_display_cache("raw") == 0
+
+
+def test_reprocess_in_new_format_replaces_old_files(library):
+    models, image_processor = library
+    _gradient((1200, 900)).save(image_processor.ORIGINALS_DIR / "abc.jpg", "JPEG")
+    old = display_cache.save(_gradient(), image_processor.DISPLAY_DIR / "abc", "png")
+    pid = models.add_photo("abc.jpg", str(image_processor.ORIGINALS_DIR / "abc.jpg"),
+                           str(old), "/t/abc.jpg")
+
+    assert image_processor.reprocess_display_images("cover", cache_format="raw") == 1
+
+    assert not old.exists()
+    assert models.get_photo(pid)['display_path'] == str(old.with_suffix(".rgb"))
+
+
+def test_scheduler_follows_renamed_display_paths(monkeypatch):
+    import scheduler as sched
+
+    monkeypatch.setattr(sched, "_current_path", "/d/a.png")
+    monkeypatch.setattr(sched, "_shuffle_bag", ["/d/b.png", "/d/gone.png"])
+    monkeypatch.setattr(sched, "_history", ["/d/c.png"])
+
+    sched._follow_renames(["/d/a.rgb", "/d/b.rgb", "/d/c.rgb"])
+
+    assert sched._current_path == "/d/a.rgb"
+    assert sched._shuffle_bag == ["/d/b.rgb", "/d/gone.png"]
+    assert sched._history == ["/d/c.rgb"]
@@ -0,0 +1,133 @@
+"""In-project palette quantization and dithering.
+
+The Inky driver dithered every refresh itself (PIL Floyd-Steinberg, no
+choice of algorithm) and MockDisplay did no quantization at all, so the
+mock output and dev-box timings said nothing about the panel. dither.py
+maps images to the 7-colour palette on NumPy arrays with a selectable
+algorithm, and both the panel path and MockDisplay use it.
+"""
+
+import pytest
+from PIL import Image
+
+np = pytest.importorskip("numpy")
+
+import dither
+import display
+
+
+def _gradient(w=96, h=64):
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    return np.stack([np.broadcast_to(x, (h, w)), np.broadcast_to(y, (h, w)),
+                     np.full((h, w), 128, np.float32)], -1).astype(np.uint8)
+
+
+def test_palette_blends_measured_and_ideal_colours():
+    assert dither.palette(1.0).tolist()[4] == list(dither.SATURATED_PALETTE[4])
+    assert dither.palette(0.0).tolist()[4] == list(dither.DESATURATED_PALETTE[4])
+    with pytest.raises(ValueError):
+        dither.palette(0.5)[0, 0] = 1  # shared via the cache, so read-only
+
+
+@pytest.mark.parametrize("algorithm", dither.ALGORITHMS)
+def test_flat_palette_colours_stay_clean(algorithm):
+    # White backgrounds and black text must not pick up speckles
+    for index in (0, 1):
+        colour = dither.palette(0.5)[index].astype(np.uint8)
+        rgb = np.broadcast_to(colour, (40, 50, 3))
+        assert (dither.quantize_array(rgb, 0.5, algorithm) == index).all()
+
+
+@pytest.mark.parametrize("algorithm", dither.ALGORITHMS)
+def test_output_is_palette_indices_matching_average_colour(algorithm):
+    rgb = _gradient()
+    indices = dither.quantize_array(rgb, 0.5, algorithm)
+    assert indices.shape == rgb.shape[:2] and indices.dtype == np.uint8
+    assert indices.max() < 7
+
+    # Over 16x16 blocks the dithered colours average out to the source
+    shown = dither.to_rgb(indices).astype(np.float32)
+    blocks = lambda a: a.reshape(4, 16, 6, 16, 3).mean((1, 3))
+    assert np.abs(blocks(shown) - blocks(rgb.astype(np.float32))).mean() < 20
+
+
+def test_diffusion_matches_sequential_floyd_steinberg():
+    rgb = _gradient(23, 17)
+    pal = dither.palette(0.5).astype(np.float64)
+    work = rgb.astype(np.float64)
+    expected = np.zeros(rgb.shape[:2], np.uint8)
+    h, w = expected.shape
+    for y in range(h):
+        for x in range(w):
+            px = np.clip(work[y, x], 0, 255)
+            i = ((pal - px) ** 2).sum(1).argmin()
+            expected[y, x] = i
+            err = px - pal[i]
+            for dy, dx, k in ((0, 1, 7), (1, -1, 3), (1, 0, 5), (1, 1, 1)):
+                if 0 <= y + dy < h and 0 <= x + dx < w:
+                    work[y + dy, x + dx] += err * k / 16
+
+    got = dither.quantize_array(rgb, 0.5, "diffusion")
+    # float32 vs float64 rounding may flip an occasional near-tie
+    assert (got != expected).mean() < 0.02
+
+
+def test_quantize_returns_palette_image():
+    img = dither.quantize(Image.fromarray(_gradient()).convert('RGBA'), 0.5, "blue-noise")
+    assert img.mode == 'P' and img.size == (96, 64)
+    assert img.getpalette()[:21] == dither.palette(0.5).astype(int).ravel().tolist()
+
+    with pytest.raises(ValueError):
+        dither.quantize_array(_gradient(), 0.5, "atkinson")
+
+
+def test_panels_get_quantized_images(monkeypatch, tmp_path):
+    shown = []
+    # Another panel's measurements: nothing like dither's built-in table
+    measured = [(20, 20, 30), (240, 240, 235), (30, 140, 60), (30, 60, 160),
+                (200, 40, 40), (230, 220, 40), (230, 120, 30)]
+
+    class SevenColour:
+        WHITE, ORANGE = 1, 6
+
+        def _palette_blend(self, saturation=0.5, dtype='uint8'):
+            return [c for colour in measured for c in colour] + [255, 255, 255]
+
+        def set_image(self, img, saturation=0.5):
+            shown.append(img)
+
+        def show(self):
+            pass
+
+    class UnknownColours(SevenColour):
+        _palette_blend = None
+
+    class Monochrome(SevenColour):
+        WHITE, ORANGE = 0, None
+
+    monkeypatch.setattr(display, "PANEL_STATE_FILE", tmp_path / "panel.json")
+    img = Image.fromarray(_gradient())
+    for panel, algorithm, mode in ((SevenColour(), "ordered", 'P'),
+                                   (SevenColour(), "driver", 'RGB'),
+                                   (UnknownColours(), "ordered", 'RGB'),
+                                   (Monochrome(), "ordered", 'RGB')):
+        monkeypatch.setattr(display, "_display", panel)
+        monkeypatch.setattr(display, "_dither_algorithm", algorithm)
+        display._show_on_display(img)
+        got = shown.pop()
+        assert got.mode == mode
+        if mode == 'P':
+            # Dithered against the driver's colours, not the built-in table
+            assert got.getpalette()[:21] == [c for colour in measured for c in colour]
+            flat = np.full((8, 8, 3), measured[2], np.uint8)
+            assert (np.asarray(display._panel_ready(Image.fromarray(flat), 0.5, panel)) == 2).all()
+
+    mock = display.MockDisplay()
+    monkeypatch.setattr(display, "_dither_algorithm", "ordered")
+    mock.set_image(img)
+    assert mock._img.mode == 'P'
+    assert mock._img.tobytes() == dither.quantize(img, 0.5, "ordered").tobytes()
+    monkeypatch.setattr(display, "_dither_algorithm", "driver")
+    mock.set_image(img)
+    assert mock._img.mode == 'RGB'
@@ -0,0 +1,86 @@
+"""Tests for the in-process metrics registry and the /api/metrics endpoint.
+
+Timers and counters are recorded at the pipeline stages (decode, detect,
+resize, encode, ...) and rendered in Prometheus text format for scraping.
+"""
+
+import io
+from unittest.mock import patch
+
+import pytest
+from PIL import Image
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    import metrics
+    metrics.reset()
+    yield metrics
+    metrics.reset()
+
+
+def test_counter_and_histogram_render(clean_metrics):
+    metrics = clean_metrics
+    metrics.inc("inkframe_uploads_total", result="ok")
+    metrics.inc("inkframe_uploads_total", result="ok")
+    metrics.observe("inkframe_stage_seconds", 0.02, stage="decode")
+
+    text = metrics.render_prometheus()
+    assert "# TYPE inkframe_uploads_total counter" in text
+    assert 'inkframe_uploads_total{result="ok"} 2' in text
+    assert "# TYPE inkframe_stage_seconds histogram" in text
+    assert 'inkframe_stage_seconds_bucket{stage="decode",le="0.01"} 0' in text
+    assert 'inkframe_stage_seconds_bucket{stage="decode",le="0.025"} 1' in text
+    assert 'inkframe_stage_seconds_bucket{stage="decode",le="+Inf"} 1' in text
+    assert 'inkframe_stage_seconds_count{stage="decode"} 1' in text
+
+
+def test_timer_records_even_when_block_raises(clean_metrics):
+    metrics = clean_metrics
+    with pytest.raises(ValueError):
+        with metrics.timer("inkframe_stage_seconds", stage="resize"):
+            raise ValueError("boom")
+    count, _ = metrics.get_histogram("inkframe_stage_seconds", stage="resize")
+    assert count == 1
+
+
+def test_label_values_are_escaped(clean_metrics):
+    metrics = clean_metrics
+    metrics.inc("inkframe_test_total", path='a"b\\c')
+    assert 'inkframe_test_total{path="a\\"b\\\\c"} 1' in metrics.render_prometheus()
+
+
+@patch('image_processor.get_display_size', return_value=(600, 448))
+def test_process_upload_records_stage_timings(mock_size, clean_metrics, tmp_path, monkeypatch):
+    import image_processor
+    from werkzeug.datastructures import FileStorage
+
+    monkeypatch.setattr(image_processor, "ORIGINALS_DIR", tmp_path / "originals")
+    monkeypatch.setattr(image_processor, "DISPLAY_DIR", tmp_path / "display")
+    monkeypatch.setattr(image_processor, "RENDERS_DIR", tmp_path / "renders")
+    monkeypatch.setattr(image_processor, "THUMBNAILS_DIR", tmp_path / "thumbnails")
+
+    buf = io.BytesIO()
+    Image.new('RGB', (800, 600), (10, 20, 30)).save(buf, "JPEG")
+    buf.seek(0)
+    result = image_processor.process_upload(FileStorage(buf, filename="a.jpg"))
+
+    assert result is not None
+    for stage in ("hash", "verify", "decode", "resize", "encode"):
+        assert clean_metrics.get_histogram("inkframe_stage_seconds", stage=stage) is not None
+    assert clean_metrics.get_counter("inkframe_uploads_total", result="ok") == 1
+
+
+def test_metrics_endpoint_serves_prometheus_text(clean_metrics, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module.scheduler, "is_slideshow_running", lambda: False)
+    clean_metrics.inc("inkframe_uploads_total", result="ok")
+
+    app_module.app.config['TESTING'] = True
+    resp = app_module.app.test_client().get('/api/metrics')
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain'
+    body = resp.get_data(as_text=True)
+    assert 'inkframe_uploads_total{result="ok"} 1' in body
+    assert "inkframe_display_busy 0" in body
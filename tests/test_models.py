@@ -80,3 +80,10 @@ def test_already_migrated_is_idempotent(settings_dir):
     settings = models.load_settings()
     assert settings['display']['crop_mode'] == 'smart'
     assert 'smart_recenter' not in settings['display']
+
+
+def test_updating_fresh_settings_leaves_defaults_alone(settings_dir):
+    """The first update on a fresh install must not write into DEFAULT_SETTINGS"""
+    import models
+    models.update_settings({"slideshow": {"auto_start": False}})
+    assert models.DEFAULT_SETTINGS["slideshow"]["auto_start"] is True
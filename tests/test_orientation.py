@@ -76,10 +76,11 @@ class TestDisplayStateOrientation:
         original = image_processor.DISPLAY_STATE_FILE
         image_processor.DISPLAY_STATE_FILE = tmp_path / ".display_state.json"
         try:
-            image_processor._save_display_state("cover", "smart", "vertical")
+            image_processor._save_display_state("cover", "smart", "vertical", "raw")
             data = json.loads(image_processor.DISPLAY_STATE_FILE.read_text())
             assert data == {'fit_mode': 'cover', 'crop_mode': 'smart',
-                            'orientation': 'vertical'}
+                            'orientation': 'vertical', 'cache_format': 'raw',
+                            'render_version': image_processor.RENDER_VERSION}
         finally:
             image_processor.DISPLAY_STATE_FILE = original
 
@@ -89,7 +90,9 @@ class TestReprocessNeeded:
     display images must be regenerated. crop_mode only matters in cover mode."""
 
     def _call(self, last, fit="contain", crop="center", orient="horizontal"):
-        from image_processor import reprocess_needed
+        from image_processor import RENDER_VERSION, reprocess_needed
+        if last is not None:
+            last = {'render_version': RENDER_VERSION, **last}
         return reprocess_needed(last, fit, crop, orient)
 
     def test_no_state_needs_reprocess(self):
@@ -119,3 +122,10 @@ class TestReprocessNeeded:
         # State files written before this feature lack the orientation key
         last = {'fit_mode': 'contain', 'crop_mode': 'center'}
         assert self._call(last) is False
+
+    def test_older_render_pipeline_needs_reprocess(self):
+        from image_processor import RENDER_VERSION, reprocess_needed
+        last = {'fit_mode': 'cover', 'crop_mode': 'smart', 'orientation': 'horizontal'}
+        assert reprocess_needed(last, "cover", "smart", "horizontal") is True
+        last['render_version'] = RENDER_VERSION - 1
+        assert reprocess_needed(last, "cover", "smart", "horizontal") is True
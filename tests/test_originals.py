@@ -0,0 +1,155 @@
+"""Original-retention policy.
+
+Every upload was kept byte-for-byte in data/originals forever although
+re-renders never need much more than twice the display resolution; a 16 GB
+card filled up and every reprocess decoded 12-50 MP files. With
+originals.retention = "master" a bounded JPEG master is kept instead (the
+full file optionally offloaded), and compact_originals applies the policy to
+an existing library.
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+DATE = "2023:12:24 18:00:00"
+
+
+def _noisy(size):
+    """Incompressible-ish image so size comparisons mean something"""
+    bands = [Image.effect_noise(size, 60) for _ in range(3)]
+    return Image.merge('RGB', bands)
+
+
+def _jpeg(size=(1800, 1200), orientation=1):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[36867] = DATE
+    buf = io.BytesIO()
+    _noisy(size).save(buf, "JPEG", quality=95, exif=exif.tobytes())
+    return buf.getvalue()
+
+
+def _png(size=(1800, 1200)):
+    buf = io.BytesIO()
+    _noisy(size).save(buf, "PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(app_client):
+    return app_client
+
+
+def _upload(client, data, name):
+    resp = client.post('/api/photos/upload', data={'file': (io.BytesIO(data), name)},
+                       content_type='multipart/form-data')
+    assert resp.get_json()['success'], resp.get_json()
+    import models
+    return models.get_photo(resp.get_json()['photo']['id'])
+
+
+def _use_masters(client, **extra):
+    resp = client.post('/api/settings', json={'originals': {'retention': 'master',
+                                                            'max_edge': 1200, **extra}})
+    assert resp.status_code == 200
+
+
+def test_upload_keeps_bounded_master_with_exif(client):
+    _use_masters(client)
+    photo = _upload(client, _jpeg(orientation=6), 'IMG_1.jpg')
+
+    with Image.open(photo['original_path']) as master:
+        assert master.size == (1200, 800)
+        assert master.getexif()[0x0112] == 6
+    assert photo['date_taken'] == DATE
+    assert (photo['width'], photo['height']) == (1200, 1800)  # the upload's, upright
+
+
+def test_png_upload_master_is_jpeg(client):
+    _use_masters(client)
+    photo = _upload(client, _png(), 'scan.png')
+    assert photo['original_path'].endswith('.jpg')
+    assert photo['filename'].endswith('.jpg')
+    assert photo['mime_type'] == 'image/png'
+
+
+def test_full_original_is_offloaded(client, tmp_path):
+    offload = tmp_path / "usb"
+    offload.mkdir()
+    _use_masters(client, offload_dir=str(offload))
+    data = _jpeg()
+    photo = _upload(client, data, 'IMG_2.jpg')
+
+    [copy] = offload.iterdir()
+    assert copy.read_bytes() == data
+    assert copy.name == photo['filename']
+
+
+def test_unavailable_offload_keeps_full_original(client, tmp_path):
+    _use_masters(client, offload_dir=str(tmp_path / "unplugged"))
+    data = _jpeg()
+    photo = _upload(client, data, 'IMG_3.jpg')
+    with open(photo['original_path'], 'rb') as f:
+        assert f.read() == data
+
+
+def test_small_uploads_are_kept_as_is(client):
+    _use_masters(client)
+    data = _jpeg(size=(800, 600))
+    photo = _upload(client, data, 'small.jpg')
+    with open(photo['original_path'], 'rb') as f:
+        assert f.read() == data
+
+
+def test_relative_offload_dir_is_rejected(client):
+    resp = client.post('/api/settings', json={'originals': {'offload_dir': 'usb'}})
+    assert resp.status_code == 400
+
+
+def test_compaction_shrinks_existing_library_and_reports_savings(client):
+    import image_processor
+    import models
+
+    jpeg = _upload(client, _jpeg(), 'a.jpg')
+    png = _upload(client, _png(), 'b.png')
+    small = _upload(client, _jpeg(size=(640, 480)), 'c.jpg')
+
+    report = image_processor.compact_originals({'retention': 'master', 'max_edge': 1200})
+    assert report['compacted'] == 2
+    assert report['saved_bytes'] > 0
+    assert report['saved_bytes'] == report['bytes_before'] - report['bytes_after']
+    assert client.get('/api/originals/compact').get_json()['compacted'] == 2
+
+    png_after = models.get_photo(png['id'])
+    assert png_after['original_path'].endswith('.jpg')
+    assert not (image_processor.ORIGINALS_DIR / png['filename']).exists()
+    assert models.get_photo(jpeg['id'])['original_path'] == jpeg['original_path']
+    assert models.get_photo(small['id'])['original_path'] == small['original_path']
+    for photo_id in (jpeg['id'], png['id']):
+        with Image.open(models.get_photo(photo_id)['original_path']) as img:
+            assert max(img.size) == 1200
+
+    # Masters still feed re-renders
+    assert image_processor.reprocess_display_images(fit_mode="cover") == 3
+
+
+def test_compaction_requested_during_reprocess_runs_after_it(client):
+    import threading
+    import image_processor
+
+    _upload(client, _jpeg(), 'a.jpg')
+    with image_processor._reprocess_lock:  # a reprocess is running
+        worker = threading.Thread(target=image_processor.compact_originals,
+                                  args=({'retention': 'master', 'max_edge': 1200},))
+        worker.start()
+        worker.join(0.2)
+        assert worker.is_alive()
+        assert client.get('/api/originals/compact').get_json() == {'complete': False}
+    worker.join(10)
+    assert client.get('/api/originals/compact').get_json()['compacted'] == 1
+
+
+def test_compact_endpoint_requires_master_policy(client):
+    assert client.post('/api/originals/compact').status_code == 400
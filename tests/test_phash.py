@@ -0,0 +1,107 @@
+"""Perceptual-hash near-duplicate index.
+
+Burst sequences and re-encoded resends filled the shuffle bag with
+near-identical slides. Photos now carry a dHash from their thumbnail,
+indexed in a BK-tree, and the slideshow can show one photo per cluster.
+"""
+
+import random
+
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance
+
+import phash
+
+
+def _scene(seed, size=(300, 200)):
+    rng = random.Random(seed)
+    img = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        r = rng.randrange(10, 60)
+        draw.ellipse((x - r, y - r, x + r, y + r),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return img
+
+
+def test_dhash_stable_under_resize_and_brightness():
+    img = _scene(1)
+    base = int(phash.dhash(img), 16)
+    resized = int(phash.dhash(img.resize((150, 100))), 16)
+    brighter = int(phash.dhash(ImageEnhance.Brightness(img).enhance(1.1)), 16)
+    other = int(phash.dhash(_scene(2)), 16)
+
+    assert phash.hamming(base, resized) <= phash.NEAR_DUPLICATE_DISTANCE
+    assert phash.hamming(base, brighter) <= phash.NEAR_DUPLICATE_DISTANCE
+    assert phash.hamming(base, other) > phash.NEAR_DUPLICATE_DISTANCE
+
+
+def test_bktree_search_matches_linear_scan():
+    rng = random.Random(0)
+    values = [rng.getrandbits(64) for _ in range(2000)]
+    tree = phash.BKTree()
+    for i, v in enumerate(values):
+        tree.add(v, i)
+    assert len(tree) == 2000
+
+    for probe in values[:20]:
+        expected = sorted(i for i, v in enumerate(values) if phash.hamming(probe, v) <= 12)
+        assert sorted(i for _, i in tree.search(probe, 12)) == expected
+
+
+@pytest.fixture
+def library(monkeypatch, tmp_path):
+    import models
+    models.close_db()
+    monkeypatch.setattr(models, "DB_PATH", tmp_path / "photos.db")
+    monkeypatch.setattr(models, "SETTINGS_PATH", tmp_path / "settings.json")
+    monkeypatch.setattr(phash, "_tree", None)
+    models.init_db()
+    yield models
+    models.close_db()
+
+
+def _add(models, name, img):
+    h = phash.dhash(img)
+    pid = models.add_photo(name, f"/o/{name}", f"/d/{name}.png", f"/t/{name}", phash=h)
+    phash.index_photo(pid, f"/d/{name}.png", h)
+    return pid
+
+
+def test_clusters_group_bursts(library):
+    models = library
+    burst = [_add(models, f"burst{i}", ImageEnhance.Brightness(_scene(1)).enhance(1 + i * 0.03))
+             for i in range(3)]
+    solo = _add(models, "solo", _scene(2))
+
+    clusters = phash.get_clusters()
+    assert [[p['id'] for p in c] for c in clusters] == [burst]
+
+    similar = phash.find_similar(models.get_photo_phashes()[0]['phash'])
+    assert solo not in [p['id'] for _, p in similar]
+
+
+def test_one_per_cluster_keeps_a_single_burst_member(library):
+    models = library
+    for i in range(4):
+        _add(models, f"burst{i}", ImageEnhance.Contrast(_scene(5)).enhance(1 + i * 0.02))
+    _add(models, "a", _scene(6))
+    _add(models, "b", _scene(7))
+
+    paths = [p['display_path'] for p in models.get_photo_phashes()]
+    kept = phash.one_per_cluster(paths)
+    assert len(kept) == 3
+    assert "/d/a.png" in kept and "/d/b.png" in kept
+
+
+def test_invalidate_rebuilds_after_delete(library):
+    models = library
+    a = _add(models, "a", _scene(1))
+    b = _add(models, "b", _scene(1))
+    assert len(phash.get_clusters()) == 1
+
+    models.delete_photo(b)
+    phash.invalidate()
+    assert phash.get_clusters() == []
+    assert [p['id'] for _, p in phash.find_similar(phash.dhash(_scene(1)))] == [a]
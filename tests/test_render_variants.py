@@ -0,0 +1,119 @@
+"""Stored render variants, so switching settings back is instant.
+
+DISPLAY_DIR holds one render per photo, so switching orientation from
+horizontal to vertical and back (or cover to contain and back) rendered
+the whole library twice. A reprocess now keeps the render it replaces in a
+size-capped store, content-addressed by photo hash and variant, and swaps
+stored renders back into place instead of rendering them again.
+"""
+
+import hashlib
+
+import pytest
+from PIL import Image
+
+import display_cache
+import renders
+
+
+@pytest.fixture
+def library(data_dirs):
+    import models
+
+    for i, stem in enumerate(("a", "b", "c")):
+        original = data_dirs.ORIGINALS_DIR / f"{stem}.jpg"
+        Image.new('RGB', (800, 500), (60 * i, 120, 150)).save(original, "JPEG")
+        models.add_photo(original.name, str(original),
+                         str(data_dirs.DISPLAY_DIR / f"{stem}.rgb"),
+                         str(data_dirs.THUMBNAILS_DIR / f"{stem}.jpg"),
+                         content_hash=hashlib.sha256(original.read_bytes()).hexdigest())
+    return data_dirs
+
+
+def _record_renders(monkeypatch, library):
+    rendered = []
+    save = display_cache.save
+
+    def recording_save(img, path, fmt):
+        rendered.append(path.stem)
+        save(img, path, fmt)
+
+    monkeypatch.setattr(library.display_cache, "save", recording_save)
+    return rendered
+
+
+def test_switching_back_restores_without_rendering(library, monkeypatch):
+    rendered = _record_renders(monkeypatch, library)
+    display = library.DISPLAY_DIR
+    library.reprocess_display_images("cover", cache_format="raw")
+    cover = (display / "b.rgb").read_bytes()
+    cover_mtime = (display / "b.rgb").stat().st_mtime_ns
+
+    library.reprocess_display_images("contain", cache_format="raw")
+    assert (display / "b.rgb").read_bytes() != cover
+    assert len(rendered) == 6
+
+    assert library.reprocess_display_images("cover", cache_format="raw") == 3
+    assert len(rendered) == 6  # nothing rendered
+    assert library.get_reprocess_status()['restored'] == 3
+    assert (display / "b.rgb").read_bytes() == cover
+    # Same file as before, so the panel can still recognise the photo it shows
+    assert (display / "b.rgb").stat().st_mtime_ns == cover_mtime
+    assert not library.reprocess_needed(library.get_display_state(), "cover", "center", "horizontal")
+
+    # ... and the contain renders are now the stored ones
+    assert library.reprocess_display_images("contain", cache_format="raw") == 3
+    assert len(rendered) == 6
+    assert renders.get_status()['count'] == 3
+
+
+def test_restored_render_follows_format_change(library, monkeypatch):
+    import models
+
+    rendered = _record_renders(monkeypatch, library)
+    library.reprocess_display_images("cover", cache_format="png")
+    library.reprocess_display_images("contain", cache_format="raw")
+    assert len(rendered) == 6
+
+    # A stored render in another format is a miss
+    library.reprocess_display_images("cover", cache_format="raw")
+    assert len(rendered) == 9
+
+    library.reprocess_display_images("cover", cache_format="png")  # png cover renders stored
+    library.reprocess_display_images("contain", cache_format="raw")
+    assert len(rendered) == 9
+    paths = {p['display_path'] for p in models.get_all_photos()}
+    assert all(p.endswith(".rgb") for p in paths)
+    assert not list(library.DISPLAY_DIR.glob("*.png"))
+
+
+def test_store_is_capped_least_recently_stashed_first(library, monkeypatch):
+    library.reprocess_display_images("cover", cache_format="raw")
+    size = (library.DISPLAY_DIR / "a.rgb").stat().st_size
+    monkeypatch.setattr(renders, "CACHE_MAX_BYTES", 4 * size)
+
+    library.reprocess_display_images("contain", cache_format="raw")    # stores 3 cover
+    library.reprocess_display_images("stretch", cache_format="raw")    # stores 3 contain
+    status = renders.get_status()
+    assert status['count'] == 4 and status['bytes'] <= 4 * size
+
+    rendered = _record_renders(monkeypatch, library)
+    library.reprocess_display_images("contain", cache_format="raw")
+    assert rendered == []  # contain variants were the most recent
+
+    # The index survives a restart
+    monkeypatch.setattr(renders, "_cache_dir", None)
+    library.reprocess_display_images("stretch", cache_format="raw")
+    assert rendered == []
+
+
+def test_deleting_a_photo_drops_its_variants(library):
+    import models
+
+    library.reprocess_display_images("cover", cache_format="raw")
+    library.reprocess_display_images("contain", cache_format="raw")
+    photo = next(p for p in models.get_all_photos() if p['filename'] == "a.jpg")
+
+    library.delete_photo_files(photo)
+    assert renders.get_status()['count'] == 2
+    assert not list(library.RENDERS_DIR.glob(photo['content_hash'][:renders.HASH_PREFIX] + "*"))
@@ -0,0 +1,89 @@
+"""Single-decode rendition pipeline.
+
+process_upload used to hold three or four full-resolution buffers at once
+(decode, exif_transpose copy, RGB convert copy, thumbnail copy). It now
+decodes once to a reduced intermediate that just covers the display canvas
+and derives the display render, thumbnail and detector input from it.
+"""
+
+import io
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image, ImageChops, ImageOps, ImageStat
+
+
+def _photo(size=(4000, 3000), fmt="JPEG", orientation=1):
+    img = Image.linear_gradient('L').resize(size).convert('RGB')
+    img.paste((200, 40, 40), (0, 0, size[0] // 4, size[1] // 4))  # marker in the top-left
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buf = io.BytesIO()
+    img.save(buf, fmt, exif=exif)
+    buf.seek(0)
+    return buf
+
+
+@patch('image_processor.get_display_size', return_value=(600, 448))
+class TestOpenRenditionSource:
+
+    def test_intermediate_covers_canvas_but_is_small(self, mock_size):
+        from image_processor import open_rendition_source
+        img, meta = open_rendition_source(_photo((4000, 3000)))
+        assert (meta['width'], meta['height']) == (4000, 3000)
+        assert img.width >= 600 and img.height >= 448
+        assert img.width <= 1300  # JPEG draft + reduce, not full size
+        assert img.mode == 'RGB'
+        assert meta['mime_type'] == 'image/jpeg'
+
+    def test_exif_rotation_applied_at_reduced_size(self, mock_size):
+        from image_processor import open_rendition_source
+        img, meta = open_rendition_source(_photo((4000, 3000), orientation=6))
+        assert (meta['width'], meta['height']) == (3000, 4000)
+        assert img.height > img.width
+        # Orientation 6 rotates the top-left marker to the top-right
+        assert img.getpixel((img.width - 5, 5))[0] > 150
+
+    def test_vertical_canvas_requires_portrait_coverage(self, mock_size):
+        from image_processor import open_rendition_source
+        img, _ = open_rendition_source(_photo((4000, 3000), fmt="PNG"), orientation="vertical")
+        # Portrait canvas is 448x600: height must cover 600
+        assert img.height >= 600 and img.width >= 448
+        assert img.width < 4000  # non-JPEG reduced after decode
+
+    def test_small_images_are_not_upscaled(self, mock_size):
+        from image_processor import open_rendition_source
+        img, _ = open_rendition_source(_photo((320, 240)))
+        assert img.size == (320, 240)
+
+    def test_render_matches_full_resolution_path(self, mock_size):
+        from image_processor import open_rendition_source, resize_for_display
+        data = _photo((4000, 3000), orientation=6).getvalue()
+
+        full = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert('RGB')
+        expected = resize_for_display(full, "cover")
+        reduced, _ = open_rendition_source(io.BytesIO(data))
+        actual = resize_for_display(reduced, "cover")
+
+        assert actual.size == expected.size
+        diff = ImageStat.Stat(ImageChops.difference(actual, expected)).mean
+        assert max(diff) < 4
+
+
+@patch('image_processor.get_display_size', return_value=(600, 448))
+def test_process_upload_reports_full_size_metadata(mock_size, tmp_path, monkeypatch):
+    import display_cache
+    import image_processor
+    from werkzeug.datastructures import FileStorage
+
+    monkeypatch.setattr(image_processor, "ORIGINALS_DIR", tmp_path / "originals")
+    monkeypatch.setattr(image_processor, "DISPLAY_DIR", tmp_path / "display")
+    monkeypatch.setattr(image_processor, "RENDERS_DIR", tmp_path / "renders")
+    monkeypatch.setattr(image_processor, "THUMBNAILS_DIR", tmp_path / "thumbnails")
+
+    result = image_processor.process_upload(
+        FileStorage(_photo((4000, 3000), orientation=8), filename="p.jpg"))
+
+    assert (result['width'], result['height']) == (3000, 4000)
+    assert display_cache.load(result['display_path']).size == (600, 448)
+    assert not Path(result['thumbnail_path']).exists()  # rendered on first request
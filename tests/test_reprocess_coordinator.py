@@ -0,0 +1,149 @@
+"""Debounced, supersedable reprocessing.
+
+Every fit/crop/orientation change spawned its own reprocess thread, and a
+change made while one was running was silently dropped by the non-blocking
+reprocess lock: flipping cover -> contain -> cover could leave photos
+rendered as contain until the next boot. request_reprocess now coalesces
+bursts, cancels a run made obsolete by a newer change, and restarts from the
+latest settings, skipping photos already rendered for them.
+"""
+
+import pytest
+from PIL import Image
+
+import display_cache
+
+
+@pytest.fixture
+def library(data_dirs):
+    for stem in ("a", "b", "c", "d"):
+        Image.new('RGB', (800, 600), (90, 120, 150)).save(
+            data_dirs.ORIGINALS_DIR / f"{stem}.jpg", "JPEG")
+    return data_dirs
+
+
+def _record_renders(monkeypatch, image_processor, hook=None):
+    """Record (stem, fit_mode) of each render, calling hook(stem, fit_mode) first"""
+    rendered = []
+    save = display_cache.save
+
+    def recording_save(img, path, fmt):
+        fit_mode = image_processor.get_reprocess_status()['fit_mode']
+        if hook:
+            hook(path.stem, fit_mode)
+        rendered.append((path.stem, fit_mode))
+        save(img, path, fmt)
+
+    monkeypatch.setattr(image_processor.display_cache, "save", recording_save)
+    return rendered
+
+
+def _settle(image_processor):
+    """Wait for the last requested reprocess to finish"""
+    for _ in range(5):  # a run can request the next one while it runs
+        image_processor._request_timer.join(10)
+    assert not image_processor._request_timer.is_alive()
+
+
+def test_burst_of_changes_renders_only_the_last(library, monkeypatch):
+    rendered = _record_renders(monkeypatch, library)
+
+    for fit in ("contain", "cover", "contain", "cover"):
+        library.request_reprocess(fit, delay=0.2)
+    _settle(library)
+
+    assert rendered == [(s, "cover") for s in "abcd"]
+    assert library.get_display_state()['fit_mode'] == "cover"
+
+
+def test_obsolete_run_is_cancelled_and_restarts_from_latest(library, monkeypatch):
+    assert library.reprocess_display_images("cover") == 4  # library rendered as cover
+
+    def change_back(stem, fit_mode):
+        if (stem, fit_mode) == ("b", "contain"):
+            library.request_reprocess("cover", delay=0.05)
+
+    rendered = _record_renders(monkeypatch, library, hook=change_back)
+    library.request_reprocess("contain", delay=0)
+    _settle(library)
+
+    # The contain run stopped after "b"; only the photos it touched are redone
+    assert rendered == [("a", "contain"), ("b", "contain"), ("a", "cover"), ("b", "cover")]
+    status = library.get_reprocess_status()
+    assert (status['state'], status['fit_mode']) == ("done", "cover")
+    assert (status['processed'], status['skipped']) == (2, 2)
+    state = library.get_display_state()
+    assert state['fit_mode'] == "cover" and 'rendered' not in state
+
+
+def test_format_change_during_run_converts_after_it(library, monkeypatch):
+    import models
+
+    for stem in "abcd":
+        models.add_photo(f"{stem}.jpg", str(library.ORIGINALS_DIR / f"{stem}.jpg"),
+                         str(library.DISPLAY_DIR / f"{stem}.rgb"),
+                         str(library.THUMBNAILS_DIR / f"{stem}.jpg"))
+
+    def change_format(stem, fit_mode):
+        if stem == "b" and len(rendered) == 1:
+            library.request_reprocess("cover", cache_format="png", delay=0.05)
+
+    rendered = _record_renders(monkeypatch, library, hook=change_format)
+    library.request_reprocess("cover", cache_format="raw", delay=0)
+    _settle(library)
+
+    # The run wasn't cancelled, and its renders were converted rather than redone
+    status = library.get_reprocess_status()
+    assert (status['state'], status['processed'], status['cache_format']) == ("done", 4, "raw")
+    assert rendered[:4] == [(s, "cover") for s in "abcd"]
+    assert sorted(rendered[4:]) == rendered[:4]  # re-encoded, not rendered again
+    assert sorted(p.name for p in library.DISPLAY_DIR.iterdir()) == \
+        ["a.png", "b.png", "c.png", "d.png"]
+    assert library.get_display_state()['cache_format'] == "png"
+
+
+def test_interrupted_run_marks_library_stale(library, monkeypatch):
+    library.reprocess_display_images("cover")
+    _record_renders(monkeypatch, library, hook=lambda stem, fit: library.cancel_reprocess())
+
+    library.reprocess_display_images("contain")
+
+    state = library.get_display_state()
+    assert state['fit_mode'] == "cover"
+    assert state['rendered'] == {"a": "contain/-/horizontal"}
+    # Settings match the saved state, but photo "a" doesn't: the startup check must redo it
+    assert library.reprocess_needed(state, "cover", "center", "horizontal")
+    assert library.reprocess_needed(state, "contain", "center", "horizontal")
+
+
+def test_only_stale_rerenders_missing_files(library):
+    library.reprocess_display_images("cover", cache_format="raw")
+    (library.DISPLAY_DIR / "c.rgb").unlink()
+
+    assert library.reprocess_display_images("cover", cache_format="raw", only_stale=True) == 1
+    assert library.reprocess_display_images("cover", cache_format="raw") == 4
+
+
+def test_render_pipeline_upgrade_rerenders_once(library, monkeypatch):
+    library.reprocess_display_images("cover", "smart")
+    monkeypatch.setattr(library, "RENDER_VERSION", library.RENDER_VERSION + 1)  # an upgrade
+    assert library.reprocess_needed(library.get_display_state(), "cover", "smart", "horizontal")
+
+    rendered = _record_renders(monkeypatch, library,
+                               hook=lambda stem, fit: stem == "a" and library.cancel_reprocess())
+    library.reprocess_display_images("cover", "smart", only_stale=True)
+    # Interrupted: the rest of the library is still from the old pipeline
+    state = library.get_display_state()
+    assert state['render_version'] == library.RENDER_VERSION - 1
+    assert library.reprocess_needed(state, "cover", "smart", "horizontal")
+    assert not list(library.RENDERS_DIR.glob("*"))  # old renders aren't kept as current ones
+
+    library.request_reprocess("cover", "smart", delay=0)
+    _settle(library)
+    library.request_reprocess("cover", "smart", delay=0)
+    _settle(library)
+
+    assert rendered == [(s, "cover") for s in "abcd"]
+    state = library.get_display_state()
+    assert state['render_version'] == library.RENDER_VERSION and 'rendered' not in state
+    assert not library.reprocess_needed(state, "cover", "smart", "horizontal")
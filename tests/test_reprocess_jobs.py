@@ -0,0 +1,148 @@
+"""Reprocess job visibility and control.
+
+reprocess_display_images ran in a bare daemon thread: /api/status could not
+say whether a re-render was running or how long it would take, it could not
+be stopped, and the slideshow kept showing stale renders of photos the job
+had not reached yet. The job now reports progress, throughput and ETA, can
+be cancelled between photos, and renders a bumped photo next.
+"""
+
+import threading
+
+import pytest
+from PIL import Image
+
+import display_cache
+
+
+@pytest.fixture
+def library(data_dirs):
+    for stem in ("a", "b", "c", "d"):
+        Image.new('RGB', (800, 600), (90, 120, 150)).save(
+            data_dirs.ORIGINALS_DIR / f"{stem}.jpg", "JPEG")
+    return data_dirs
+
+
+def _record_renders(monkeypatch, image_processor, hook=None):
+    """Record the stems rendered, in order, calling hook(stem) before each save"""
+    rendered = []
+    save = display_cache.save
+
+    def recording_save(img, path, fmt):
+        if hook:
+            hook(path.stem)
+        rendered.append(path.stem)
+        save(img, path, fmt)
+
+    monkeypatch.setattr(image_processor.display_cache, "save", recording_save)
+    return rendered
+
+
+def test_status_reports_progress_of_finished_run(library):
+    assert library.reprocess_display_images("cover") == 4
+
+    status = library.get_reprocess_status()
+    assert status['state'] == 'done'
+    assert (status['processed'], status['total'], status['errors']) == (4, 4, 0)
+    assert status['fit_mode'] == 'cover'
+    assert status['eta_seconds'] is None
+    assert status['elapsed_seconds'] >= 0
+    assert 'started' not in status and 'finished' not in status
+    assert library.DISPLAY_STATE_FILE.exists()
+
+
+def test_errors_are_counted(library):
+    (library.ORIGINALS_DIR / "broken.jpg").write_bytes(b"not a jpeg")
+
+    assert library.reprocess_display_images("cover") == 4
+    status = library.get_reprocess_status()
+    assert (status['processed'], status['total'], status['errors']) == (5, 5, 1)
+
+
+def test_cancel_stops_between_photos_and_leaves_state_stale(library, monkeypatch):
+    assert library.cancel_reprocess() is False  # nothing running
+
+    rendered = _record_renders(monkeypatch, library, hook=lambda stem: library.cancel_reprocess())
+
+    assert library.reprocess_display_images("cover") == 1
+    assert rendered == ["a"]
+    status = library.get_reprocess_status()
+    assert status['state'] == 'cancelled'
+    assert status['processed'] == 1
+    # The startup staleness check must still see the library as stale
+    assert not library.DISPLAY_STATE_FILE.exists()
+    assert library.reprocess_needed(library.get_display_state(), "cover", "center", "horizontal")
+
+
+def test_prioritized_photo_is_rendered_next(library, monkeypatch):
+    def bump(stem):
+        if stem == "a":
+            assert library.prioritize_reprocess(library.DISPLAY_DIR / "d.png")
+            assert not library.prioritize_reprocess(library.DISPLAY_DIR / "a.png")  # in progress
+
+    rendered = _record_renders(monkeypatch, library, hook=bump)
+
+    library.reprocess_display_images("cover")
+    assert rendered == ["a", "d", "b", "c"]
+
+
+def test_wait_for_render_bumps_and_returns_new_path(library, monkeypatch):
+    started, gate, done = threading.Event(), threading.Event(), threading.Event()
+
+    def hold(stem):
+        if stem == "a":
+            started.set()
+            gate.wait(5)
+        elif stem == "b":
+            done.wait(5)  # keep the run going until the waiter has its answer
+
+    rendered = _record_renders(monkeypatch, library, hook=hold)
+    worker = threading.Thread(target=library.reprocess_display_images,
+                              args=("cover",), kwargs={'cache_format': "raw"})
+    worker.start()
+    assert started.wait(5)
+    assert library.get_reprocess_status()['state'] == 'running'
+
+    threading.Timer(0.1, gate.set).start()
+    path = library.wait_for_render(str(library.DISPLAY_DIR / "c.png"), timeout=5)
+    done.set()
+    worker.join(5)
+
+    assert rendered[:2] == ["a", "c"]
+    assert path == str(library.DISPLAY_DIR / "c.rgb")
+    # Not running: the path is returned unchanged, without waiting
+    assert library.wait_for_render("/elsewhere/z.png", timeout=5) == "/elsewhere/z.png"
+
+
+def test_wait_for_render_follows_later_migration(library):
+    import models
+
+    for stem in ("a", "b", "c", "d"):
+        models.add_photo(f"{stem}.jpg", str(library.ORIGINALS_DIR / f"{stem}.jpg"),
+                         str(library.DISPLAY_DIR / f"{stem}.rgb"),
+                         str(library.THUMBNAILS_DIR / f"{stem}.jpg"))
+    library.reprocess_display_images("cover", cache_format="raw")
+    assert library.migrate_display_cache("png") == 4
+    assert not (library.DISPLAY_DIR / "a.rgb").exists()
+
+    # The finished run's renders no longer say where photos are
+    png = str(library.DISPLAY_DIR / "a.png")
+    assert library.wait_for_render(png, timeout=5) == png
+    # A caller holding the path from before the migration is pointed at the new file
+    assert library.wait_for_render(str(library.DISPLAY_DIR / "a.rgb"), timeout=5) == png
+
+
+def test_api_exposes_status_and_cancel(library, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module.scheduler, "start_slideshow", lambda **kw: None)
+    for name in ("is_wifi_connected", "get_wifi_status", "is_ap_mode"):
+        monkeypatch.setattr(app_module.wifi_manager, name, lambda: None)
+    app_module.app.config['TESTING'] = True
+    client = app_module.app.test_client()
+
+    library.reprocess_display_images("cover")
+    assert client.get('/api/status').get_json()['reprocess']['processed'] == 4
+    assert client.get('/api/reprocess').get_json()['state'] == 'done'
+    assert client.post('/api/reprocess/cancel').status_code == 409
+    assert client.post('/api/reprocess/prioritize/999').status_code == 404
@@ -66,10 +66,11 @@ class TestSaveDisplayState:
         original = image_processor.DISPLAY_STATE_FILE
         image_processor.DISPLAY_STATE_FILE = tmp_path / ".display_state.json"
         try:
-            image_processor._save_display_state("cover", "smart", "horizontal")
+            image_processor._save_display_state("cover", "smart", "horizontal", "raw")
             data = json.loads(image_processor.DISPLAY_STATE_FILE.read_text())
             assert data == {'fit_mode': 'cover', 'crop_mode': 'smart',
-                            'orientation': 'horizontal'}
+                            'orientation': 'horizontal', 'cache_format': 'raw',
+                            'render_version': image_processor.RENDER_VERSION}
             assert 'smart_recenter' not in data
         finally:
             image_processor.DISPLAY_STATE_FILE = original
@@ -0,0 +1,94 @@
+"""Spectral-residual saliency as the smart-crop fallback.
+
+Smart crop only looked for faces; a landscape, a pet or a still life (or
+any photo on a frame without OpenCV or the YuNet model) got the plain
+center crop, often cutting off the subject. When no face is found, the
+crop window now follows a spectral-residual saliency map computed at a
+fixed small size on the detection image, and stays centered unless some
+window holds clearly more saliency than the centered one.
+"""
+
+import random
+from unittest.mock import patch
+
+import pytest
+from PIL import Image, ImageDraw
+
+np = pytest.importorskip("numpy")
+
+import image_processor
+import saliency
+from benchmarks import bench_saliency
+
+
+def _subject_scene(w=640, h=360, subject_x=0.8):
+    """Grey-green texture with one red blob at subject_x of the width"""
+    rng = random.Random(3)
+    img = Image.new('RGB', (w, h), (110, 130, 90))
+    draw = ImageDraw.Draw(img)
+    for _ in range(300):
+        x, y = rng.randrange(w), rng.randrange(h)
+        shade = rng.randrange(90, 140)
+        draw.point((x, y), fill=(shade, shade + 15, shade - 20))
+    cx, cy, r = int(w * subject_x), h // 2, h // 8
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=(210, 60, 40))
+    return img, cx
+
+
+def test_off_center_subject_moves_the_window():
+    img, subject_cx = _subject_scene()
+    crop = (int(360 * 448 / 600), 360)
+    center = saliency.find_center(img, crop)
+    assert center is not None
+    assert abs(center[0] - subject_cx) < crop[0] // 2 - 360 // 8
+
+
+def test_flat_or_centered_image_keeps_center_crop():
+    assert saliency.saliency_map(Image.new('RGB', (300, 200), (40, 90, 200))) is None
+    assert saliency.find_center(Image.new('RGB', (300, 200), (40, 90, 200)), (150, 200)) is None
+
+    img, _ = _subject_scene(subject_x=0.5)
+    assert saliency.find_center(img, (269, 360)) is None
+
+
+def test_window_sums_match_brute_force():
+    smap = np.random.default_rng(0).random((9, 13)).astype(np.float32)
+    sums = saliency.window_sums(smap, (5, 4))
+    assert sums.shape == (6, 9)
+    for y in range(6):
+        for x in range(9):
+            assert sums[y, x] == pytest.approx(smap[y:y + 4, x:x + 5].sum(), rel=1e-5)
+
+
+def test_map_size_is_fixed_even_past_time_budget(monkeypatch):
+    img, _ = _subject_scene(2000, 1125)
+    smap = saliency.saliency_map(img)
+    assert max(smap.shape) == saliency.MAP_DIM
+    assert smap.sum() == pytest.approx(1, rel=1e-4)
+
+    # A slow run (say, next to a reprocess) must not change later crops
+    center = saliency.find_center(img, (800, 1125))
+    monkeypatch.setattr(saliency, "TIME_BUDGET", 0)
+    assert [saliency.find_center(img, (800, 1125)) for _ in range(3)] == [center] * 3
+
+
+def test_find_crop_center_falls_back_to_saliency_without_model():
+    img, subject_cx = _subject_scene(1280, 720)
+    with patch('image_processor.YUNET_MODEL') as model:
+        model.exists.return_value = False
+        center = image_processor.find_crop_center(img, (538, 720))
+        # End to end: the vertical render is taken around the subject
+        rendered = image_processor.resize_for_display(img, "cover", "smart", "vertical")
+    assert center is not None
+    assert abs(center[0] - subject_cx) < 538 // 2 - 720 // 8
+
+    assert rendered.size == (600, 448)  # rotated onto the landscape panel
+    red = np.asarray(rendered)[..., 0] > 180
+    assert red.sum() > 0.9 * np.pi * (600 // 8) ** 2
+
+
+def test_benchmark_scenes_are_deterministic():
+    a = bench_saliency.build_scenes(seed=5, quick=True)
+    b = bench_saliency.build_scenes(seed=5, quick=True)
+    assert [(n, box) for n, _, box in a] == [(n, box) for n, _, box in b]
+    assert a[0][1].tobytes() == b[0][1].tobytes()
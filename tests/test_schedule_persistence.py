@@ -0,0 +1,156 @@
+"""Slideshow cadence across restarts, optionally aligned to the clock.
+
+Each start created a fresh IntervalTrigger, so a restart reset the cadence,
+and frames in the same room drifted apart. The next tick is now persisted
+when the cadence is set (in its own file, not on every tick) and restored
+at boot; align_to_clock puts ticks on wall-clock boundaries;
+ticks missed while the frame was off cause one refresh, not a burst.
+"""
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+
+
+@pytest.fixture
+def sched(monkeypatch, tmp_path):
+    import importlib
+    import display
+    import models
+    import scheduler
+
+    monkeypatch.setattr(models, "SETTINGS_PATH", tmp_path / "settings.json")
+    monkeypatch.setattr(display, "PANEL_STATE_FILE", tmp_path / "panel.json")
+    monkeypatch.setattr(scheduler, "SCHEDULE_STATE_FILE", tmp_path / "schedule.json")
+    monkeypatch.setattr(display, "_display", display.MockDisplay())
+
+    photos = []
+    for i in range(3):
+        path = tmp_path / f"p{i}.png"
+        Image.new('RGB', (600, 448), (i * 80, 0, 0)).save(path)
+        photos.append(str(path))
+    monkeypatch.setattr(scheduler.models, "get_display_photos", lambda: photos)
+    shown = []
+    monkeypatch.setattr(scheduler.display, "show_photo", lambda path, sat, **kw: shown.append(path))
+
+    def configure(next_run=None, **slideshow):
+        if next_run:
+            scheduler.SCHEDULE_STATE_FILE.write_text(json.dumps({"next_run": next_run}))
+        models.save_settings({
+            "slideshow": {"order": "sequential", "interval_minutes": 60, "enabled": True,
+                          "current_photo_path": photos[1], **slideshow},
+            "display": {"saturation": 0.5},
+        })
+        scheduler._initialized = False
+
+    configure()
+    scheduler._scheduler = None
+    scheduler._current_path = None
+    scheduler._shuffle_bag = []
+    scheduler._history = []
+    scheduler.configure = configure
+    scheduler.shown = shown
+    scheduler.photos = photos
+
+    yield scheduler
+
+    if scheduler._scheduler is not None:
+        scheduler._scheduler.shutdown(wait=False)
+    importlib.reload(scheduler)
+
+
+def _job(sched):
+    return sched.get_scheduler().get_job("photo_cycle")
+
+
+def _saved(sched):
+    return datetime.fromisoformat(json.loads(sched.SCHEDULE_STATE_FILE.read_text())['next_run'])
+
+
+def _on_panel(sched, path, shown_at=None):
+    import display
+    display._record_panel_state(display._photo_fingerprint(path, 0.5))
+    if shown_at is not None:
+        state = display.get_panel_state()
+        state['shown_at'] = shown_at.timestamp()
+        display.PANEL_STATE_FILE.write_text(json.dumps(state))
+
+
+def test_next_run_is_persisted(sched):
+    sched.start_slideshow()
+    assert _saved(sched) == _job(sched).next_run_time
+
+    sched.stop_slideshow()
+    assert not sched.SCHEDULE_STATE_FILE.exists()
+    import models
+    assert 'next_run' not in models.load_settings()['slideshow']
+
+
+def test_boot_restores_saved_cadence(sched):
+    due = (datetime.now() + timedelta(minutes=17)).astimezone().replace(microsecond=0)
+    sched.configure(next_run=due.isoformat())
+    _on_panel(sched, sched.photos[1])
+
+    sched.start_slideshow(resume=True)
+
+    assert sched.shown == []
+    assert _job(sched).next_run_time == due
+
+
+def test_missed_ticks_collapse_into_one_refresh(sched):
+    overdue = (datetime.now() - timedelta(hours=5)).astimezone()
+    sched.configure(next_run=overdue.isoformat())
+    _on_panel(sched, sched.photos[1], shown_at=overdue - timedelta(minutes=30))
+
+    sched.start_slideshow(resume=True)
+
+    assert sched.shown == [sched.photos[2]]
+    remaining = _job(sched).next_run_time - datetime.now().astimezone()
+    assert timedelta(minutes=59) < remaining <= timedelta(minutes=60)
+
+
+def test_job_coalesces_misfires(sched):
+    sched.start_slideshow()
+    job = _job(sched)
+    assert job.coalesce is True
+    assert job.misfire_grace_time is None
+
+
+@pytest.mark.parametrize("minutes", [15, 60, 180])
+def test_aligned_ticks_fall_on_clock_boundaries(sched, minutes):
+    sched.configure(interval_minutes=minutes, align_to_clock=True)
+    sched.start_slideshow()
+    next_run = _job(sched).next_run_time
+    assert next_run.second == 0
+    assert (next_run.hour * 60 + next_run.minute) % minutes == 0
+    assert next_run - datetime.now().astimezone() <= timedelta(minutes=minutes)
+
+
+def test_manual_change_keeps_aligned_boundary(sched):
+    sched.configure(interval_minutes=15, align_to_clock=True)
+    sched.start_slideshow()
+    before = _job(sched).next_run_time
+    sched.show_next_photo()
+    assert _job(sched).next_run_time == before
+
+
+def test_ticks_write_nothing_and_restart_follows_cadence(sched):
+    import models
+    sched.start_slideshow()
+    cadence = _saved(sched)
+    sched.get_scheduler().modify_job("photo_cycle",
+                                     next_run_time=cadence + timedelta(minutes=60))
+    sched._cycle_photo_job()
+    # settings.json is for the user's settings; a tick doesn't race their saves
+    assert json.loads(models.SETTINGS_PATH.read_text())['slideshow'].get('next_run') is None
+    assert _saved(sched) == cadence
+
+    # After a restart, the photo the second tick showed keeps its slot until the third
+    sched.get_scheduler().shutdown(wait=False)
+    sched._scheduler = None
+    sched._initialized = False
+    _on_panel(sched, sched._current_path, shown_at=cadence + timedelta(minutes=61))
+    sched.start_slideshow(resume=True)
+    assert _job(sched).next_run_time == cadence + timedelta(minutes=120)
@@ -23,6 +23,7 @@ def sched(monkeypatch, tmp_path):
 
     # Isolate settings file so tests don't touch real config.
     monkeypatch.setattr(models, "SETTINGS_PATH", tmp_path / "settings.json")
+    monkeypatch.setattr(scheduler, "SCHEDULE_STATE_FILE", tmp_path / "schedule.json")
 
     # Reset module-level state between tests.
     if scheduler._scheduler is not None:
@@ -0,0 +1,89 @@
+"""Info and message screen cache.
+
+Every Button A press and /api/display/info call rebuilt the info screen
+from scratch: a new QR code, a UDP socket for the IP, freshly rasterized
+text and, since the panel dithering moved in-project, a full quantization
+pass. Screens are now cached by their inputs with the static layers (frame,
+QR code, labels) built once, and an identical request reuses the
+panel-ready image.
+"""
+
+import pytest
+from PIL import ImageChops
+
+import display
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(display, "_screen_cache", display.OrderedDict())
+    monkeypatch.setattr(display, "PANEL_STATE_FILE", tmp_path / "panel.json")
+    monkeypatch.setattr(display, "get_system_ip", lambda: "192.168.1.20")
+    monkeypatch.setattr(display.socket, "gethostname", lambda: "inkframe")
+    display._info_layer.cache_clear()
+    yield
+    display._info_layer.cache_clear()
+
+
+def test_identical_requests_reuse_the_screen(monkeypatch):
+    qrcode = display._load_qrcode()
+    if qrcode is None:
+        pytest.skip("qrcode not installed")
+    made = []
+    make = qrcode.QRCode.make
+    monkeypatch.setattr(qrcode.QRCode, "make", lambda self, **kw: made.append(1) or make(self, **kw))
+
+    first = display.generate_info_screen(3, "HomeNet")
+    assert display.generate_info_screen(3, "HomeNet") is first
+
+    # A changed field redraws only that field on the static layer
+    other = display.generate_info_screen(4, "HomeNet")
+    assert other is not first
+    assert made == [1]
+    left, top, right, bottom = ImageChops.difference(first, other).getbbox()
+    assert 210 <= top and bottom <= 245  # the "Photos:" line
+
+    # Setup mode shows no live fields, so they don't split the cache
+    assert display.generate_info_screen(0, "Unknown", ap_mode=True) is \
+        display.generate_info_screen(7, "HomeNet", ap_mode=True)
+
+
+def test_panel_ready_image_is_cached(monkeypatch):
+    quantized = []
+    quantize = display.dither.quantize
+    monkeypatch.setattr(display.dither, "quantize",
+                        lambda *args: quantized.append(1) or quantize(*args))
+    shown = []
+
+    class Panel(display.MockDisplay):
+        def set_image(self, img, saturation=0.5):
+            shown.append(img)
+
+        def show(self):
+            pass
+
+    monkeypatch.setattr(display, "_display", Panel())
+    monkeypatch.setattr(display, "_dither_algorithm", "ordered")
+    monkeypatch.setattr(display, "show_image_object",
+                        lambda img, saturation=0.5, screen_key=None:
+                        display._show_on_display(img, saturation, screen_key=screen_key))
+
+    for _ in range(2):
+        display.show_info_screen(3, "HomeNet")
+        display.show_message("Rebooting...", "Please wait")
+    assert len(quantized) == 2
+    assert shown[0] is shown[2] and shown[1] is shown[3]
+    assert shown[0].mode == 'P'
+
+    # Another algorithm needs its own quantization
+    monkeypatch.setattr(display, "_dither_algorithm", "diffusion")
+    display.show_info_screen(3, "HomeNet")
+    assert len(quantized) == 3
+
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(display, "SCREEN_CACHE_SIZE", 2)
+    monkeypatch.setattr(display, "show_image_object", lambda img, **kw: True)
+    for n in range(4):
+        display.show_message(f"Message {n}", None)
+    assert [key[3] for key in display._screen_cache] == ["Message 2", "Message 3"]
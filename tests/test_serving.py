@@ -0,0 +1,79 @@
+"""Production serving mode: bounded waitress pool, systemd socket activation,
+cacheable thumbnails.
+
+The Werkzeug dev server spawned an unbounded thread per connection, so
+thumbnail-heavy gallery loads and concurrent uploads saturated the Pi.
+"""
+
+import os
+import socket
+
+import pytest
+
+
+@pytest.fixture
+def app_module():
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+    return app_module
+
+
+def test_serve_uses_bounded_waitress_pool(app_module, monkeypatch):
+    import waitress
+
+    calls = []
+    monkeypatch.setattr(waitress, "serve", lambda app, **kw: calls.append((app, kw)))
+    monkeypatch.delenv("LISTEN_PID", raising=False)
+
+    app_module.serve()
+
+    assert len(calls) == 1
+    served_app, kwargs = calls[0]
+    assert served_app is app_module.app
+    assert kwargs['threads'] == app_module.SERVER_THREADS
+    assert kwargs['connection_limit'] == app_module.SERVER_CONNECTION_LIMIT
+    assert kwargs['port'] == app_module.SERVER_PORT
+    assert 'sockets' not in kwargs
+
+
+def test_serve_uses_systemd_socket_when_activated(app_module, monkeypatch):
+    import waitress
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    monkeypatch.setattr(app_module, "_systemd_socket", lambda: listener)
+    calls = []
+    monkeypatch.setattr(waitress, "serve", lambda app, **kw: calls.append(kw))
+
+    try:
+        app_module.serve()
+    finally:
+        listener.close()
+
+    assert calls[0]['sockets'] == [listener]
+    assert 'port' not in calls[0]
+
+
+def test_systemd_socket_ignored_for_other_pid(app_module, monkeypatch):
+    monkeypatch.setenv("LISTEN_PID", str(os.getpid() + 1))
+    monkeypatch.setenv("LISTEN_FDS", "1")
+    assert app_module._systemd_socket() is None
+
+
+def test_thumbnails_are_cacheable(app_module, app_client, data_dirs):
+    import models
+
+    thumb = data_dirs.THUMBNAILS_DIR / "abc.jpg"
+    thumb.write_bytes(b"\xff\xd8\xff\xd9")
+    models.add_photo("abc.jpg", str(data_dirs.ORIGINALS_DIR / "abc.jpg"),
+                     str(data_dirs.DISPLAY_DIR / "abc.rgb"), str(thumb))
+
+    client = app_client
+    resp = client.get('/thumbnails/abc.jpg')
+    assert resp.status_code == 200
+    assert f"max-age={app_module.THUMBNAIL_MAX_AGE}" in resp.headers['Cache-Control']
+
+    etag = resp.headers['ETag']
+    again = client.get('/thumbnails/abc.jpg', headers={'If-None-Match': etag})
+    assert again.status_code == 304
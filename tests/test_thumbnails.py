@@ -0,0 +1,144 @@
+"""On-demand gallery thumbnails.
+
+process_upload rendered and wrote a thumbnail for every photo, even for
+bulk imports that are rarely browsed, and /thumbnails/<name> 404'd when the
+file was missing. Thumbnails are now a size-capped LRU disk cache filled on
+first request from the original (or the display image).
+"""
+
+import io
+
+import pytest
+from PIL import Image
+
+
+def _jpeg(color, size=(1200, 800), orientation=1):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    img = Image.new('RGB', size, color)
+    img.paste((255, 255, 255), (0, 0, size[0] // 4, size[1] // 4))  # top-left marker
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", exif=exif.tobytes())
+    return buf.getvalue()
+
+
+@pytest.fixture
+def client(app_client, monkeypatch):
+    import thumbnails
+
+    monkeypatch.setattr(thumbnails, "_cache_dir", None)
+    return app_client
+
+
+def _upload(client, data, name="a.jpg"):
+    resp = client.post('/api/photos/upload', data={'file': (io.BytesIO(data), name)},
+                       content_type='multipart/form-data')
+    return resp.get_json()['photo']
+
+
+def test_thumbnail_rendered_on_first_request(client):
+    import image_processor
+    photo = _upload(client, _jpeg((0, 0, 200), orientation=6))
+    name = photo['thumbnail_url'].rsplit('/', 1)[-1]
+    assert not (image_processor.THUMBNAILS_DIR / name).exists()
+
+    resp = client.get(photo['thumbnail_url'])
+    assert resp.status_code == 200
+    thumb = Image.open(io.BytesIO(resp.data))
+    assert thumb.size == (133, 200)  # upright portrait, within 300x200
+    assert thumb.getpixel((120, 10))[0] > 200  # marker rotated to the top-right
+    assert (image_processor.THUMBNAILS_DIR / name).exists()
+
+
+def test_unknown_thumbnail_is_404(client):
+    assert client.get('/thumbnails/nope.jpg').status_code == 404
+
+
+def test_stray_files_are_not_served_or_indexed(client):
+    import image_processor
+    import thumbnails
+
+    _upload(client, _jpeg((0, 0, 200)))
+    stray = image_processor.THUMBNAILS_DIR / "left.jpg"
+    stray.write_bytes(b"not a thumbnail of any photo")
+    (image_processor.THUMBNAILS_DIR / "b.jpg.tmp").write_bytes(b"half written")
+    for name in ("left.jpg", "b.jpg.tmp", ".spec", "..", "."):
+        assert image_processor.get_thumbnail(name) is None
+        assert client.get(f'/thumbnails/{name}').status_code == 404
+    assert thumbnails.get(image_processor.THUMBNAILS_DIR, "..", lambda: None) is None
+    assert "left.jpg" not in thumbnails._entries
+
+    # Misses don't leave a render lock behind
+    thumbnails.get(image_processor.THUMBNAILS_DIR, "nope.jpg", lambda: None)
+    assert thumbnails._render_locks == {}
+
+
+def test_falls_back_to_display_image(client):
+    import models
+    from pathlib import Path
+    photo = _upload(client, _jpeg((0, 200, 0)))
+    Path(models.get_photo(photo['id'])['original_path']).unlink()
+    resp = client.get(photo['thumbnail_url'])
+    assert resp.status_code == 200
+    assert Image.open(io.BytesIO(resp.data)).size == (268, 200)  # from the 600x448 render
+
+
+def test_least_recently_used_thumbnails_are_evicted(client, monkeypatch):
+    import image_processor
+    import thumbnails
+    photos = [_upload(client, _jpeg((i * 60, 0, 0)), f"{i}.jpg") for i in range(3)]
+    client.get(photos[0]['thumbnail_url'])
+    one = (image_processor.THUMBNAILS_DIR / photos[0]['thumbnail_url'].rsplit('/', 1)[-1]).stat().st_size
+    monkeypatch.setattr(thumbnails, "CACHE_MAX_BYTES", int(one * 2.5))
+
+    client.get(photos[1]['thumbnail_url'])
+    client.get(photos[0]['thumbnail_url'])  # 0 is now more recent than 1
+    client.get(photos[2]['thumbnail_url'])
+
+    cached = {p.name for p in image_processor.THUMBNAILS_DIR.glob("*.jpg")}
+    names = [p['thumbnail_url'].rsplit('/', 1)[-1] for p in photos]
+    assert cached == {names[0], names[2]}
+    # Evicted thumbnails come back on demand
+    assert client.get(photos[1]['thumbnail_url']).status_code == 200
+
+
+def test_spec_change_drops_cached_thumbnails(client, monkeypatch):
+    import image_processor
+    import thumbnails
+    photo = _upload(client, _jpeg((9, 9, 9)))
+    client.get(photo['thumbnail_url'])
+
+    monkeypatch.setattr(thumbnails, "SIZE", (150, 100))
+    monkeypatch.setattr(thumbnails, "SPEC", "150x100-q85")
+    monkeypatch.setattr(thumbnails, "_cache_dir", None)  # as after a restart
+    resp = client.get(photo['thumbnail_url'])
+    assert Image.open(io.BytesIO(resp.data)).size == (150, 100)
+    assert (image_processor.THUMBNAILS_DIR / thumbnails.SPEC_FILE).read_text() == "150x100-q85"
+
+
+def test_deleting_photo_removes_cached_thumbnail(client):
+    import image_processor
+    import thumbnails
+    photo = _upload(client, _jpeg((1, 2, 3)))
+    client.get(photo['thumbnail_url'])
+    client.delete(f"/api/photos/{photo['id']}")
+    assert list(image_processor.THUMBNAILS_DIR.glob("*.jpg")) == []
+    assert thumbnails.get_status()['count'] == 0
+
+
+def test_busy_frame_turns_thumbnail_away(client, monkeypatch):
+    import admission
+    import image_processor
+    photo = _upload(client, _jpeg((0, 90, 0)))
+    monkeypatch.setattr(image_processor, "THUMBNAIL_WAIT", 0.05)
+
+    # A reprocess or large upload holds the whole budget: don't tie up a server thread
+    assert admission.acquire(admission.BUDGET_BYTES)
+    try:
+        resp = client.get(photo['thumbnail_url'])
+    finally:
+        admission.release(admission.BUDGET_BYTES)
+    assert resp.status_code == 503
+    assert resp.headers['Retry-After'] == str(admission.RETRY_AFTER)
+
+    assert client.get(photo['thumbnail_url']).status_code == 200
@@ -0,0 +1,111 @@
+"""Tone mapping of display renders through a cached 3D LUT.
+
+The only colour control was the panel saturation passed at display time;
+tuning photos for the e-ink gamut would have meant a chain of full-image
+passes per render. Contrast, midtones and colour boost are now baked into
+one 33^3 LUT, applied in a single trilinear pass when display images are
+rendered, cached on disk by its parameters, and part of the render key so
+changing them re-renders the library.
+"""
+
+import pytest
+from PIL import Image
+
+np = pytest.importorskip("numpy")
+
+import tonemap
+
+PUNCHY = {'contrast': 1.4, 'gamma': 1.2, 'color_boost': 1.5}
+
+
+@pytest.fixture(autouse=True)
+def lut_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(tonemap, "CACHE_DIR", tmp_path / "luts")
+    monkeypatch.setattr(tonemap, "_current", (None, None))
+    return tmp_path / "luts"
+
+
+@pytest.fixture
+def library(data_dirs):
+    Image.new('RGB', (800, 400), (90, 120, 150)).save(data_dirs.ORIGINALS_DIR / "a.jpg")
+    return data_dirs
+
+
+def test_settings_parsing_and_identity():
+    assert tonemap.from_settings({}) is None
+    assert tonemap.from_settings({'contrast': 1.0, 'saturation': 0.3}) is None
+    assert tonemap.from_settings({'contrast': 9, 'gamma': "0.8"}) == \
+        {'contrast': 2.0, 'gamma': 0.8, 'color_boost': 1.0}
+    assert tonemap.key(PUNCHY) == "c1.4-g1.2-b1.5"
+
+    identity = tonemap.build_table({'contrast': 1.0, 'gamma': 1.0, 'color_boost': 1.0}, size=5)
+    steps = np.linspace(0, 1, 5)
+    assert np.allclose(identity[:5, 0], steps)      # red varies fastest
+    assert np.allclose(identity[::25, 2], steps)    # blue slowest
+
+
+def test_lut_matches_direct_transform():
+    rgb = np.random.default_rng(1).integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    mapped = np.asarray(tonemap.apply(Image.fromarray(rgb), PUNCHY), dtype=np.float32)
+
+    x = rgb.reshape(-1, 3) / 255.0
+    luma = x @ [0.299, 0.587, 0.114]
+    x = luma[:, None] + (x - luma[:, None]) * 1.5
+    x = np.clip((x - 0.5) * 1.4 + 0.5, 0, 1) ** (1 / 1.2)
+    assert np.abs(mapped.reshape(-1, 3) - x * 255).mean() < 1
+
+
+def test_table_is_built_once_per_parameters(monkeypatch, lut_cache):
+    builds = []
+    build = tonemap.build_table
+    monkeypatch.setattr(tonemap, "build_table", lambda tone: builds.append(1) or build(tone))
+
+    first = tonemap.get_filter(PUNCHY)
+    assert tonemap.get_filter(dict(PUNCHY)) is first
+    assert [p.name for p in lut_cache.iterdir()] == ["33-c1.4-g1.2-b1.5.npy"]
+
+    # A restart loads the cached table instead of rebuilding it
+    monkeypatch.setattr(tonemap, "_current", (None, None))
+    tonemap.get_filter(PUNCHY)
+    assert builds == [1]
+
+    tonemap.get_filter({**PUNCHY, 'gamma': 1.0})
+    assert builds == [1, 1]
+    assert tonemap.get_filter(None) is None
+
+
+def test_render_applies_tone_but_keeps_bars_black(library):
+    img = Image.new('RGB', (800, 400), (90, 120, 150))
+    plain = library.resize_for_display(img, "contain")
+    toned = library.resize_for_display(img, "contain", tone=PUNCHY)
+
+    assert toned.getpixel((0, 0)) == plain.getpixel((0, 0)) == (0, 0, 0)
+    assert toned.getpixel((300, 224)) != plain.getpixel((300, 224))
+
+
+def test_tone_change_rerenders_library(library):
+    library.reprocess_display_images("contain")
+    state = library.get_display_state()
+    assert not library.reprocess_needed(state, "contain", "center", "horizontal")
+    assert library.reprocess_needed(state, "contain", "center", "horizontal", PUNCHY)
+
+    library.reprocess_display_images("contain", tone=PUNCHY)
+    state = library.get_display_state()
+    assert state['contrast'] == 1.4
+    assert not library.reprocess_needed(state, "contain", "center", "horizontal", PUNCHY)
+    assert library.reprocess_needed(state, "contain", "center", "horizontal")
+    # Already up to date: nothing to redo
+    assert library.reprocess_display_images("contain", tone=PUNCHY, only_stale=True) == 0
+
+
+def test_settings_clamp_and_request_rerender(library, monkeypatch):
+    import app as app_module
+
+    requests = []
+    monkeypatch.setattr(app_module.image_processor, "request_reprocess",
+                        lambda *args, **kwargs: requests.append(kwargs['tone']))
+    client = app_module.app.test_client()
+
+    resp = client.post('/api/settings', json={'display': {'contrast': 5, 'color_boost': 1.3}})
+    assert resp.get_json()['settings']['display']['contrast'] == 2.0
+    assert requests == [{'contrast': 2.0, 'gamma': 1.0, 'color_boost': 1.3}]
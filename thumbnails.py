@@ -0,0 +1,173 @@
+"""Gallery thumbnails as a size-capped disk cache.
+
+Thumbnails are derived data: they are rendered on first request (from the
+original or the display image, whichever the caller supplies) rather than
+at upload time, kept on disk, and evicted least-recently-used once the
+cache exceeds CACHE_MAX_BYTES. An evicted thumbnail is simply rendered
+again the next time it is asked for.
+
+The cache directory carries a spec marker (size and JPEG quality). When the
+spec changes, every cached thumbnail is dropped on first use so they are all
+re-rendered to the new spec.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image
+
+SIZE = (300, 200)
+QUALITY = 85
+SPEC = f"{SIZE[0]}x{SIZE[1]}-q{QUALITY}"
+SPEC_FILE = ".spec"
+CACHE_MAX_BYTES = int(os.environ.get('INKFRAME_THUMBNAIL_CACHE_MB', 64)) * 1024 * 1024
+TOUCH_INTERVAL = 24 * 3600  # persist recency (mtime) at most this often per file
+
+_lock = threading.Lock()
+_render_locks = {}        # name -> Lock; one render per thumbnail at a time
+_entries = OrderedDict()  # name -> bytes, least recently used first
+_total = 0
+_cache_dir = None         # directory _entries describes
+
+
+def _load(cache_dir):
+    """Check the spec marker and index the directory. Caller holds _lock."""
+    global _total, _cache_dir
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    spec_path = cache_dir / SPEC_FILE
+    try:
+        current = spec_path.read_text().strip()
+    except OSError:
+        current = SPEC  # thumbnails written at upload time before this cache used the same spec
+        spec_path.write_text(SPEC)
+    files = list(cache_dir.glob("*.jpg"))
+    if current != SPEC:
+        for path in files:
+            path.unlink(missing_ok=True)
+        files = []
+        spec_path.write_text(SPEC)
+
+    stats = []
+    for path in files:
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        stats.append((st.st_mtime, path.name, st.st_size))
+    _entries.clear()
+    for _, name, size in sorted(stats):
+        _entries[name] = size
+    _total = sum(_entries.values())
+    _cache_dir = cache_dir
+
+
+def _ensure_loaded(cache_dir):
+    if _cache_dir != cache_dir:
+        _load(cache_dir)
+
+
+def _evict(cache_dir, keep):
+    """Drop least recently used thumbnails until under the cap. Caller holds _lock."""
+    global _total
+    while _total > CACHE_MAX_BYTES and len(_entries) > 1:
+        name, size = next(iter(_entries.items()))
+        if name == keep:
+            _entries.move_to_end(name)
+            continue
+        del _entries[name]
+        _total -= size
+        (cache_dir / name).unlink(missing_ok=True)
+
+
+def _touch(path):
+    try:
+        if time.time() - path.stat().st_mtime > TOUCH_INTERVAL:
+            os.utime(path)
+    except OSError:
+        pass
+
+
+def valid_name(name):
+    """Whether name can be a cached thumbnail: a plain "<stem>.jpg" file name"""
+    return name.endswith(".jpg") and not name.startswith(".") and Path(name).name == name
+
+
+def render(img):
+    """Thumbnail of an upright RGB image (a copy; img is left untouched)"""
+    thumb = img.copy()
+    thumb.thumbnail(SIZE, Image.LANCZOS)
+    return thumb
+
+
+def get(cache_dir, name, open_source):
+    """
+    Path of the cached thumbnail `name`, rendering it if it isn't cached.
+
+    Args:
+        cache_dir: cache directory
+        name: thumbnail file name ("<stem>.jpg", see valid_name); the caller
+              checks it belongs to a photo
+        open_source: callable returning an upright RGB PIL Image to render
+                     from, or None if there is nothing to render
+
+    Returns:
+        Path, or None if missing and open_source had nothing
+    """
+    global _total
+    if not valid_name(name):
+        return None
+    cache_dir = Path(cache_dir)
+    path = cache_dir / name
+    with _lock:
+        _ensure_loaded(cache_dir)
+        render_lock = _render_locks.setdefault(name, threading.Lock())
+
+    try:
+        with render_lock:
+            with _lock:
+                if path.is_file():
+                    if name in _entries:
+                        _entries.move_to_end(name)
+                    else:
+                        _entries[name] = path.stat().st_size
+                        _total += _entries[name]
+                    _touch(path)
+                    return path
+
+            img = open_source()
+            if img is None:
+                return None
+            thumb = render(img)
+            del img
+            tmp = path.with_name(path.name + ".tmp")
+            thumb.save(str(tmp), "JPEG", quality=QUALITY)
+            os.replace(tmp, path)
+
+            with _lock:
+                _total -= _entries.pop(name, 0)
+                _entries[name] = path.stat().st_size
+                _total += _entries[name]
+                _evict(cache_dir, keep=name)
+                return path
+    finally:
+        with _lock:
+            _render_locks.pop(name, None)
+
+
+def discard(cache_dir, name):
+    """Remove a thumbnail (its photo was deleted)"""
+    global _total
+    cache_dir = Path(cache_dir)
+    with _lock:
+        if _cache_dir == cache_dir:
+            _total -= _entries.pop(name, 0)
+    (cache_dir / name).unlink(missing_ok=True)
+
+
+def get_status():
+    """Cache usage for /api/status"""
+    with _lock:
+        return {'count': len(_entries), 'bytes': _total, 'max_bytes': CACHE_MAX_BYTES}
@@ -0,0 +1,117 @@
+"""Tone and gamut mapping of display renders through a 3D colour LUT.
+
+E-ink shows a narrow, dull gamut, so photos usually look better with a
+little extra contrast, lifted midtones and a colour boost. Rather than
+chaining a full-image pass per adjustment, the adjustments are baked into
+one LUT_SIZE^3 lookup table, applied in a single pass with trilinear
+interpolation (Pillow's Color3DLUT, in C).
+
+Tables are built with NumPy and cached in memory and on disk under
+CACHE_DIR, keyed by their parameters, so one is only rebuilt when the
+settings change. The default (identity) parameters skip the pass entirely.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+from PIL import ImageFilter
+
+CACHE_DIR = Path(__file__).parent / "data" / "luts"
+LUT_SIZE = 33
+
+# Display settings keys: (identity value, min, max)
+PARAMS = {
+    'contrast': (1.0, 0.5, 2.0),     # stretch around mid grey
+    'gamma': (1.0, 0.5, 2.0),        # above 1 lifts the midtones
+    'color_boost': (1.0, 0.0, 2.0),  # chroma scale; 0 is greyscale
+}
+
+_lock = threading.Lock()
+_current = (None, None)  # (key, Color3DLUT) of the last table used
+
+
+def clamp(name, value):
+    """A parameter value limited to its range"""
+    _, low, high = PARAMS[name]
+    return round(max(low, min(high, float(value))), 2)
+
+
+def from_settings(settings):
+    """
+    The tone parameters of a display settings (or display state) dict.
+
+    Returns:
+        dict of every parameter, or None when they are all identity (no pass)
+    """
+    settings = settings or {}
+    tone = {name: clamp(name, settings.get(name, PARAMS[name][0])) for name in PARAMS}
+    if all(tone[name] == PARAMS[name][0] for name in PARAMS):
+        return None
+    return tone
+
+
+def key(tone):
+    """Short stable string for a parameter dict, e.g. "c1.2-g1.1-b1.3" """
+    return "c{contrast:g}-g{gamma:g}-b{color_boost:g}".format(**tone)
+
+
+def build_table(tone, size=LUT_SIZE):
+    """
+    The (size^3, 3) float32 table in Color3DLUT order (red varies fastest),
+    values in 0-1.
+    """
+    import numpy as np
+
+    steps = np.linspace(0.0, 1.0, size, dtype=np.float32)
+    b, g, r = np.meshgrid(steps, steps, steps, indexing='ij')
+    rgb = np.stack([r, g, b], -1).reshape(-1, 3)
+
+    luma = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    rgb = luma[:, None] + (rgb - luma[:, None]) * tone['color_boost']
+    rgb = (rgb - 0.5) * tone['contrast'] + 0.5
+    np.clip(rgb, 0.0, 1.0, out=rgb)
+    rgb **= 1.0 / tone['gamma']
+    return rgb.astype(np.float32)
+
+
+def _load_table(tone):
+    """Table for tone from the disk cache, building and saving it on a miss"""
+    import numpy as np
+
+    path = CACHE_DIR / f"{LUT_SIZE}-{key(tone)}.npy"
+    try:
+        table = np.load(path)
+        if table.shape == (LUT_SIZE ** 3, 3):
+            return table
+    except (OSError, ValueError):
+        pass
+    table = build_table(tone)
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, 'wb') as f:
+            np.save(f, table)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Could not cache tone LUT: {e}")
+    return table
+
+
+def get_filter(tone):
+    """The Color3DLUT filter for parameters from from_settings(), or None for identity"""
+    global _current
+    if tone is None:
+        return None
+    k = key(tone)
+    with _lock:
+        if _current[0] != k:
+            table = _load_table(tone)
+            _current = (k, ImageFilter.Color3DLUT(LUT_SIZE, table))
+        return _current[1]
+
+
+def apply(img, tone):
+    """img tone-mapped for parameters from from_settings() (unchanged for None)"""
+    lut = get_filter(tone)
+    return img.filter(lut) if lut is not None else img
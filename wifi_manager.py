@@ -4,6 +4,9 @@ import subprocess
 import time
 import os
 import tempfile
+from pathlib import Path
+
+import metrics
 
 AP_SSID = "inkframe-setup"
 AP_PASSWORD = "photoframe"
@@ -12,12 +15,13 @@ AP_PASSWORD = "photoframe"
 def run_cmd(cmd, check=True):
     """Run a command (as arg list) and return output"""
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=check
-        )
+        with metrics.timer("inkframe_command_seconds", command=Path(str(cmd[0])).name):
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                check=check
+            )
         if result.returncode != 0:
             cmd_str = ' '.join(str(c) for c in cmd)
             print(f"Command exited {result.returncode}: {cmd_str}")